@@ -0,0 +1,314 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+from rate_limiter import BATCH_PRIORITY
+
+# Resumable batch runner for chat/generate requests.
+# Reads a JSONL file one line at a time, sends the requests with bounded concurrency through the same
+# cached, rate-limited wrappers the scripts use, and appends one result line per request to the output
+# JSONL as soon as it finishes (so results are in completion order; "line" gives the input line).
+#
+# Input lines look like
+#   {"id": "q1", "provider": "gemini", "model": "gemini-1.5-flash", "prompt": "..."}
+#   {"provider": "azure-inference", "model": "Phi-3.5-MoE-instruct",
+#    "messages": [{"role": "system", "content": "..."}, {"role": "user", "content": "..."}],
+#    "params": {"temperature": 0.2, "max_tokens": 500}}
+# provider is one of azure-inference (GitHub Models), gemini or openai (xAI); provider and model fall back
+# to --provider/--model. Requests that fail are written with an "error" and are not retried on a plain
+# resume; --retry-failed sends every line without a successful result again (the output then holds both
+# results for such a line, and the later one counts).
+#
+# Progress is checkpointed next to the output (<output>.checkpoint): all input lines before "line" are
+# finished, input resumes at byte "offset", and "done" lists the finished lines after it. Results written
+# after the last checkpoint are recovered from the output itself, so a crash or Ctrl-C never redoes a
+# finished line and never writes one twice. On Ctrl-C the requests already sent are allowed to finish and
+# their results are written before the checkpoint; a second Ctrl-C abandons them.
+#
+# Example:
+#   python batch_runner.py questions.jsonl -o answers.jsonl --concurrency 8
+load_dotenv()
+
+DEFAULT_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+# Seconds between checkpoints
+CHECKPOINT_INTERVAL = 2.0
+
+
+# Function to turn OpenAI-style messages into Gemini contents and a system instruction
+def gemini_contents(messages):
+    system = [message["content"] for message in messages if message.get("role") == "system"]
+    contents = [
+        {"role": "model" if message.get("role") == "assistant" else "user", "parts": [message["content"]]}
+        for message in messages
+        if message.get("role") != "system"
+    ]
+    return contents, "\n".join(system) or None
+
+
+# Function to send one request and return the fields of its result line
+def run_request(request, provider, model_name):
+    from response_cache import cached_chat_create, cached_complete, cached_generate_content
+    from tracing import token_usage
+
+    messages = request.get("messages") or [{"role": "user", "content": request["prompt"]}]
+    params = request.get("params") or {}
+    priority = request.get("priority", BATCH_PRIORITY)
+
+    if provider == "azure-inference":
+        from clients import GITHUB_MODELS_ENDPOINT, get_chat_client
+
+        client = get_chat_client(GITHUB_MODELS_ENDPOINT, model=model_name)
+        response = cached_complete(client, priority=priority, model=model_name, messages=messages, **params)
+        text = response.choices[0].message.content
+    elif provider == "openai":
+        from clients import XAI_BASE_URL, get_openai_client
+
+        client = get_openai_client(XAI_BASE_URL)
+        response = cached_chat_create(client, priority=priority, model=model_name, messages=messages, **params)
+        text = response.choices[0].message.content
+    elif provider == "gemini":
+        from clients import get_gemini_model
+
+        contents, system_instruction = gemini_contents(messages)
+        options = {"system_instruction": system_instruction} if system_instruction else {}
+        model = get_gemini_model(model_name, **options)
+        response = cached_generate_content(model, contents, priority=priority, generation_config=params or None)
+        text = response.text
+    else:
+        raise ValueError(f"Unknown provider: {provider!r}")
+    return {"response": text, "usage": token_usage(response)}
+
+
+# Function to run one input line; never raises, failures become the "error" of the result
+def run_line(line_number, text, default_provider, default_model):
+    result = {"line": line_number}
+    started = time.perf_counter()
+    try:
+        request = json.loads(text)
+        if not isinstance(request, dict):
+            raise ValueError("each line must be a JSON object")
+        result["id"] = request.get("id")
+        provider = request.get("provider") or default_provider
+        model_name = request.get("model") or default_model
+        if not provider or not model_name:
+            raise ValueError("provider and model are required (in the line or with --provider/--model)")
+        if not request.get("messages") and not request.get("prompt"):
+            raise ValueError("the request needs messages or a prompt")
+        result.update(provider=provider, model=model_name)
+        result.update(run_request(request, provider, model_name))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["latency"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+# Function to read the input lazily: yields (line number, text, offset just past the line) from start_offset on
+def read_lines(path, start_line, start_offset):
+    with open(path, "rb") as f:
+        f.seek(start_offset)
+        line_number = start_line
+        offset = start_offset
+        for raw in f:
+            offset += len(raw)
+            yield line_number, raw.decode("utf-8").strip(), offset
+            line_number += 1
+
+
+class Progress:
+    def __init__(self, output_path, input_path):
+        self.output_path = output_path
+        self.input_path = input_path
+        self.checkpoint_path = f"{output_path}.checkpoint"
+        self.line = 0
+        self.offset = 0
+        self.done = set()
+        # Input offset just past each line that was read but is not yet below the checkpointed line
+        self._ends = {}
+        self._last_saved = 0.0
+
+    # Function to pick up where an earlier run stopped.
+    # With retry_failed the input is read again from the start and only lines with a successful result are done.
+    def load(self, retry_failed=False):
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        if state is not None and os.path.abspath(state.get("input", "")) != os.path.abspath(self.input_path):
+            raise SystemExit(f"{self.checkpoint_path} belongs to {state.get('input')}; use --restart to start over")
+        output_size = self._repair_output()
+        if retry_failed:
+            with open(self.output_path, "rb") as f:
+                self.done = {result["line"] for result in map(json.loads, f) if "error" not in result}
+            return
+        if state is not None and state["output_size"] <= output_size:
+            self.line = state["line"]
+            self.offset = state["offset"]
+            self.done = set(state["done"])
+            scan_from = state["output_size"]
+        else:
+            scan_from = 0
+        # Results written after the checkpoint was saved
+        with open(self.output_path, "rb") as f:
+            f.seek(scan_from)
+            for raw in f:
+                line_number = json.loads(raw)["line"]
+                if line_number >= self.line:
+                    self.done.add(line_number)
+
+    # Function to drop a half-written last line left by a crash; returns the output size
+    def _repair_output(self):
+        with open(self.output_path, "a+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return 0
+            position = size
+            while position > 0:
+                step = min(4096, position)
+                f.seek(position - step)
+                chunk = f.read(step)
+                newline = chunk.rfind(b"\n")
+                if newline != -1:
+                    position = position - step + newline + 1
+                    break
+                position -= step
+            if position != size:
+                f.truncate(position)
+            return position
+
+    def read(self, line_number, end_offset):
+        self._ends[line_number] = end_offset
+
+    def finish(self, line_number):
+        self.done.add(line_number)
+        while self.line in self.done and self.line in self._ends:
+            self.done.discard(self.line)
+            self.offset = self._ends.pop(self.line)
+            self.line += 1
+
+    def save(self, output, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_saved < CHECKPOINT_INTERVAL:
+            return
+        self._last_saved = now
+        # The results must be on disk before a checkpoint that counts them
+        output.flush()
+        os.fsync(output.fileno())
+        state = {
+            "input": os.path.abspath(self.input_path),
+            "line": self.line,
+            "offset": self.offset,
+            "done": sorted(self.done),
+            "output_size": output.tell(),
+        }
+        temp_path = f"{self.checkpoint_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.checkpoint_path)
+
+
+# Function to run every unfinished line of input_path; returns (written, failed)
+def run_batch(input_path, output_path, concurrency=DEFAULT_CONCURRENCY, provider=None, model=None, limit=None,
+              retry_failed=False):
+    progress = Progress(output_path, input_path)
+    progress.load(retry_failed)
+    written = failed = 0
+    started = time.monotonic()
+
+    def record(output, result):
+        nonlocal written, failed
+        output.write((json.dumps(result, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+        written += 1
+        failed += "error" in result
+        progress.finish(result["line"])
+
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    pending = {}
+    with open(output_path, "ab") as output:
+        try:
+            submitted = 0
+            for line_number, text, end_offset in read_lines(input_path, progress.line, progress.offset):
+                progress.read(line_number, end_offset)
+                if line_number in progress.done or not text:
+                    progress.finish(line_number)
+                    continue
+                if limit is not None and submitted >= limit:
+                    break
+                # Bounded concurrency: never more than `concurrency` requests (and read-ahead lines) in flight
+                while len(pending) >= concurrency:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        pending.pop(future)
+                        record(output, future.result())
+                    progress.save(output)
+                pending[executor.submit(run_line, line_number, text, provider, model)] = line_number
+                submitted += 1
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    pending.pop(future)
+                    record(output, future.result())
+                progress.save(output)
+        except KeyboardInterrupt:
+            print("\nInterrupted; finishing the requests in flight (Ctrl-C again to abandon them)", file=sys.stderr)
+            for future in list(pending):
+                if future.cancel():
+                    pending.pop(future)
+            try:
+                while pending:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        pending.pop(future)
+                        record(output, future.result())
+            except KeyboardInterrupt:
+                pass
+            print("Saving progress (rerun the same command to resume)", file=sys.stderr)
+            raise
+        finally:
+            progress.save(output, force=True)
+            executor.shutdown(wait=False, cancel_futures=True)
+            elapsed = time.monotonic() - started
+            print(f"{written} results written ({failed} failed) in {elapsed:.1f}s; {len(pending)} abandoned",
+                  file=sys.stderr)
+    return written, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of chat/generate requests, resumably.")
+    parser.add_argument("input", help="JSONL file of requests")
+    parser.add_argument("-o", "--output", help="JSONL file for the results (default <input>.results.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--provider", choices=("azure-inference", "gemini", "openai"), help="default provider")
+    parser.add_argument("--model", help="default model")
+    parser.add_argument("--limit", type=int, help="send at most this many requests in this run")
+    parser.add_argument("--restart", action="store_true", help="discard earlier results and the checkpoint")
+    parser.add_argument("--retry-failed", action="store_true", help="send the lines that failed in earlier runs again")
+    args = parser.parse_args()
+
+    output_path = args.output or f"{os.path.splitext(args.input)[0]}.results.jsonl"
+    if args.restart:
+        for path in (output_path, f"{output_path}.checkpoint"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # Gemini requests need genai configured; the other providers read their keys when the client is built
+    if os.environ.get("API_KEY"):
+        from clients import configure_gemini
+
+        configure_gemini()
+
+    try:
+        _, failed = run_batch(args.input, output_path, args.concurrency, args.provider, args.model, args.limit,
+                              args.retry_failed)
+    except KeyboardInterrupt:
+        sys.exit(130)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mock_inference_server import MockConfig, start_mock_server
+
+# Offline benchmark suite.
+# Starts mock_inference_server on a free port, points every client at it through the endpoint overrides in
+# clients.py and runs the hot path of each script against it:
+#   exam    create-exam-paper.generate_exam (batched Gemini JSON requests written in order)
+#   pdf     PDF text extraction plus streamed LaTeX question generation (create_qs_from_pdf)
+#   health  one AIHealthEngine chat turn (llama.py)
+#   tools   one AIHealthEngine turn where the model asks for several tools at once
+#   web     one form POST and one streamed answer of the xai.py Flask app
+# Every scenario reports throughput and p50/p95/p99 latency as JSON; --compare shows the change against
+# an earlier result file. The response cache is disabled so every request reaches the mock server, and the
+# rate limiter's quotas are lifted (unless --rate-limits is given) while its 429 retries stay active.
+#
+# Example:
+#   python benchmark.py --requests 50 --concurrency 8 --latency lognormal:300,0.4 --output bench.json
+#   python benchmark.py --output bench-new.json --compare bench.json
+
+SCENARIOS = ("exam", "pdf", "health", "tools", "web")
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+UNLIMITED_PROVIDERS = ("azure-inference", "gemini", "openai")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def distribution(values):
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return None
+    return {
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": values[-1],
+    }
+
+
+def point_clients_at(server, rate_limits=None):
+    # clients.py reads these when it is first imported, so this must run before any script is imported
+    os.environ["GITHUB_MODELS_ENDPOINT"] = server.url
+    os.environ["XAI_BASE_URL"] = f"{server.url}/v1"
+    os.environ["GEMINI_API_ENDPOINT"] = server.url
+    os.environ["AI_CACHE_DISABLE"] = "1"
+    os.environ["AI_RATE_LIMITS"] = rate_limits or json.dumps({provider: {"rpm": 0, "tpm": 0} for provider in UNLIMITED_PROVIDERS})
+    for name in ("GITHUB_TOKEN", "API_KEY", "XAI_API_KEY"):
+        os.environ.setdefault(name, "benchmark")
+
+
+def import_script(file_name, module_name):
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(REPO_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return module
+
+
+# Smallest valid PDF with one line of text per page, so the PDF scenario needs no fixture file
+def write_sample_pdf(path, pages=12):
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        text = f"Page {page + 1}: vectors, dot products and cross products with worked examples."
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >>"
+            f" /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode("latin-1")
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(output)
+
+
+# Scenario setups: each returns (run_once(index) -> dict of extra metrics or None, mock server settings)
+
+def setup_exam(args):
+    exam = import_script("create-exam-paper.py", "create_exam_paper")
+    question_types = {"MCQ": 2, "VSAQ": 2, "SAQ": 5, "LAQ": 10}
+    styles = {q_type: "Analytical" for q_type in question_types}
+
+    def run_once(index):
+        exam.generate_exam(f"benchmark_{index}", 60, list(question_types), styles, question_types)
+        os.remove(f"benchmark_{index}_exam_paper.txt")
+
+    return run_once, {}
+
+
+def setup_pdf(args):
+    from clients import get_gemini_model
+    from pdf_extract import read_pdf_text
+
+    create_qs = import_script("create_qs_from_pdf.py", "create_qs_from_pdf")
+    write_sample_pdf("benchmark.pdf")
+    model = get_gemini_model("gemini-1.5-flash")
+
+    def run_once(index):
+        content = read_pdf_text("benchmark.pdf", use_cache=False)
+        prompt = f"Based on the following content, create a set of questions that are saved in LaTeX format: {content}"
+        metrics = create_qs.write_to_latex(f"benchmark_{index}.tex", model, prompt)
+        os.remove(f"benchmark_{index}.tex")
+        return {"ttft": metrics.time_to_first_token, "tokens_per_second": metrics.tokens_per_second}
+
+    return run_once, {}
+
+
+def _health_engines():
+    llama = import_script("llama.py", "llama")
+    engines = threading.local()
+
+    # One engine (one conversation) per worker thread, as each user of the app has their own
+    def engine():
+        if not hasattr(engines, "engine"):
+            engines.engine = llama.AIHealthEngine(llama.client, llama.model_name)
+        return engines.engine
+
+    return engine
+
+
+def setup_health(args):
+    engine = _health_engines()
+
+    def run_once(index):
+        engine().get_response(f"Question {index}: how much should I walk every day to lower my blood pressure?")
+
+    return run_once, {"tool_call_rate": 0.0}
+
+
+def setup_tools(args):
+    engine = _health_engines()
+
+    def run_once(index):
+        engine().get_response(f"Question {index}: find me a cardiologist and add a check-up to my calendar")
+
+    return run_once, {"tool_call_rate": 1.0, "tool_calls_per_turn": args.tool_calls}
+
+
+def setup_web(args):
+    xai = import_script("xai.py", "xai")
+    clients = threading.local()
+
+    def run_once(index):
+        if not hasattr(clients, "client"):
+            clients.client = xai.app.test_client()
+        client = clients.client
+        started = time.perf_counter()
+        response = client.post("/", data={"message": f"Question {index}: explain vectors briefly"})
+        if response.status_code != 200:
+            raise RuntimeError(f"POST / returned {response.status_code}")
+        form_latency = time.perf_counter() - started
+
+        started = time.perf_counter()
+        first_event = None
+        response = client.post("/stream", data={"message": f"Question {index}: and matrices?"}, buffered=False)
+        for chunk in response.response:
+            if first_event is None:
+                first_event = time.perf_counter() - started
+            if b"event: error" in chunk:
+                raise RuntimeError(chunk.decode("utf-8", "replace"))
+        response.close()
+        return {"form": form_latency, "stream_ttft": first_event, "stream": time.perf_counter() - started}
+
+    return run_once, {"tool_call_rate": 0.0}
+
+
+SETUPS = {
+    "exam": setup_exam,
+    "pdf": setup_pdf,
+    "health": setup_health,
+    "tools": setup_tools,
+    "web": setup_web,
+}
+
+
+def run_scenario(name, server, args, base_settings):
+    try:
+        run_once, settings = SETUPS[name](args)
+    except ImportError as e:
+        return {"skipped": f"missing dependency: {e}"}
+    server.config.update(dict(base_settings, **settings))
+
+    # Warm up connections and lazy imports outside the measurement
+    for index in range(args.warmup):
+        try:
+            run_once(-index - 1)
+        except Exception:
+            pass
+    server.reset_stats()
+
+    latencies = []
+    extras = {}
+    errors = {}
+    lock = threading.Lock()
+
+    def timed(index):
+        started = time.perf_counter()
+        try:
+            extra = run_once(index) or {}
+        except Exception as e:
+            with lock:
+                key = type(e).__name__
+                errors[key] = errors.get(key, 0) + 1
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            for key, value in extra.items():
+                extras.setdefault(key, []).append(value)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(timed, range(args.requests)))
+    wall_time = time.perf_counter() - started
+
+    with server.stats_lock:
+        server_requests = dict(server.stats)
+    return {
+        "requests": args.requests,
+        "completed": len(latencies),
+        "errors": errors,
+        "wall_time_s": wall_time,
+        "throughput_per_s": len(latencies) / wall_time if wall_time else None,
+        "latency_s": distribution(latencies),
+        "metrics": {key: distribution(values) for key, values in extras.items()},
+        "server_requests": server_requests,
+    }
+
+
+# Relative change of p50/p95/p99 latency and throughput against an earlier result file
+def compare(results, previous):
+    lines = []
+    for name, current in results["scenarios"].items():
+        before = previous.get("scenarios", {}).get(name)
+        if not before or not current.get("latency_s") or not before.get("latency_s"):
+            continue
+        changes = []
+        for key in ("p50", "p95", "p99"):
+            old, new = before["latency_s"][key], current["latency_s"][key]
+            changes.append(f"{key} {old * 1000:.0f} -> {new * 1000:.0f} ms ({(new - old) / old * 100:+.1f}%)")
+        old, new = before.get("throughput_per_s"), current.get("throughput_per_s")
+        if old and new:
+            changes.append(f"throughput {old:.2f} -> {new:.2f}/s ({(new - old) / old * 100:+.1f}%)")
+        lines.append(f"{name}: " + ", ".join(changes))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scripts' hot paths against a local mock server")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated, from: " + ", ".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=20, help="measured runs per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--latency", default="lognormal:300,0.4", help="mock time to first token distribution")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--output-tokens", type=int, default=64)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of mock requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--tool-calls", type=int, default=3, help="tool calls per model turn in the tools scenario")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    parser.add_argument("--rate-limits", help="quotas for the rate limiter as JSON (see rate_limiter.py); default unlimited")
+    parser.add_argument("--trace", help="also record spans (see tracing.py) into this directory")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SETUPS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    base_settings = {
+        "latency": args.latency,
+        "tokens_per_second": args.tokens_per_second,
+        "output_tokens": args.output_tokens,
+        "error_rate": args.error_rate,
+        "retry_after": args.retry_after,
+        "tool_call_rate": 0.0,
+        "tool_calls_per_turn": 1,
+    }
+    server = start_mock_server(MockConfig(seed=args.seed, **base_settings))
+    point_clients_at(server, args.rate_limits)
+    if args.trace:
+        trace_dir = os.path.abspath(args.trace)
+        os.environ["AI_TRACE"] = "1"
+        os.environ["AI_TRACE_PATH"] = os.path.join(trace_dir, "traces.jsonl")
+        os.environ["AI_TRACE_METRICS_PATH"] = os.path.join(trace_dir, "metrics.prom")
+    output = os.path.abspath(args.output) if args.output else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    # Scripts write their output files and caches to the working directory
+    sys.path.insert(0, REPO_DIR)
+    workdir = tempfile.mkdtemp(prefix="benchmark-")
+    os.chdir(workdir)
+
+    results = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "settings": dict(base_settings, requests=args.requests, concurrency=args.concurrency, tool_calls=args.tool_calls),
+        "scenarios": {},
+    }
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        results["scenarios"][name] = run_scenario(name, server, args, base_settings)
+    server.shutdown()
+
+    text = json.dumps(results, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Results written to {output}", file=sys.stderr)
+    else:
+        print(text)
+    if compare_path:
+        with open(compare_path, "r", encoding="utf-8") as f:
+            print(compare(results, json.load(f)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
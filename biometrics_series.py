@@ -0,0 +1,236 @@
+import bisect
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from urllib.parse import quote, unquote
+
+# Columnar time series of biometric readings, one per user and metric.
+# Timestamps and values live in two typed arrays ("d" = float64) so appends are amortized O(1) and range
+# queries run over contiguous memory. Each series is persisted as packed little-endian (timestamp, value)
+# float64 pairs, appended to on every reading.
+BIOMETRICS_DIR = os.environ.get("BIOMETRICS_DIR", "biometrics")
+# Number of series kept in memory
+RESIDENT_SERIES = int(os.environ.get("BIOMETRICS_RESIDENT", "4096"))
+# Seconds a cached summary is reused while no new reading arrives; the window moves on meanwhile
+SUMMARY_MAX_AGE = float(os.environ.get("BIOMETRICS_SUMMARY_MAX_AGE", "3600"))
+
+DAY = 24 * 3600
+# One (timestamp, value) pair on disk
+RECORD_SIZE = 16
+
+
+# Files are little-endian whatever the machine
+def _to_bytes(values):
+    if sys.byteorder == "big":
+        values = array("d", values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class MetricSeries:
+    def __init__(self, path=None):
+        self.path = path
+        self.timestamps = array("d")
+        self.values = array("d")
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            # Drop a torn last record from a crash mid-write
+            data = data[:len(data) - len(data) % RECORD_SIZE]
+            pairs = array("d")
+            pairs.frombytes(data)
+            if sys.byteorder == "big":
+                pairs.byteswap()
+            self.timestamps = pairs[0::2]
+            self.values = pairs[1::2]
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, value, timestamp=None):
+        timestamp = time.time() if timestamp is None else float(timestamp)
+        value = float(value)
+        with self._lock:
+            if not self.timestamps or timestamp >= self.timestamps[-1]:
+                self.timestamps.append(timestamp)
+                self.values.append(value)
+                if self.path:
+                    with open(self.path, "ab") as f:
+                        f.write(_to_bytes(array("d", (timestamp, value))))
+            else:
+                # Late reading: insert in order and rewrite the file (rare)
+                index = bisect.bisect_right(self.timestamps, timestamp)
+                self.timestamps.insert(index, timestamp)
+                self.values.insert(index, value)
+                self._rewrite()
+
+    def _rewrite(self):
+        if not self.path:
+            return
+        pairs = array("d", bytes(RECORD_SIZE * len(self.timestamps)))
+        pairs[0::2] = self.timestamps
+        pairs[1::2] = self.values
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(_to_bytes(pairs))
+        os.replace(temp_path, self.path)
+
+    # Index range [lo, hi) of readings with start <= timestamp < end
+    def _bounds(self, start=None, end=None):
+        lo = 0 if start is None else bisect.bisect_left(self.timestamps, start)
+        hi = len(self.timestamps) if end is None else bisect.bisect_left(self.timestamps, end)
+        return lo, hi
+
+    def range(self, start=None, end=None):
+        with self._lock:
+            lo, hi = self._bounds(start, end)
+            return self.timestamps[lo:hi], self.values[lo:hi]
+
+    def stats(self, start=None, end=None):
+        _, values = self.range(start, end)
+        if not values:
+            return None
+        return {
+            "count": len(values),
+            "min": min(values),
+            "max": max(values),
+            "mean": sum(values) / len(values),
+            "latest": values[-1],
+        }
+
+    # Mean of the readings in the trailing window (timestamp - window, timestamp] at every reading
+    def rolling_mean(self, window, start=None, end=None):
+        timestamps, values = self.range(start, end)
+        prefix = array("d", [0.0])
+        total = 0.0
+        for value in values:
+            total += value
+            prefix.append(total)
+        means = array("d")
+        first = 0
+        for index, timestamp in enumerate(timestamps):
+            while timestamps[first] <= timestamp - window:
+                first += 1
+            means.append((prefix[index + 1] - prefix[first]) / (index + 1 - first))
+        return timestamps, means
+
+    # (bucket start, mean, min, max) for each bucket of the given size that has readings
+    def downsample(self, bucket, start=None, end=None):
+        timestamps, values = self.range(start, end)
+        if not timestamps:
+            return []
+        origin = start if start is not None else timestamps[0]
+        buckets = []
+        lo = 0
+        while lo < len(timestamps):
+            bucket_index = int((timestamps[lo] - origin) // bucket)
+            bucket_end = origin + (bucket_index + 1) * bucket
+            hi = bisect.bisect_left(timestamps, bucket_end, lo)
+            chunk = values[lo:hi]
+            buckets.append((origin + bucket_index * bucket, sum(chunk) / len(chunk), min(chunk), max(chunk)))
+            lo = hi
+        return buckets
+
+
+# Numbers in a reading; "120/80" gives two components
+def parse_reading(value):
+    return [float(part) for part in re.findall(r"-?\d+(?:\.\d+)?", str(value))]
+
+
+class BiometricsStore:
+    def __init__(self, directory=BIOMETRICS_DIR, max_resident=RESIDENT_SERIES):
+        self.directory = directory
+        self.max_resident = max_resident
+        self._series = OrderedDict()
+        # user id -> {(days, bucket_days): (computed at, text)}, dropped when the user records a reading
+        self._summaries = OrderedDict()
+        # Readings recorded so far, so a summary computed while one arrived isn't cached
+        self._recorded = 0
+        self._lock = threading.Lock()
+
+    def _user_directory(self, user_id):
+        shard = hashlib.sha1(str(user_id).encode("utf-8")).hexdigest()[:2]
+        return os.path.join(self.directory, shard, quote(str(user_id), safe=""))
+
+    def series(self, user_id, metric):
+        key = (user_id, metric)
+        with self._lock:
+            series = self._series.get(key)
+            if series is not None:
+                self._series.move_to_end(key)
+                return series
+        directory = self._user_directory(user_id)
+        os.makedirs(directory, exist_ok=True)
+        series = MetricSeries(os.path.join(directory, f"{quote(metric, safe='')}.f64"))
+        with self._lock:
+            series = self._series.setdefault(key, series)
+            while len(self._series) > self.max_resident:
+                self._series.popitem(last=False)
+        return series
+
+    def metrics(self, user_id):
+        directory = self._user_directory(user_id)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(unquote(name[:-4]) for name in os.listdir(directory) if name.endswith(".f64"))
+
+    # Store a reading. Multi-part readings such as blood pressure "120/80" are stored as
+    # "<metric>.1", "<metric>.2", ... Returns False when the value holds no number.
+    def record(self, user_id, metric, value, timestamp=None):
+        metric = " ".join(metric.lower().split())
+        numbers = parse_reading(value)
+        if not numbers:
+            return False
+        timestamp = time.time() if timestamp is None else timestamp
+        if len(numbers) == 1:
+            self.series(user_id, metric).append(numbers[0], timestamp)
+        else:
+            for index, number in enumerate(numbers, start=1):
+                self.series(user_id, f"{metric}.{index}").append(number, timestamp)
+        with self._lock:
+            self._recorded += 1
+            self._summaries.pop(user_id, None)
+        return True
+
+    # Compact text summary of recent trends, small enough to include in a prompt.
+    # It is asked for on every model request, so it is cached per user until a new reading is recorded.
+    def summary(self, user_id, days=30, bucket_days=7, now=None):
+        if now is not None:
+            return self._summary(user_id, days, bucket_days, now)
+        now = time.time()
+        with self._lock:
+            cached = self._summaries.get(user_id, {}).get((days, bucket_days))
+            if cached is not None and now - cached[0] < SUMMARY_MAX_AGE:
+                self._summaries.move_to_end(user_id)
+                return cached[1]
+            recorded = self._recorded
+        text = self._summary(user_id, days, bucket_days, now)
+        with self._lock:
+            if self._recorded == recorded:
+                self._summaries.setdefault(user_id, {})[(days, bucket_days)] = (now, text)
+                self._summaries.move_to_end(user_id)
+                while len(self._summaries) > self.max_resident:
+                    self._summaries.popitem(last=False)
+        return text
+
+    def _summary(self, user_id, days, bucket_days, now):
+        start = now - days * DAY
+        lines = []
+        for metric in self.metrics(user_id):
+            series = self.series(user_id, metric)
+            stats = series.stats(start)
+            if not stats:
+                continue
+            trend = ", ".join(f"{mean:g}" for _, mean, _, _ in series.downsample(bucket_days * DAY, start))
+            lines.append(
+                f"{metric}: {stats['count']} readings in the last {days} days, latest {stats['latest']:g}, "
+                f"mean {stats['mean']:.4g}, min {stats['min']:g}, max {stats['max']:g}; "
+                f"{bucket_days}-day means {trend}"
+            )
+        return "\n".join(lines)
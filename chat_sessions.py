@@ -0,0 +1,206 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Server-side conversation sessions with a token-budgeted context window.
+# Each session keeps its recent turns verbatim plus a rolling summary of older turns. Once the verbatim
+# turns outgrow their share of the budget, the oldest ones are folded into the summary, so the prompt sent
+# for every turn stays roughly the same size however long the conversation runs.
+#
+# Environment variables:
+#   CHAT_CONTEXT_TOKENS   token budget for the prompt of one turn (system prompt, summary, history and message)
+#   CHAT_MAX_SESSIONS     sessions kept in memory before the least recently used one is evicted
+#   CHAT_SESSION_TTL      seconds of inactivity after which a session is dropped
+#   CHAT_SESSION_DIR      if set, evicted sessions are written here and loaded back on their next request
+CONTEXT_TOKENS = int(os.environ.get("CHAT_CONTEXT_TOKENS", "4000"))
+MAX_SESSIONS = int(os.environ.get("CHAT_MAX_SESSIONS", "1000"))
+SESSION_TTL = float(os.environ.get("CHAT_SESSION_TTL", str(6 * 3600)))
+SESSION_DIR = os.environ.get("CHAT_SESSION_DIR")
+
+# Share of the budget the rolling summary may use; the rest goes to verbatim turns
+SUMMARY_SHARE = 0.25
+# Extra tokens the API adds around every message
+MESSAGE_OVERHEAD = 4
+
+
+# Rough token count (about four characters per token), good enough for budgeting without a tokenizer
+def estimate_tokens(text):
+    return len(text or "") // 4 + 1
+
+
+def message_tokens(message):
+    content = message["content"] if isinstance(message, dict) else getattr(message, "content", "")
+    if not isinstance(content, str):
+        content = json.dumps(content, default=str)
+    return estimate_tokens(content) + MESSAGE_OVERHEAD
+
+
+class ChatSession:
+    def __init__(self, session_id, summary="", turns=None, last_access=None):
+        self.session_id = session_id
+        self.summary = summary
+        self.turns = turns or []
+        self.last_access = last_access or time.time()
+        self.lock = threading.Lock()
+        # Set while a summary of this session is being written; only one compaction runs at a time
+        self.compacting = False
+
+    def to_dict(self):
+        return {
+            "session_id": self.session_id,
+            "summary": self.summary,
+            "turns": self.turns,
+            "last_access": self.last_access,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["session_id"], data["summary"], data["turns"], data["last_access"])
+
+    def add_turn(self, user_message, assistant_message):
+        with self.lock:
+            self.turns.append({"role": "user", "content": user_message})
+            self.turns.append({"role": "assistant", "content": assistant_message})
+
+    # Messages for the next turn: system prompt, summary of older turns, as many recent turns as fit, new message
+    def build_messages(self, system_prompt, user_message, budget=CONTEXT_TOKENS):
+        head = [{"role": "system", "content": system_prompt}]
+        if self.summary:
+            head.append({"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+        new_message = {"role": "user", "content": user_message}
+        remaining = budget - sum(message_tokens(m) for m in head) - message_tokens(new_message)
+
+        with self.lock:
+            recent = []
+            for turn in reversed(self.turns):
+                remaining -= message_tokens(turn)
+                if remaining < 0:
+                    break
+                recent.append(turn)
+        recent.reverse()
+        # Never start the history with an assistant reply whose question was cut off
+        if recent and recent[0]["role"] == "assistant":
+            recent = recent[1:]
+        return head + recent + [new_message]
+
+    # Oldest turns that should be folded into the summary, or [] while the history still fits its share
+    # or another compaction is running. Compaction brings the history down to half its share so it is
+    # needed only every few turns. Non-empty turns claim the session: finish with apply_summary or end_compaction.
+    def turns_to_compact(self, budget=CONTEXT_TOKENS):
+        history_budget = budget * (1 - SUMMARY_SHARE)
+        with self.lock:
+            if self.compacting:
+                return []
+            total = sum(message_tokens(turn) for turn in self.turns)
+            if total <= history_budget:
+                return []
+            count = 0
+            while count < len(self.turns) and total > history_budget / 2:
+                total -= message_tokens(self.turns[count])
+                count += 1
+            # Fold whole question/answer pairs
+            count += count % 2
+            self.compacting = True
+            return list(self.turns[:count])
+
+    # The summary is dropped if the history no longer starts with the summarized turns (e.g. it was reset)
+    def apply_summary(self, summary, compacted_turns):
+        with self.lock:
+            self.compacting = False
+            if self.turns[:len(compacted_turns)] != compacted_turns:
+                return
+            self.summary = summary
+            del self.turns[:len(compacted_turns)]
+
+    def end_compaction(self):
+        with self.lock:
+            self.compacting = False
+
+
+# Prompt asking the model to merge older turns into the rolling summary
+def summary_prompt(previous_summary, turns, budget=CONTEXT_TOKENS):
+    transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+    words = int(budget * SUMMARY_SHARE * 0.75)
+    return [
+        {
+            "role": "system",
+            "content": f"Summarize conversations for later reference. Keep facts, decisions and open questions. Use at most {words} words.",
+        },
+        {
+            "role": "user",
+            "content": f"Existing summary:\n{previous_summary or '(none)'}\n\nNew conversation turns:\n{transcript}\n\nWrite the updated summary.",
+        },
+    ]
+
+
+class SessionStore:
+    def __init__(self, max_sessions=MAX_SESSIONS, ttl=SESSION_TTL, spill_dir=SESSION_DIR):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.spill_dir = spill_dir
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    @staticmethod
+    def new_session_id():
+        return uuid.uuid4().hex
+
+    def _spill_path(self, session_id):
+        return os.path.join(self.spill_dir, f"{session_id}.json")
+
+    def _load_spilled(self, session_id):
+        if not self.spill_dir or not session_id.isalnum():
+            return None
+        path = self._spill_path(session_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            session = ChatSession.from_dict(json.load(f))
+        os.remove(path)
+        return session
+
+    def _spill(self, session):
+        if not self.spill_dir:
+            return
+        with open(self._spill_path(session.session_id), "w", encoding="utf-8") as f:
+            json.dump(session.to_dict(), f)
+
+    # Return the session for session_id, loading it back from disk or starting a new one as needed
+    def get(self, session_id):
+        now = time.time()
+        evicted = []
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+            else:
+                session = self._load_spilled(session_id)
+                if session is None or now - session.last_access > self.ttl:
+                    session = ChatSession(session_id)
+                self._sessions[session_id] = session
+            session.last_access = now
+
+            # Expired sessions are dropped; the least recently used ones beyond the limit are spilled
+            while self._sessions:
+                oldest_id, oldest = next(iter(self._sessions.items()))
+                if now - oldest.last_access > self.ttl:
+                    self._sessions.popitem(last=False)
+                elif len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    evicted.append(oldest)
+                else:
+                    break
+        for old_session in evicted:
+            self._spill(old_session)
+        return session
+
+    def reset(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        if self.spill_dir and session_id.isalnum() and os.path.exists(self._spill_path(session_id)):
+            os.remove(self._spill_path(session_id))
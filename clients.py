@@ -0,0 +1,119 @@
+import atexit
+import json
+import os
+import threading
+
+# Shared, long-lived API clients.
+# Every script asks this module for its client instead of building one, so repeated calls in the
+# same process reuse one pooled keep-alive HTTP connection set per (provider, endpoint, api_version, model)
+# rather than paying client setup and a TLS handshake each time. Clients are closed at interpreter exit.
+#
+# The endpoints can be pointed elsewhere (for example at mock_inference_server for benchmarks) with
+# GITHUB_MODELS_ENDPOINT, XAI_BASE_URL and GEMINI_API_ENDPOINT.
+GITHUB_MODELS_ENDPOINT = os.environ.get("GITHUB_MODELS_ENDPOINT", "https://models.inference.ai.azure.com")
+XAI_BASE_URL = os.environ.get("XAI_BASE_URL", "https://api.x.ai/v1")
+# host[:port] of the Gemini API; when set, requests go over REST to that host instead of the default gRPC endpoint
+GEMINI_API_ENDPOINT = os.environ.get("GEMINI_API_ENDPOINT")
+
+# Number of keep-alive connections held open per client
+POOL_SIZE = int(os.environ.get("AI_CLIENT_POOL_SIZE", "20"))
+# Seconds an idle connection is kept before being dropped
+KEEPALIVE_EXPIRY = float(os.environ.get("AI_CLIENT_KEEPALIVE", "120"))
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _get_or_create(key, factory):
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            _clients[key] = client
+        return client
+
+
+# requests session with a connection pool large enough for the thread pools used by the scripts
+def _pooled_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# ChatCompletionsClient for GitHub Models / Azure AI Inference.
+# The model is part of the key so that a slow model never holds connections another model needs.
+def get_chat_client(endpoint=GITHUB_MODELS_ENDPOINT, api_version=None, model=None, token=None):
+    def factory():
+        from azure.ai.inference import ChatCompletionsClient
+        from azure.core.credentials import AzureKeyCredential
+        from azure.core.pipeline.transport import RequestsTransport
+
+        kwargs = {"api_version": api_version} if api_version else {}
+        return ChatCompletionsClient(
+            endpoint=endpoint,
+            credential=AzureKeyCredential(token or os.getenv("GITHUB_TOKEN")),
+            transport=RequestsTransport(session=_pooled_session(), session_owner=True),
+            **kwargs,
+        )
+
+    return _get_or_create(("azure-inference", endpoint, api_version, model), factory)
+
+
+# OpenAI-compatible client (used for xAI) backed by a keep-alive httpx pool
+def get_openai_client(base_url=XAI_BASE_URL, api_key=None, model=None):
+    def factory():
+        import httpx
+        from openai import OpenAI
+
+        http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=POOL_SIZE,
+                max_keepalive_connections=POOL_SIZE,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+        )
+        return OpenAI(api_key=api_key or os.getenv("XAI_API_KEY"), base_url=base_url, http_client=http_client)
+
+    return _get_or_create(("openai", base_url, None, model), factory)
+
+
+# genai.configure with the API key from API_KEY, honouring GEMINI_API_ENDPOINT
+def configure_gemini(api_key=None):
+    import google.generativeai as genai
+
+    options = {}
+    if GEMINI_API_ENDPOINT:
+        options = {"transport": "rest", "client_options": {"api_endpoint": GEMINI_API_ENDPOINT}}
+    genai.configure(api_key=api_key or os.environ["API_KEY"], **options)
+
+
+# Gemini models are cheap wrappers around the client set up by genai.configure, so they are simply reused
+def get_gemini_model(model_name, **kwargs):
+    def factory():
+        import google.generativeai as genai
+
+        return genai.GenerativeModel(model_name, **kwargs)
+
+    options = json.dumps(kwargs, sort_keys=True, default=str)
+    return _get_or_create(("gemini", None, options, model_name), factory)
+
+
+def close_clients():
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        close = getattr(client, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                pass
+
+
+atexit.register(close_clients)
@@ -0,0 +1,108 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from chat_sessions import message_tokens
+
+# Bounded-memory conversation history.
+# Recent messages are kept verbatim in a sliding window limited by a token budget and a message count.
+# Once the window outgrows either limit, its oldest messages are moved out until it is down to half of
+# both, and those are summarized in a background thread into a rolling summary, so the prompt for each
+# turn stays bounded no matter how long the conversation runs while a summary is needed only every few
+# turns. Moved-out messages stay in the prompt verbatim until the summary that covers them is ready.
+#
+# Environment variables:
+#   HEALTH_WINDOW_TOKENS    token budget for the verbatim window
+#   HEALTH_WINDOW_MESSAGES  maximum number of messages in the verbatim window
+WINDOW_TOKENS = int(os.environ.get("HEALTH_WINDOW_TOKENS", "3000"))
+WINDOW_MESSAGES = int(os.environ.get("HEALTH_WINDOW_MESSAGES", "20"))
+
+
+def _role_and_content(message):
+    if isinstance(message, dict):
+        return str(message["role"]), message["content"]
+    role = getattr(message, "role", "")
+    return str(getattr(role, "value", role)), message.content
+
+
+class ConversationCompactor:
+    # summarize(previous_summary, evicted) returns the new summary; evicted is a list of {"role", "content"} dicts.
+    # make_summary_message(summary) builds the message that carries the summary into the prompt.
+    def __init__(self, summarize, make_summary_message, window_tokens=WINDOW_TOKENS, window_messages=WINDOW_MESSAGES):
+        self.summarize = summarize
+        self.make_summary_message = make_summary_message
+        self.window_tokens = window_tokens
+        self.window_messages = window_messages
+        self.summary = ""
+        self._window = []  # (message, token count) pairs, oldest first
+        self._window_total = 0
+        self._evicted = []  # (message, token count, {"role", "content"}) out of the window, not in the summary yet
+        self._evicted_total = 0
+        self._generation = 0  # bumped by reset() so summaries of a cleared conversation are discarded
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def append(self, message):
+        tokens = message_tokens(message)
+        with self._lock:
+            self._window.append((message, tokens))
+            self._window_total += tokens
+            if self._window_total <= self.window_tokens and len(self._window) <= self.window_messages:
+                return
+            # Always keep the newest message, even if it alone is over budget
+            while len(self._window) > 1 and (
+                self._window_total > self.window_tokens // 2 or len(self._window) > self.window_messages // 2
+            ):
+                old_message, old_tokens = self._window.pop(0)
+                self._window_total -= old_tokens
+                role, content = _role_and_content(old_message)
+                self._evicted.append((old_message, old_tokens, {"role": role, "content": content}))
+                self._evicted_total += old_tokens
+            self._executor.submit(self._summarize_evicted, self._generation)
+
+    # Messages to send after the system prompt: the rolling summary, the messages still being summarized,
+    # then the verbatim window
+    def messages(self):
+        with self._lock:
+            recent = [message for message, _, _ in self._evicted] + [message for message, _ in self._window]
+            summary = self.summary
+        if summary:
+            return [self.make_summary_message(summary)] + recent
+        return recent
+
+    def token_count(self):
+        with self._lock:
+            summary_tokens = message_tokens({"content": self.summary}) if self.summary else 0
+            return self._window_total + self._evicted_total + summary_tokens
+
+    def reset(self):
+        with self._lock:
+            self._generation += 1
+            self.summary = ""
+            self._window = []
+            self._window_total = 0
+            self._evicted = []
+            self._evicted_total = 0
+
+    # Background task: fold everything evicted so far into the summary
+    def _summarize_evicted(self, generation):
+        with self._lock:
+            if generation != self._generation or not self._evicted:
+                return
+            batch = [evicted for _, _, evicted in self._evicted]
+            previous_summary = self.summary
+        try:
+            summary = self.summarize(previous_summary, batch)
+        except Exception as e:
+            print(f"Could not summarize conversation history: {e}")
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self.summary = summary
+            self._evicted_total -= sum(tokens for _, tokens, _ in self._evicted[:len(batch)])
+            del self._evicted[:len(batch)]
+
+    # Stop the background summarizer; a summary still queued is dropped
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,19 +1,105 @@
 from dotenv import load_dotenv
 import os
-import google.generativeai as genai
+import json
+from concurrent.futures import ThreadPoolExecutor
+from clients import configure_gemini, get_gemini_model
+from rate_limiter import BATCH_PRIORITY, run_rate_limited
+from response_cache import request_tokens, used_tokens
+from tracing import span
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Configure API key for Google Generative AI
-genai.configure(api_key=os.environ["API_KEY"])
+configure_gemini()
+
+# Maximum number of questions requested from the model at the same time
+DEFAULT_MAX_WORKERS = int(os.environ.get("EXAM_MAX_WORKERS", "8"))
+
+# Number of questions of the same type and style asked for in a single request (1 disables batching)
+DEFAULT_BATCH_SIZE = int(os.environ.get("EXAM_BATCH_SIZE", "10"))
+
+# How each question type is described in the prompt
+QUESTION_KINDS = {
+    "MCQ": "multiple-choice",
+    "VSAQ": "very short answer",
+    "SAQ": "short answer",
+    "LAQ": "long answer",
+}
+
+# One model instance is shared by every request instead of building a new one per question
+model = get_gemini_model("gemini-1.5-flash")
+batch_model = get_gemini_model(
+    "gemini-1.5-flash",
+    generation_config={"response_mime_type": "application/json"},
+)
+
+# Function to send one prompt within the shared Gemini quota; the workers queue behind interactive requests
+def generate_content(gemini_model, prompt):
+    return run_rate_limited(
+        "gemini",
+        gemini_model.model_name,
+        lambda: gemini_model.generate_content(prompt),
+        tokens=request_tokens(prompt),
+        priority=BATCH_PRIORITY,
+        usage=used_tokens,
+    )
 
 # Function to generate a question from AI
 def generate_question(prompt):
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    response = model.generate_content(prompt)
+    with span("model.call", provider="gemini", model=model.model_name) as current:
+        response = generate_content(model, prompt)
+        current.set_usage(response)
     return response.text.strip()
 
+# Function to pull the question strings out of a batched JSON response
+def parse_question_batch(text):
+    with span("parse", chars=len(text)):
+        return _parse_question_batch(text)
+
+def _parse_question_batch(text):
+    try:
+        items = json.loads(text)
+    except ValueError:
+        return []
+    if isinstance(items, dict):
+        items = items.get("questions", [])
+    if not isinstance(items, list):
+        return []
+
+    questions = []
+    for item in items:
+        if isinstance(item, dict):
+            item = item.get("question", "")
+        if isinstance(item, str) and item.strip():
+            questions.append(item.strip())
+    return questions
+
+# Function to generate several questions of one type and style with a single request.
+# Items the model leaves out (or that fail to parse) are retried one at a time, and so is the whole batch
+# when the batched request itself fails.
+def generate_question_batch(kind, style_prompt, count):
+    if count == 1:
+        return [generate_question(f"Create a {kind} {style_prompt}")]
+
+    prompt = (
+        f"Create {count} different {kind} {style_prompt} "
+        f"Return a JSON array of exactly {count} strings. Each string is one complete question, "
+        f"including its answer options where the question type needs them. Do not number the questions."
+    )
+    try:
+        with span("model.call", provider="gemini", model=batch_model.model_name, batch=count) as current:
+            response = generate_content(batch_model, prompt)
+            current.set_usage(response)
+        questions = parse_question_batch(response.text)[:count]
+    except Exception as e:
+        print(f"Batch of {count} {kind} questions failed ({e}); generating them one at a time")
+        questions = []
+
+    while len(questions) < count:
+        questions.append(generate_question(f"Create a {kind} {style_prompt}"))
+    return questions
+
 # Function to automatically calculate the number of questions based on total marks and marks per type
 def calculate_num_questions(total_marks, question_types):
     num_questions = {}
@@ -25,11 +111,51 @@ def calculate_num_questions(total_marks, question_types):
     
     return num_questions
 
+# Function to plan every question up front so numbering and remaining marks are fixed before generation starts
+def plan_questions(subject_name, total_marks, selected_types, question_styles, question_types):
+    # Calculate number of questions based on marks
+    num_questions = calculate_num_questions(total_marks, {k: question_types[k] for k in selected_types})
+    remaining_marks = total_marks
+    question_number = 1
+    planned = []
+
+    for q_type in selected_types:
+        marks = question_types[q_type]
+        for _ in range(num_questions[q_type]):
+            if remaining_marks <= 0:
+                break
+
+            planned.append((question_number, q_type, marks))
+
+            # Update the remaining marks and question number
+            remaining_marks -= marks
+            question_number += 1
+
+    return planned
+
+# Function to group planned questions of the same type into batches of at most batch_size.
+# Returns the batches and, for each planned question, the (batch index, position) holding its text.
+def group_into_batches(planned, batch_size):
+    batches = []
+    slots = []
+    for _, q_type, _ in planned:
+        if not batches or batches[-1][0] != q_type or batches[-1][1] >= batch_size:
+            batches.append([q_type, 0])
+        slots.append((len(batches) - 1, batches[-1][1]))
+        batches[-1][1] += 1
+    return [tuple(batch) for batch in batches], slots
+
 # Function to generate the exam paper
-def generate_exam(subject_name, total_marks, selected_types, question_styles, question_types):
+# Batches of questions are generated concurrently by up to max_workers threads, but each
+# question is written to the file as soon as every question numbered before it has finished.
+def generate_exam(subject_name, total_marks, selected_types, question_styles, question_types,
+                  max_workers=DEFAULT_MAX_WORKERS, batch_size=DEFAULT_BATCH_SIZE):
     # File path for saving the exam as a .txt file
     txt_file_path = f"{subject_name}_exam_paper.txt"
-    
+
+    planned = plan_questions(subject_name, total_marks, selected_types, question_styles, question_types)
+    batches, slots = group_into_batches(planned, max(1, batch_size))
+
     # Open the text file for writing
     with open(txt_file_path, 'w', encoding='utf-8') as txt_file:
         # Write the exam title and details
@@ -37,65 +163,53 @@ def generate_exam(subject_name, total_marks, selected_types, question_styles, qu
         txt_file.write(f"Subject: {subject_name}\n")
         txt_file.write(f"Total Marks: {total_marks}\n")
         txt_file.write("\n")
+        txt_file.flush()
 
-        # Calculate number of questions based on marks
-        num_questions = calculate_num_questions(total_marks, {k: question_types[k] for k in selected_types})
-        remaining_marks = total_marks
-        question_number = 1
-
-        # Generate questions for each selected type
-        for q_type in selected_types:
-            marks = question_types[q_type]
-            for _ in range(num_questions[q_type]):
-                if remaining_marks <= 0:
-                    break
-
-                # Select prompt based on the question style
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = []
+            for q_type, count in batches:
+                # Select prompt based on the question type and style
                 style_prompt = f"{question_styles[q_type]} on {subject_name}."
-                
-                # Set question prompt based on question type and style
-                if q_type == 'MCQ':
-                    prompt = f"Create a multiple-choice {style_prompt}"
-                elif q_type == 'SAQ':
-                    prompt = f"Create a short answer {style_prompt}"
+                futures.append(executor.submit(generate_question_batch, QUESTION_KINDS[q_type], style_prompt, count))
 
-                # Generate the question text
-                question_text = generate_question(prompt)
+            # Waiting on the batches in submission order keeps the numbering intact
+            for (question_number, _, marks), (batch_index, position) in zip(planned, slots):
+                question_text = futures[batch_index].result()[position]
 
                 # Write the question to the text file
-                txt_file.write(f"Q{question_number}. {question_text} [{marks} Marks]\n\n")
-
-                # Update the remaining marks and question number
-                remaining_marks -= marks
-                question_number += 1
+                with span("file.write", path=txt_file_path):
+                    txt_file.write(f"Q{question_number}. {question_text} [{marks} Marks]\n\n")
+                    txt_file.flush()
 
     print(f"Exam paper generated and saved as {txt_file_path}")
 
-# Example input for generating the exam paper
-subject_name = input("Enter the subject name: ")
-total_marks = int(input("Enter the total marks for the exam: "))
-
-# Define question types with corresponding marks per question
-question_types = {
-    "MCQ": 2,   # Multiple Choice Questions worth 2 marks each
-    "VSAQ": 2,  # Very Short Answer Questions worth 2 marks each
-    "SAQ": 5,   # Short Answer Questions worth 5 marks each
-    "LAQ": 10   # Long Answer Questions worth 10 marks each
-}
-
-# Prompt user to select which question types to include
-available_types = ["MCQ", "VSAQ", "SAQ", "LAQ"]
-selected_types = []
-print("Select the question types to include (MCQ, VSAQ, SAQ, LAQ). You can choose any combination.")
-for q_type in available_types:
-    include = input(f"Include {q_type}? (yes/no): ").strip().lower()
-    if include == 'yes':
-        selected_types.append(q_type)
-
-# Define question styles (Theoretical, Numerical, Analytical, etc.)
-question_styles = {}
-for q_type in selected_types:
-    question_styles[q_type] = input(f"Enter style for {q_type} (e.g., Theoretical, Numerical, Analytical): ")
-
-# Generate the exam paper and save as a text file
-generate_exam(subject_name, total_marks, selected_types, question_styles, question_types)
+# Main program (guarded so the exam functions can be imported, e.g. by benchmark.py)
+if __name__ == "__main__":
+    # Example input for generating the exam paper
+    subject_name = input("Enter the subject name: ")
+    total_marks = int(input("Enter the total marks for the exam: "))
+
+    # Define question types with corresponding marks per question
+    question_types = {
+        "MCQ": 2,   # Multiple Choice Questions worth 2 marks each
+        "VSAQ": 2,  # Very Short Answer Questions worth 2 marks each
+        "SAQ": 5,   # Short Answer Questions worth 5 marks each
+        "LAQ": 10   # Long Answer Questions worth 10 marks each
+    }
+
+    # Prompt user to select which question types to include
+    available_types = ["MCQ", "VSAQ", "SAQ", "LAQ"]
+    selected_types = []
+    print("Select the question types to include (MCQ, VSAQ, SAQ, LAQ). You can choose any combination.")
+    for q_type in available_types:
+        include = input(f"Include {q_type}? (yes/no): ").strip().lower()
+        if include == 'yes':
+            selected_types.append(q_type)
+
+    # Define question styles (Theoretical, Numerical, Analytical, etc.)
+    question_styles = {}
+    for q_type in selected_types:
+        question_styles[q_type] = input(f"Enter style for {q_type} (e.g., Theoretical, Numerical, Analytical): ")
+
+    # Generate the exam paper and save as a text file
+    generate_exam(subject_name, total_marks, selected_types, question_styles, question_types)
@@ -1,44 +1,51 @@
 from dotenv import load_dotenv
 import os
 import google.generativeai as genai
-import PyPDF2
+from clients import configure_gemini
+from rate_limiter import run_rate_limited
+from response_cache import request_tokens, stream_key
+from token_stream import FileSink, gemini_deltas, stream_to
+from pdf_extract import read_pdf_text
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Configure the Generative AI API
-genai.configure(api_key=os.environ["API_KEY"])
+configure_gemini()
 
 # Function to read PDF content
+# Pages are extracted in parallel worker processes and cached by the PDF's content hash
 def read_pdf(file_path):
-    with open(file_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        pdf_text = ""
-        for page in range(len(reader.pages)):
-            pdf_text += reader.pages[page].extract_text()
-    return pdf_text
-
-# Function to write LaTeX content to a file
-def write_to_latex(file_name, content):
-    with open(file_name, 'w') as file:
-        file.write(content)
-
-# Read the PDF file content (assume the input file is a PDF)
-pdf_content = read_pdf('ac.pdf')  # Replace with your PDF file name
-
-# Dynamically create a prompt based on the PDF content
-prompt = f"Based on the following content, create a set of questions that are saved in LaTeX format: {pdf_content}"
-
-# Generate a response using the Generative AI model
-model = genai.GenerativeModel("gemini-1.5-flash")
-response = model.generate_content(prompt)
-
-# Convert the response to LaTeX format (you can modify this based on how you want LaTeX formatting)
-latex_content = f"\\documentclass{{article}}\n\\begin{{document}}\n{response.text}\n\\end{{document}}"
-
-# Save the LaTeX content to a .tex file
-output_file = 'generated_questions.tex'  # You can name the file as needed
-write_to_latex(output_file, latex_content)
-
-# Print confirmation and location of the saved file
-print(f"LaTeX formatted questions saved to {output_file}")
+    return read_pdf_text(file_path)
+
+# Function to stream the generated LaTeX into a file as it arrives
+def write_to_latex(file_name, model, prompt):
+    sink = FileSink(
+        file_name,
+        header="\\documentclass{article}\n\\begin{document}\n",
+        footer="\n\\end{document}",
+    )
+    request = lambda: run_rate_limited(
+        "gemini",
+        model.model_name,
+        lambda: model.generate_content(prompt, stream=True),
+        tokens=request_tokens(prompt),
+    )
+    return stream_to([sink], request, deltas=gemini_deltas, cache_key=stream_key("gemini", model.model_name, prompt))
+
+# Main execution (guarded so the PDF worker processes can import this file safely)
+if __name__ == "__main__":
+    # Read the PDF file content (assume the input file is a PDF)
+    pdf_content = read_pdf('ac.pdf')  # Replace with your PDF file name
+
+    # Dynamically create a prompt based on the PDF content
+    prompt = f"Based on the following content, create a set of questions that are saved in LaTeX format: {pdf_content}"
+
+    # Generate the questions with the Generative AI model, wrapped in a LaTeX document and
+    # written to a .tex file while they stream in
+    model = genai.GenerativeModel("gemini-1.5-flash")
+    output_file = 'generated_questions.tex'  # You can name the file as needed
+    metrics = write_to_latex(output_file, model, prompt)
+
+    # Print confirmation and location of the saved file
+    print(f"LaTeX formatted questions saved to {output_file} ({metrics.summary()})")
@@ -0,0 +1,13 @@
+import hashlib
+
+# Content hashes of local files, used to key caches and upload registries by what a file holds
+# rather than by its path.
+
+
+# SHA-256 of a file, read in chunks so large videos and PDFs are never loaded whole
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+import time
+
+import google.generativeai as genai
+
+from file_hash import file_sha256
+from rate_limiter import FileLock
+from tracing import span
+
+# Registry of files already uploaded with genai.upload_file.
+# Entries are keyed by the SHA-256 of the local file and remember the remote file name and its expiry,
+# so running a script again on the same media reuses the existing upload instead of sending it again.
+# The registry is shared by every script, so it is read and rewritten under a file lock held across processes.
+REGISTRY_PATH = os.environ.get("GEMINI_UPLOAD_REGISTRY", os.path.join(".cache", "gemini_uploads.json"))
+
+# Uploaded files are deleted by the service after 48 hours; used when the response carries no expiry
+DEFAULT_LIFETIME = 47 * 3600
+# Uploads this close to expiring are replaced rather than reused
+EXPIRY_MARGIN = 10 * 60
+
+_lock = threading.Lock()
+
+
+# Lock held (in this process and across processes) while the registry is read or updated
+def _registry_lock():
+    directory = os.path.dirname(REGISTRY_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return FileLock(f"{REGISTRY_PATH}.lock")
+
+
+def _load_registry():
+    if os.path.exists(REGISTRY_PATH):
+        with open(REGISTRY_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def _save_registry(registry):
+    directory = os.path.dirname(REGISTRY_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{REGISTRY_PATH}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(registry, f, indent=4)
+    os.replace(temp_path, REGISTRY_PATH)
+
+
+def _expiry_timestamp(remote_file):
+    expiration_time = getattr(remote_file, "expiration_time", None)
+    if expiration_time is not None and hasattr(expiration_time, "timestamp"):
+        return expiration_time.timestamp()
+    return time.time() + DEFAULT_LIFETIME
+
+
+# Look up a previous upload of the same content and check that it still exists remotely
+def find_upload(file_path, digest=None):
+    digest = digest or file_sha256(file_path)
+    with _lock, _registry_lock():
+        entry = _load_registry().get(digest)
+    if not entry or entry["expires_at"] <= time.time() + EXPIRY_MARGIN:
+        return None
+    try:
+        remote_file = genai.get_file(entry["name"])
+    except Exception:
+        return None
+    if remote_file.state.name == "FAILED":
+        return None
+    return remote_file
+
+
+# Drop-in replacement for genai.upload_file that skips the upload when the content is already there
+def upload_file_cached(file_path, **kwargs):
+    digest = file_sha256(file_path)
+    remote_file = find_upload(file_path, digest)
+    if remote_file is not None:
+        return remote_file
+
+    with span("upload", path=file_path, bytes=os.path.getsize(file_path)):
+        remote_file = genai.upload_file(file_path, **kwargs)
+    with _lock, _registry_lock():
+        registry = _load_registry()
+        registry[digest] = {
+            "name": remote_file.name,
+            "path": file_path,
+            "expires_at": _expiry_timestamp(remote_file),
+        }
+        _save_registry(registry)
+    return remote_file
+
+
+# Ask several prompts about one uploaded file in a single chat session.
+# The file is attached to the first message only; later prompts are follow-ups in the same chat.
+def ask_about_file(model, remote_file, prompts):
+    chat = model.start_chat()
+    answers = []
+    for index, prompt in enumerate(prompts):
+        content = [prompt, remote_file] if index == 0 else prompt
+        answers.append(chat.send_message(content).text)
+    return answers
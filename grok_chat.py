@@ -0,0 +1,21 @@
+import os
+import json
+import dotenv
+
+# Settings and helpers shared by the Grok chatbot servers (xai.py with Flask, xai_async.py with Quart),
+# so either one can be run without importing the other.
+
+# Load environment variables
+dotenv.load_dotenv()
+
+XAI_API_KEY = os.getenv("XAI_API_KEY")
+
+MODEL_NAME = "grok-beta"
+SYSTEM_PROMPT = "You are Grok, One of the best AI assistants in the world."
+
+# Minimum time between two renders of the unfinished tail of a streamed answer (raw tokens are always sent immediately)
+STREAM_RENDER_INTERVAL = 0.1
+
+# Format one Server-Sent Event
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from email.utils import parsedate_to_datetime
+
+from tracing import span
+
+# Concurrent page fetching with an on-disk HTTP cache.
+# Pages are fetched over one pooled httpx.AsyncClient, at most CRAWL_CONCURRENCY at a time. Every response
+# is stored on disk with its ETag and Last-Modified, and the next fetch of the same URL sends them back
+# (If-None-Match / If-Modified-Since), so a page that hasn't changed costs a 304 with no body. Pages still
+# fresh under their Cache-Control max-age are not requested at all.
+#
+# Environment variables:
+#   HTTP_CACHE_DIR     where responses are stored (default .cache/http)
+#   CRAWL_CONCURRENCY  requests in flight at once (default 8)
+HTTP_CACHE_DIR = os.environ.get("HTTP_CACHE_DIR", os.path.join(".cache", "http"))
+CRAWL_CONCURRENCY = int(os.environ.get("CRAWL_CONCURRENCY", "8"))
+
+USER_AGENT = "Mozilla/5.0 (compatible; exam-question-scraper)"
+TIMEOUT = 30.0
+# Attempts for connection errors and 429/5xx answers, with jittered exponential backoff between them
+ATTEMPTS = 3
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class Page:
+    __slots__ = ("url", "status", "body", "headers", "source")
+
+    def __init__(self, url, status, body, headers, source):
+        self.url = url
+        self.status = status
+        self.body = body
+        self.headers = headers
+        # "network", "revalidated" (304) or "fresh" (served from disk without a request)
+        self.source = source
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+
+def _max_age(headers):
+    match = re.search(r"max-age=(\d+)", headers.get("cache-control", ""))
+    return int(match.group(1)) if match else 0
+
+
+class HttpCache:
+    def __init__(self, directory=HTTP_CACHE_DIR):
+        self.directory = directory
+
+    def _paths(self, url):
+        digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        shard = os.path.join(self.directory, digest[:2])
+        return os.path.join(shard, f"{digest}.json"), os.path.join(shard, f"{digest}.body")
+
+    # Function to load the stored response for url as (metadata, body), or None
+    def get(self, url):
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url or meta.get("size") != len(body):
+            return None
+        return meta, body
+
+    def put(self, url, status, headers, body):
+        if "no-store" in headers.get("cache-control", ""):
+            return
+        meta_path, body_path = self._paths(url)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        meta = {
+            "url": url,
+            "status": status,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "content_type": headers.get("content-type"),
+            "fetched_at": time.time(),
+            "max_age": _max_age(headers),
+            "size": len(body),
+        }
+        # Body first, then metadata: a crash in between leaves a size mismatch, which reads as a miss
+        for path, data, mode in ((body_path, body, "wb"), (meta_path, json.dumps(meta), "w")):
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, mode, **({} if mode == "wb" else {"encoding": "utf-8"})) as f:
+                f.write(data)
+            os.replace(temp_path, path)
+
+    # A 304 confirms the stored copy; its headers may extend the freshness
+    def touch(self, url, meta, headers):
+        meta["fetched_at"] = time.time()
+        meta["max_age"] = _max_age(headers) or meta.get("max_age", 0)
+        meta_path, _ = self._paths(url)
+        temp_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(temp_path, meta_path)
+
+
+def conditional_headers(meta):
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+
+def _retry_delay(response, attempt):
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return random.uniform(0, 2 ** attempt)
+
+
+# Function to fetch one URL through the cache with a shared AsyncClient
+async def fetch_page(client, cache, url):
+    with span("http.get", url=url) as current:
+        stored = await asyncio.to_thread(cache.get, url)
+        if stored is not None:
+            meta, body = stored
+            if time.time() - meta["fetched_at"] < meta.get("max_age", 0):
+                current.set(cache="fresh", status=meta["status"])
+                return Page(url, meta["status"], body, {"content-type": meta.get("content_type")}, "fresh")
+        headers = conditional_headers(stored[0]) if stored is not None else {}
+
+        for attempt in range(ATTEMPTS):
+            response = None
+            try:
+                response = await client.get(url, headers=headers)
+            except Exception:
+                if attempt == ATTEMPTS - 1:
+                    raise
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                break
+            if attempt == ATTEMPTS - 1:
+                break
+            await asyncio.sleep(_retry_delay(response, attempt))
+
+        if response.status_code == 304 and stored is not None:
+            meta, body = stored
+            await asyncio.to_thread(cache.touch, url, meta, response.headers)
+            current.set(cache="revalidated", status=304)
+            return Page(url, meta["status"], body, response.headers, "revalidated")
+
+        body = response.content
+        current.set(cache="miss", status=response.status_code, bytes=len(body))
+        if response.status_code == 200:
+            await asyncio.to_thread(cache.put, url, response.status_code, response.headers, body)
+        return Page(url, response.status_code, body, response.headers, "network")
+
+
+# Function to fetch many URLs concurrently; yields (url, Page or exception) as each one finishes
+async def fetch_pages(urls, concurrency=CRAWL_CONCURRENCY, cache=None):
+    import httpx
+
+    cache = cache or HttpCache()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(
+        limits=limits,
+        timeout=TIMEOUT,
+        follow_redirects=True,
+        headers={"User-Agent": USER_AGENT},
+    ) as client:
+        slots = asyncio.Semaphore(concurrency)
+
+        async def fetch(url):
+            async with slots:
+                try:
+                    return url, await fetch_page(client, cache, url)
+                except Exception as e:
+                    return url, e
+
+        for task in asyncio.as_completed([fetch(url) for url in dict.fromkeys(urls)]):
+            yield await task
@@ -1,5 +1,4 @@
 import os
-from azure.ai.inference import ChatCompletionsClient
 from azure.ai.inference.models import (
     SystemMessage,
     UserMessage,
@@ -8,23 +7,21 @@ from azure.ai.inference.models import (
     ImageUrl,
     ImageDetailLevel,
 )
-from azure.core.credentials import AzureKeyCredential
+from clients import GITHUB_MODELS_ENDPOINT, get_chat_client
 
 from dotenv import load_dotenv
+from response_cache import cached_complete
 
 load_dotenv()
 
 token = os.getenv("GITHUB_TOKEN")
-endpoint = "https://models.inference.ai.azure.com"
+endpoint = GITHUB_MODELS_ENDPOINT
 model_name = "o1"
 
-client = ChatCompletionsClient(
-    endpoint=endpoint,
-    credential=AzureKeyCredential(token),
-    api_version="2024-12-01-preview",
-)
+client = get_chat_client(endpoint, api_version="2024-12-01-preview", model=model_name, token=token)
 
-response = client.complete(
+response = cached_complete(
+    client,
     messages=[
         {
             "role": "developer",
@@ -1,24 +1,32 @@
 import os
-from azure.ai.inference import ChatCompletionsClient
 from azure.ai.inference.models import SystemMessage, UserMessage, AssistantMessage
-from azure.core.credentials import AzureKeyCredential
+from biometrics_series import BiometricsStore
+from chat_sessions import summary_prompt
+from clients import GITHUB_MODELS_ENDPOINT, get_chat_client
+from conversation_compactor import ConversationCompactor
+from model_router import get_router
+from profile_store import ProfileManager
+from rate_limiter import BATCH_PRIORITY, INTERACTIVE_PRIORITY
+from response_cache import cached_complete
+from tool_registry import ToolError, ToolRegistry
+from tracing import span
+from provider_directory import ProviderDirectory
 import datetime
 import json
 import time
 
 # Load environment variables
-endpoint = "https://models.inference.ai.azure.com"
+endpoint = GITHUB_MODELS_ENDPOINT
 model_name = "Meta-Llama-3.1-405B-Instruct"
+# Model class the chat turns are routed in: every member must support tool calls (see model_router)
+TOOL_MODEL_CLASS = "github-tools"
 token = os.environ.get("GITHUB_TOKEN")
 
 if not token:
     raise ValueError("Please set the GITHUB_TOKEN environment variable.")
 
 # Initialize the ChatCompletionsClient
-client = ChatCompletionsClient(
-    endpoint=endpoint,
-    credential=AzureKeyCredential(token),
-)
+client = get_chat_client(endpoint, model=model_name, token=token)
 
 # Helper function for loading data from json
 def load_data(file_path):
@@ -33,50 +41,95 @@ def save_data(file_path, data):
         json.dump(data, f, indent=4)
 
 # Initialize Healthcare professionals data
+# The JSON file is the editable source; lookups go through an indexed SQLite copy that is
+# rebuilt only when the JSON file changes. Only professionals with a latitude and longitude are
+# found by location searches (there is no geocoder for the free-text addresses).
 healthcare_professionals_file = "healthcare_professionals.json"
-healthcare_professionals = load_data(healthcare_professionals_file)
-if not healthcare_professionals:
+if not os.path.exists(healthcare_professionals_file):
     healthcare_professionals = {
-        "1": {"name": "Dr. John Smith", "specialty": "General Physician", "location" : "123 Main Street", "phone" : "555-1234"},
-        "2": {"name": "Dr. Jane Doe", "specialty": "Physiotherapist", "location" : "456 Oak Street", "phone" : "555-5678"},
-        "3": {"name": "Dr. Michael Brown", "specialty": "Cardiologist", "location" : "789 Pine Street", "phone" : "555-9012"}
+        "1": {"name": "Dr. John Smith", "specialty": "General Physician", "location" : "123 Main Street", "phone" : "555-1234", "latitude": 40.7484, "longitude": -73.9857},
+        "2": {"name": "Dr. Jane Doe", "specialty": "Physiotherapist", "location" : "456 Oak Street", "phone" : "555-5678", "latitude": 40.7306, "longitude": -73.9866},
+        "3": {"name": "Dr. Michael Brown", "specialty": "Cardiologist", "location" : "789 Pine Street", "phone" : "555-9012", "latitude": 40.7580, "longitude": -73.9855}
     }
     save_data(healthcare_professionals_file, healthcare_professionals)
-
-class UserProfile:
-    def __init__(self, user_id, name = None):
-        self.user_id = user_id
-        self.name = name
-        self.medical_history = {}
-        self.dietary_preferences = {}
-        self.activity_levels = {}
-        self.goals = {}
-        self.progress = {}
-        self.calendar = {}
-        self.biometrics = {}
-        self.soundscape = None
-
-    def to_json(self):
-        return json.dumps(self.__dict__)
-    def from_json(self, data):
-        self.__dict__.update(json.loads(data))
+healthcare_directory = ProviderDirectory()
+healthcare_directory.sync_from_json(healthcare_professionals_file)
 
 class AIHealthEngine:
-    def __init__(self, client, model_name):
+    def __init__(self, client, model_name, biometrics=None):
         self.client = client
         self.model_name = model_name
+        # Biometric readings of the current user; a trend summary is added to every prompt
+        self.biometrics = biometrics
+        self.user_id = None
+        # Profile of the current user; biometric readings recorded by the tools also update it
+        self.profile = None
+        self.tools = ToolRegistry()
+        self._register_tools()
         self.system_message = SystemMessage(
             content="You are a helpful health and wellness assistant. Provide personalized guidance on diet, exercise, and stress management. Analyze both text queries and image descriptions to offer appropriate advice. Ask follow up questions if needed to provide better responses. Ask questions if you need any clarification. Maintain context from previous interactions. You should strive to make use of external tools wherever possible."
         )
-        self.messages = [self.system_message]
+        # Recent turns are kept verbatim; older ones are summarized in the background so prompts stay bounded
+        self.history = ConversationCompactor(
+            self._summarize_history,
+            lambda summary: SystemMessage(content=f"Summary of the earlier conversation: {summary}"),
+        )
+
+    # Messages sent with the next request: system prompt, biometric trends, summary of older turns, recent turns
+    @property
+    def messages(self):
+        messages = [self.system_message]
+        if self.biometrics is not None and self.user_id:
+            trends = self.biometrics.summary(self.user_id)
+            if trends:
+                messages.append(SystemMessage(content=f"The user's recent biometric readings:\n{trends}"))
+        return messages + self.history.messages()
+
+    def _summarize_history(self, previous_summary, evicted):
+        with span("chat.summary", model=self.model_name):
+            response = cached_complete(
+                self.client,
+                bypass=True,
+                priority=BATCH_PRIORITY,
+                messages=summary_prompt(previous_summary, evicted),
+                model=self.model_name,
+                temperature=0.2,
+            )
+        return response.choices[0].message.content
+
+    # Function to make the model requests of one turn. The first is sent to the fastest tool-capable model
+    # and hedged past its p95; the turn's later tool rounds stay on the model that answered it, so one model
+    # sees the whole exchange. Only the request is duplicated; tool calls run once, on the winning answer.
+    def _turn_completer(self):
+        router = get_router(self.model_name, group=TOOL_MODEL_CLASS)
+        chosen = []
+
+        def complete(**kwargs):
+            model, response = router.call_model(
+                lambda model: cached_complete(self.client, bypass=True, priority=INTERACTIVE_PRIORITY, **dict(kwargs, model=model)),
+                hedge=True,
+                models=chosen or None,
+            )
+            chosen[:] = [model]
+            return response
+        return complete
 
     def get_response(self, user_message):
-      self.messages.append(UserMessage(content=user_message))
+      self.history.append(UserMessage(content=user_message))
       try:
-        response = client.complete(messages=self.messages, model=self.model_name, temperature=0.7)
+        # The model may call the registered tools (several at once, over several rounds) before answering;
+        # tool call rounds are sent with this request only, the history keeps the final answer
+        with span("chat.turn", model=self.model_name):
+          response = self.tools.complete(
+              self.client,
+              self.messages,
+              complete=self._turn_completer(),
+              model=self.model_name,
+              temperature=0.7,
+          )
         if response.choices:
           ai_response = response.choices[0].message.content
-          self.messages.append(AssistantMessage(content=ai_response))
+          self.history.append(AssistantMessage(content=ai_response))
           return ai_response
         else:
           return None
@@ -89,57 +142,96 @@ class AIHealthEngine:
       image_description = input("Image Description: ")
       return f"Image description: {image_description}. Please take this into consideration with your response"
 
+    # Tools the model can call; definitions and argument checks come from the method signatures
+    def _register_tools(self):
+        self.tools.register(
+            self._get_calendar_entries,
+            name="get_calendar",
+            description="Get the user's calendar entries between two dates",
+            param_descriptions={"start_date": "First date, YYYY-MM-DD", "end_date": "Last date, YYYY-MM-DD"},
+            # The calendar changes with add_calendar_entry, so a remembered answer would go stale
+            memoize=False,
+        )
+        self.tools.register(
+            self._add_calendar_entry,
+            name="add_calendar_entry",
+            description="Add an activity to the user's calendar",
+            param_descriptions={"date": "Date, YYYY-MM-DD", "time": "Time, HH:MM", "activity": "Activity to schedule"},
+            memoize=False,
+        )
+        self.tools.register(
+            self._search_healthcare_professionals,
+            name="search_healthcare_professionals",
+            description="Find healthcare professionals by specialty, by name, or nearest to a location",
+            param_descriptions={
+                "specialty": "Specialty such as Cardiologist",
+                "name": "Full or partial name of the professional",
+                "latitude": "Latitude to search near",
+                "longitude": "Longitude to search near",
+                "limit": "Maximum number of professionals returned by a location search",
+            },
+            memoize=False,
+        )
+        self.tools.register(
+            self._set_biometrics,
+            name="set_biometrics",
+            description="Record a biometric reading for the user, such as weight or blood pressure",
+            param_descriptions={"type": "Kind of reading, e.g. weight", "value": "Reading, e.g. 72.5 or 120/80"},
+            memoize=False,
+        )
+
     def call_function(self, function_name, parameters):
         print("\nSimulating a function call...")
-        if function_name == "get_calendar":
-            return self._get_calendar_entries(parameters)
-        elif function_name == "add_calendar_entry":
-            return self._add_calendar_entry(parameters)
-        elif function_name == "search_healthcare_professionals":
-           return self._search_healthcare_professionals(parameters)
-        elif function_name == "set_biometrics":
-            return self._set_biometrics(parameters)
-        else:
-            return f"Function '{function_name}' is not supported."
+        try:
+            return self.tools.call(function_name, parameters)
+        except ToolError as e:
+            return str(e)
 
-    def _get_calendar_entries(self, parameters):
+    def _get_calendar_entries(self, start_date=None, end_date=None):
         # For simplicity, we assume user is always current.
         print("getting current user.")
-        start_date = parameters.get("start_date")
-        end_date = parameters.get("end_date")
         if start_date and end_date:
           return f"Getting calendar for {start_date} to {end_date}"
         else:
             return "Start and end dates not provided"
-    def _add_calendar_entry(self, parameters):
-         date = parameters.get("date")
-         time = parameters.get("time")
-         activity = parameters.get("activity")
+    def _add_calendar_entry(self, date=None, time=None, activity=None):
          if date and time and activity:
             return f"Adding entry on {date} at {time} for {activity}"
          else:
             return f"Could not add calendar entry, please specify date, time and activity."
-    def _search_healthcare_professionals(self, parameters):
-         specialty = parameters.get("specialty")
-         if specialty:
-            results = [professional for id, professional in healthcare_professionals.items() if professional["specialty"].lower() == specialty.lower()]
-            if results:
-              return f"Found matching healthcare professionals: {results}"
-            else:
-              return "Could not find matching healthcare professionals"
+    def _search_healthcare_professionals(self, specialty=None, name=None, latitude: float = None, longitude: float = None, limit: int = 5):
+         if latitude is not None and longitude is not None:
+            results = healthcare_directory.nearest(latitude, longitude, k=limit, specialty=specialty)
+         elif name:
+            results = healthcare_directory.search_name(name)
+            if specialty:
+               results = [professional for professional in results if professional.get("specialty", "").lower() == specialty.lower()]
+         elif specialty:
+            results = healthcare_directory.by_specialty(specialty)
          else:
             return "Please enter a specialty"
-    def _set_biometrics(self, parameters):
-        type = parameters.get("type")
-        value = parameters.get("value")
-        user_id = parameters.get("user_id")
+         if results:
+           return f"Found matching healthcare professionals: {results}"
+         else:
+           return "Could not find matching healthcare professionals"
+    # Always writes to the current session's user; the user id is deliberately not a tool parameter
+    def _set_biometrics(self, type=None, value=None):
         if type and value:
-            return f"Setting biometrics for {user_id} with type {type} and value {value}"
+            if self.biometrics is not None and not self.biometrics.record(self.user_id, type, value):
+                return f"Could not read a number from biometric value {value}"
+            if self.profile is not None:
+                self.profile.set_biometric(type, value)
+            return f"Setting biometrics for {self.user_id} with type {type} and value {value}"
         else:
              return "Please specify biometrics type and value."
 
     def clear_history(self):
-      self.messages = [self.system_message]
+      self.history.reset()
+
+    # Stop the background workers of the conversation summary and the tools
+    def close(self):
+        self.history.close()
+        self.tools.close()
 
     def sentiment_analysis(self, user_message):
         # Placeholder for sentiment analysis functionality.
@@ -236,10 +328,8 @@ def handle_input(ai_engine, user_profile):
     elif choice == "6":
         type = input("Enter biometric type (weight, blood pressure, etc.): ")
         value = input("Enter biometric value: ")
-        parameters = { "type" : type, "value": value, "user_id": user_profile.user_id }
+        parameters = { "type" : type, "value": value }
         response = ai_engine.call_function("set_biometrics", parameters)
-        user_profile.biometrics[type] = value
-        save_data(f"{user_profile.user_id}_profile.json", user_profile.to_json())
         format_output(response)
     elif choice == "7":
         module_name = input("Enter the name of the educational module: (basic_nutrition, stress_management, basic_exercise) ")
@@ -253,8 +343,7 @@ def handle_input(ai_engine, user_profile):
     elif choice == "9":
         soundscape_name = input("Enter soundscape to play (forest, beach, rain): ")
         sound_response = ai_engine.play_soundscape(soundscape_name)
-        user_profile.soundscape = soundscape_name
-        save_data(f"{user_profile.user_id}_profile.json", user_profile.to_json())
+        user_profile.set_soundscape(soundscape_name)
         format_output(sound_response)
 
     elif choice == "10":
@@ -262,26 +351,35 @@ def handle_input(ai_engine, user_profile):
         print("Conversation History Cleared.")
     elif choice == "11":
         print("Exiting the program...")
-        save_data(f"{user_profile.user_id}_profile.json", user_profile.to_json())
         return False
     else:
         print("Invalid choice, please choose a valid option")
     return True
 
 
-# Initialize user profile and AI engine
-user_profile_file = "user123_profile.json"
-if os.path.exists(user_profile_file):
-    with open(user_profile_file, "r") as f:
-        user_profile = UserProfile(user_id="user123")
-        user_profile.from_json(f.read())
-else:
-    user_profile = UserProfile(user_id="user123", name="Test User")
-ai_engine = AIHealthEngine(client, model_name)
-
-# Main loop
-while True:
-    if not handle_input(ai_engine, user_profile):
-        break
-
-client.close()
\ No newline at end of file
+# Main program (guarded so the engine can be imported, e.g. by benchmark.py)
+if __name__ == "__main__":
+    # Initialize user profiles and AI engine
+    # Profiles are loaded on demand and changes are appended to each profile's journal as they happen (see profile_store)
+    user_id = "user123"
+    profiles = ProfileManager()
+    # Every biometric reading is kept as a time series (see biometrics_series); the profile holds the latest value
+    biometrics = BiometricsStore()
+    ai_engine = AIHealthEngine(client, model_name, biometrics)
+    ai_engine.user_id = user_id
+
+    # Main loop
+    while True:
+        with profiles.session(user_id, name="Test User") as user_profile:
+            ai_engine.profile = user_profile
+            try:
+                keep_running = handle_input(ai_engine, user_profile)
+            finally:
+                ai_engine.profile = None
+        if not keep_running:
+            break
+
+    ai_engine.close()
+    profiles.close()
+
+    client.close()
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import markdown2
+
+from tracing import span
+
+# Markdown rendering for the chatbot.
+# render_markdown keeps a bounded LRU of rendered HTML keyed by the content hash, so identical answers
+# are only rendered once. IncrementalMarkdownRenderer is used for streamed answers: blocks that can no
+# longer change are rendered once, and only the trailing unfinished block is re-rendered on each update.
+# A block that uses a reference-style link ([text][label]) whose definition hasn't arrived yet is not final:
+# it is held back (and shown as part of the tail) until the definition streams in or the answer ends.
+MARKDOWN_EXTRAS = ["fenced-code-blocks", "tables"]
+CACHE_SIZE = int(os.environ.get("MARKDOWN_CACHE_SIZE", "512"))
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def render_markdown(text):
+    key = hashlib.sha256(text.encode("utf-8")).digest()
+    with _cache_lock:
+        html = _cache.get(key)
+        if html is not None:
+            _cache.move_to_end(key)
+            return html
+
+    with span("render", chars=len(text)):
+        html = markdown2.markdown(text, extras=MARKDOWN_EXTRAS)
+    with _cache_lock:
+        _cache[key] = html
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return html
+
+
+# Lines that may continue the block before them even after a blank line (list items, indented content)
+_CONTINUATION = re.compile(r"^(\s|[-*+]\s|\d+[.)]\s)")
+_FENCE = re.compile(r"^\s{0,3}(```|~~~)")
+# Link reference definitions ("[1]: http://example.com") and reference-style links ("[text][1]", "[text][]")
+_DEFINITION = re.compile(r"^\s{0,3}\[([^\]]+)\]:\s*\S")
+_REFERENCE = re.compile(r"\[([^\]]*)\]\[([^\]]*)\]")
+# Code, where brackets are not links
+_CODE = re.compile(r"^\s{0,3}(```|~~~).*?(^\s{0,3}\1|\Z)|`[^`\n]*`", re.MULTILINE | re.DOTALL)
+
+
+def _label(text):
+    return " ".join(text.lower().split())
+
+
+# Whether text is blank or holds nothing but link reference definitions
+def _only_definitions(text):
+    return all(not line.strip() or _DEFINITION.match(line) for line in text.splitlines())
+
+
+class IncrementalMarkdownRenderer:
+    def __init__(self):
+        self.text = ""
+        # Offset where the finished part of the text ends and the unfinished tail begins
+        self._stable_end = 0
+        # Offset of the first line that has not been scanned yet
+        self._scan_pos = 0
+        self._in_fence = False
+        self._after_blank = False
+        # Link reference definition lines seen so far, by label
+        self._definitions = {}
+
+    # Add streamed text. Returns the html of blocks that just became final (possibly empty), to be appended
+    # to what was returned before; tail_html() renders the unfinished rest whenever it needs to be shown.
+    def feed(self, delta):
+        self.text += delta
+        boundary = self._find_boundary()
+        finished = ""
+        if boundary > self._stable_end and not self._unresolved(self.text[self._stable_end:boundary]):
+            finished = self._render_block(self.text[self._stable_end:boundary])
+            self._stable_end = boundary
+        return finished
+
+    # The tail changes on every update, so it bypasses the cache rather than flooding it
+    def tail_html(self):
+        tail = self.text[self._stable_end:]
+        if _only_definitions(tail):
+            return ""
+        with span("render", chars=len(tail), tail=True):
+            return markdown2.markdown(self._with_definitions(tail), extras=MARKDOWN_EXTRAS)
+
+    # Whether text uses a reference-style link with no definition so far
+    def _unresolved(self, text):
+        for text_label, label in _REFERENCE.findall(_CODE.sub("", text)):
+            if _label(label or text_label) not in self._definitions:
+                return True
+        return False
+
+    # Definitions render as nothing, so a block of only definitions adds no html (not an empty paragraph)
+    def _render_block(self, block):
+        if _only_definitions(block):
+            return ""
+        return render_markdown(self._with_definitions(block))
+
+    # Blocks are rendered one at a time, so each one gets the definitions that arrived in other blocks
+    def _with_definitions(self, text):
+        if not self._definitions:
+            return text
+        return text + "\n\n" + "\n".join(self._definitions.values()) + "\n"
+
+    # Full rendering of everything received so far
+    def html(self):
+        return render_markdown(self.text)
+
+    # Scan the complete lines received since the last call and return the latest offset at which
+    # a new top-level block starts: a line after a blank line, outside a code fence, that can't
+    # belong to the block before it.
+    def _find_boundary(self):
+        boundary = self._stable_end
+        while True:
+            line_end = self.text.find("\n", self._scan_pos)
+            if line_end == -1:
+                return boundary
+            line = self.text[self._scan_pos:line_end]
+            line_start = self._scan_pos
+            self._scan_pos = line_end + 1
+
+            if not line.strip():
+                if not self._in_fence:
+                    self._after_blank = True
+                continue
+            if self._after_blank and not self._in_fence and not _CONTINUATION.match(line):
+                boundary = line_start
+            if not self._in_fence:
+                definition = _DEFINITION.match(line)
+                if definition:
+                    self._definitions[_label(definition.group(1))] = line
+            self._after_blank = False
+            if _FENCE.match(line):
+                self._in_fence = not self._in_fence
@@ -0,0 +1,456 @@
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Local stand-in for the model APIs used by the scripts, for benchmarks and offline runs.
+# Speaks enough of three APIs to exercise the real client code paths:
+#   Azure AI Inference (GitHub Models)  POST <base>/chat/completions            (also with stream=true)
+#   OpenAI-compatible (xAI)             POST <base>/v1/chat/completions         (also with stream=true)
+#   Gemini REST                         POST /v1beta/models/<model>:generateContent
+#                                       POST /v1beta/models/<model>:streamGenerateContent (JSON array or ?alt=sse)
+#                                       POST /upload/v1beta/files, GET/DELETE /v1beta/files/<id>, GET /v1beta/files
+# Responses are filler text. Latency before the first token is drawn from a configurable distribution,
+# tokens follow at a configurable rate, and a share of requests can be answered with 429 + Retry-After.
+# Chat requests that offer tools can be answered with tool calls (arguments are made up from the schema).
+# GET /mock/stats returns request counters; POST /mock/config changes the configuration of a running server.
+#
+# Point the scripts at it with GITHUB_MODELS_ENDPOINT=http://127.0.0.1:<port>, XAI_BASE_URL=http://127.0.0.1:<port>/v1
+# and GEMINI_API_ENDPOINT=http://127.0.0.1:<port> (see clients.py).
+
+FILLER = (
+    "the quick brown fox jumps over the lazy dog while a steady breeze moves across the open field "
+    "and the river keeps its slow course toward the distant sea"
+).split()
+
+
+# Latency distributions, written as "fixed:MS", "uniform:LOW_MS,HIGH_MS", "normal:MEAN_MS,STDDEV_MS"
+# or "lognormal:MEDIAN_MS,SIGMA". Samples are in seconds.
+def parse_distribution(spec):
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",") if value]
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0] / 1000
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if kind == "normal" and len(values) == 2:
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1])) / 1000
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1]) / 1000
+    raise ValueError(f"Invalid latency distribution: {spec!r}")
+
+
+class MockConfig:
+    FIELDS = (
+        "latency",
+        "tokens_per_second",
+        "output_tokens",
+        "chunk_tokens",
+        "error_rate",
+        "retry_after",
+        "tool_call_rate",
+        "tool_calls_per_turn",
+    )
+
+    def __init__(self, latency="lognormal:300,0.4", tokens_per_second=80.0, output_tokens=64, chunk_tokens=1,
+                 error_rate=0.0, retry_after=1.0, tool_call_rate=0.0, tool_calls_per_turn=1, seed=None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.chunk_tokens = chunk_tokens
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.tool_call_rate = tool_call_rate
+        self.tool_calls_per_turn = tool_calls_per_turn
+        self.sample_latency = parse_distribution(latency)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def update(self, values):
+        for field in self.FIELDS:
+            if field in values:
+                setattr(self, field, values[field])
+        self.sample_latency = parse_distribution(self.latency)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def draw(self):
+        with self.lock:
+            return self.sample_latency(self.rng), self.rng.random(), self.rng.random()
+
+
+def filler_tokens(count, offset=0):
+    return [FILLER[(offset + i) % len(FILLER)] + " " for i in range(count)]
+
+
+# Arguments for a tool call, made up from the tool's JSON schema; index makes parallel calls differ
+def fake_arguments(schema, index=0):
+    arguments = {}
+    properties = (schema or {}).get("properties", {})
+    for name in (schema or {}).get("required", list(properties)):
+        kind = properties.get(name, {}).get("type", "string")
+        values = {"integer": index + 1, "number": index + 1.0, "boolean": True, "array": [], "object": {}}
+        arguments[name] = values.get(kind, f"test {index + 1}")
+    return arguments
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, MockHandler)
+        self.config = config
+        self.files = {}
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats = {}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    # Request helpers
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _json_body(self):
+        body = self._body()
+        try:
+            return json.loads(body or b"{}")
+        except ValueError:
+            return {}
+
+    def _send_json(self, status, data, headers=None):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    # Sleep for the first-token latency; answers 429 instead when the draw says so. Returns False if rate limited.
+    def _admit(self, route):
+        config = self.server.config
+        latency, error_draw, _ = config.draw()
+        self.server.count(route)
+        if error_draw < config.error_rate:
+            self.server.count(f"{route}:429")
+            self._send_json(
+                429,
+                {"error": {"code": "RateLimitReached", "message": "Rate limit exceeded (mock)"}},
+                {"Retry-After": f"{config.retry_after:g}"},
+            )
+            return False
+        time.sleep(latency)
+        return True
+
+    # Yields groups of chunk_tokens tokens, spaced to match tokens_per_second
+    def _paced_tokens(self, tokens):
+        config = self.server.config
+        size = max(1, int(config.chunk_tokens))
+        interval = size / config.tokens_per_second if config.tokens_per_second else 0
+        next_time = time.perf_counter()
+        for start in range(0, len(tokens), size):
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            next_time += interval
+            yield "".join(tokens[start:start + size])
+
+    def _generation_time(self, token_count):
+        rate = self.server.config.tokens_per_second
+        return token_count / rate if rate else 0.0
+
+    # Routing
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/mock/stats":
+            with self.server.stats_lock:
+                stats = dict(self.server.stats)
+            return self._send_json(200, {"requests": stats, "config": self.server.config.to_dict()})
+        match = re.fullmatch(r"/v1beta/(files/[^/]+)", path)
+        if match:
+            file = self.server.files.get(match.group(1))
+            if file is None:
+                return self._send_json(404, {"error": {"code": 404, "message": "File not found", "status": "NOT_FOUND"}})
+            return self._send_json(200, file)
+        if path == "/v1beta/files":
+            return self._send_json(200, {"files": list(self.server.files.values())})
+        self._send_json(404, {"error": {"message": f"Unknown route {path}"}})
+
+    def do_DELETE(self):
+        path = urlparse(self.path).path
+        match = re.fullmatch(r"/v1beta/(files/[^/]+)", path)
+        if match and self.server.files.pop(match.group(1), None) is not None:
+            return self._send_json(200, {})
+        self._send_json(404, {"error": {"code": 404, "message": "File not found", "status": "NOT_FOUND"}})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        path = url.path
+        if path == "/mock/config":
+            self.server.config.update(self._json_body())
+            return self._send_json(200, self.server.config.to_dict())
+        if path == "/mock/reset":
+            self._body()
+            self.server.reset_stats()
+            return self._send_json(200, {})
+        if path.endswith("/chat/completions"):
+            return self._chat_completions(path.startswith("/v1/"))
+        match = re.fullmatch(r"/v1beta/models/([^:]+):(generateContent|streamGenerateContent)", path)
+        if match:
+            return self._generate_content(match.group(1), match.group(2) == "streamGenerateContent", parse_qs(url.query))
+        if path.startswith("/upload/v1beta/files"):
+            return self._upload_file()
+        self._body()
+        self._send_json(404, {"error": {"message": f"Unknown route {path}"}})
+
+    # Chat completions (Azure AI Inference and OpenAI share the shape)
+
+    def _tool_calls(self, request):
+        config = self.server.config
+        tools = request.get("tools") or []
+        messages = request.get("messages") or []
+        last_role = messages[-1].get("role") if messages and isinstance(messages[-1], dict) else None
+        if not tools or last_role == "tool":
+            return None
+        _, _, tool_draw = config.draw()
+        if tool_draw >= config.tool_call_rate:
+            return None
+        calls = []
+        for index in range(max(1, int(config.tool_calls_per_turn))):
+            function = tools[index % len(tools)].get("function", {})
+            calls.append({
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": function.get("name"), "arguments": json.dumps(fake_arguments(function.get("parameters"), index))},
+            })
+        return calls
+
+    def _chat_completions(self, openai_style):
+        request = self._json_body()
+        route = "openai" if openai_style else "azure-inference"
+        if not self._admit(route):
+            return
+        config = self.server.config
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:16]}"
+        created = int(time.time())
+        model = request.get("model") or "mock-model"
+        prompt_tokens = len(json.dumps(request.get("messages", []))) // 4 + 1
+        tool_calls = self._tool_calls(request)
+        tokens = [] if tool_calls else filler_tokens(int(config.output_tokens), offset=prompt_tokens)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)}
+        finish_reason = "tool_calls" if tool_calls else "stop"
+
+        if not request.get("stream"):
+            time.sleep(self._generation_time(len(tokens)))
+            message = {"role": "assistant", "content": None if tool_calls else "".join(tokens).strip()}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            data = {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": finish_reason, "message": message}],
+                "usage": usage,
+            }
+            return self._send_json(200, data)
+
+        def chunk(delta, finish=None, with_usage=False):
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            if with_usage:
+                data["usage"] = usage
+            return f"data: {json.dumps(data)}\n\n"
+
+        self._start_chunked("text/event-stream")
+        self._write_chunk(chunk({"role": "assistant", "content": ""}))
+        if tool_calls:
+            self._write_chunk(chunk({"tool_calls": [dict(call, index=i) for i, call in enumerate(tool_calls)]}))
+        for text in self._paced_tokens(tokens):
+            self._write_chunk(chunk({"content": text}))
+        self._write_chunk(chunk({}, finish_reason, with_usage=True))
+        self._write_chunk("data: [DONE]\n\n")
+        self._end_chunked()
+
+    # Gemini
+
+    def _generate_content(self, model, stream, query):
+        request = self._json_body()
+        if not self._admit("gemini"):
+            return
+        config = self.server.config
+        prompt_text = json.dumps(request.get("contents", []))
+        prompt_tokens = len(prompt_text) // 4 + 1
+        generation_config = request.get("generationConfig") or request.get("generation_config") or {}
+        mime_type = generation_config.get("responseMimeType") or generation_config.get("response_mime_type")
+        if mime_type == "application/json":
+            # Structured output: a JSON array with as many strings as the prompt asks for
+            match = re.search(r"exactly (\d+)", prompt_text)
+            count = int(match.group(1)) if match else 1
+            per_item = max(1, int(config.output_tokens) // count)
+            text = json.dumps(["".join(filler_tokens(per_item, offset=i)).strip() for i in range(count)])
+            tokens = re.findall(r"\S+\s*", text)
+        else:
+            tokens = filler_tokens(int(config.output_tokens), offset=prompt_tokens)
+
+        def response(text, finished, token_count):
+            candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+            if finished:
+                candidate["finishReason"] = "STOP"
+            return {
+                "candidates": [candidate],
+                "usageMetadata": {
+                    "promptTokenCount": prompt_tokens,
+                    "candidatesTokenCount": token_count,
+                    "totalTokenCount": prompt_tokens + token_count,
+                },
+                "modelVersion": model,
+            }
+
+        if not stream:
+            time.sleep(self._generation_time(len(tokens)))
+            return self._send_json(200, response("".join(tokens), True, len(tokens)))
+
+        sse = query.get("alt", [""])[0] == "sse"
+        self._start_chunked("text/event-stream" if sse else "application/json")
+        if not sse:
+            self._write_chunk("[")
+        sent = 0
+        groups = list(self._paced_tokens(tokens))
+        for index, text in enumerate(groups):
+            sent += len(re.findall(r"\S+", text))
+            data = json.dumps(response(text, index == len(groups) - 1, sent))
+            if sse:
+                self._write_chunk(f"data: {data}\r\n\r\n")
+            else:
+                self._write_chunk(("," if index else "") + data)
+        if not sse:
+            self._write_chunk("]")
+        self._end_chunked()
+
+    def _upload_file(self):
+        body = self._body()
+        if not self._admit("gemini-files"):
+            return
+        file_id = uuid.uuid4().hex[:12]
+        # Multipart uploads carry the metadata as the first JSON part
+        match = re.search(rb"\{.*?\}\s*\r?\n", body, re.S)
+        metadata = {}
+        if match:
+            try:
+                metadata = json.loads(match.group(0)).get("file", {})
+            except ValueError:
+                metadata = {}
+        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        file = {
+            "name": f"files/{file_id}",
+            "displayName": metadata.get("displayName", file_id),
+            "mimeType": metadata.get("mimeType") or self.headers.get("X-Goog-Upload-Header-Content-Type") or "application/octet-stream",
+            "sizeBytes": str(len(body)),
+            "createTime": now,
+            "updateTime": now,
+            "expirationTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 48 * 3600)),
+            "sha256Hash": "",
+            "uri": f"{self.server.url}/v1beta/files/{file_id}",
+            "state": "ACTIVE",
+        }
+        self.server.files[file["name"]] = file
+        self._send_json(200, {"file": file})
+
+
+# Start a server on a background thread; returns it (server.url, server.config, server.stats) once it is listening
+def start_mock_server(config=None, host="127.0.0.1", port=0):
+    server = MockServer((host, port), config or MockConfig())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock model API server for offline runs and benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:300,0.4", help="time to first token distribution")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--output-tokens", type=int, default=64)
+    parser.add_argument("--chunk-tokens", type=int, default=1, help="tokens per streamed chunk")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--tool-call-rate", type=float, default=0.0)
+    parser.add_argument("--tool-calls-per-turn", type=int, default=1)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        chunk_tokens=args.chunk_tokens,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after,
+        tool_call_rate=args.tool_call_rate,
+        tool_calls_per_turn=args.tool_calls_per_turn,
+        seed=args.seed,
+    )
+    server = MockServer((args.host, args.port), config)
+    print(f"Mock inference server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import contextvars
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+from rate_limiter import api_call_started
+from tracing import span
+
+# Latency-aware routing between interchangeable models.
+# Models are grouped into equivalence classes; a router per class keeps live latency and error statistics
+# for each model and sends every request to the fastest healthy one (class order breaks ties and is used
+# until there are measurements). A model that fails MAX_FAILURES times in a row is skipped for COOLDOWN
+# seconds, and a failed request is retried once on the next model. A small share of requests goes to
+# another healthy model so that its statistics stay current. Latency is measured from the moment the
+# API call starts (see rate_limiter.api_call_started): time queued in the rate limiter or backing off after a
+# 429 is left out, and answers served from the response cache are not counted at all.
+#
+# For tail-sensitive paths a request can be hedged: if the first model hasn't answered by its p95 latency,
+# a duplicate goes to the next-best model (or the same one when the class has only one) and whichever
+# answers first wins. A loser that hasn't started is cancelled and a losing stream is closed; a
+# non-streamed loser can't be interrupted mid-request, so it finishes in the background and is only used
+# for statistics. Hedges are capped at HEDGE_RATIO of all requests so a slow provider isn't flooded.
+#
+# Environment variables:
+#   MODEL_CLASSES        JSON object of class name -> list of models, replacing DEFAULT_CLASSES
+#   MODEL_HEDGE=0        never send hedged requests
+#   MODEL_HEDGE_RATIO    largest share of requests that may be hedged (default 0.1)
+#   MODEL_EXPLORE        share of requests sent to a model other than the fastest (default 0.05)
+DEFAULT_CLASSES = {
+    "github-chat": ["Meta-Llama-3.1-405B-Instruct", "Phi-3.5-MoE-instruct", "AI21-Jamba-1.5-Large"],
+    # Only models that support tool calls: a tool-using conversation must not be routed to one that doesn't
+    "github-tools": ["Meta-Llama-3.1-405B-Instruct"],
+    "gemini-flash": ["gemini-1.5-flash"],
+    "grok": ["grok-beta"],
+}
+MODEL_CLASSES = json.loads(os.environ.get("MODEL_CLASSES") or "null") or DEFAULT_CLASSES
+HEDGE_ENABLED = os.environ.get("MODEL_HEDGE") != "0"
+HEDGE_RATIO = float(os.environ.get("MODEL_HEDGE_RATIO", "0.1"))
+EXPLORE = float(os.environ.get("MODEL_EXPLORE", "0.05"))
+
+# Latencies kept per model for the percentiles
+WINDOW = 200
+# Samples needed before p95 is trusted as a hedge delay
+MIN_SAMPLES = 20
+# Weight of the newest sample in the moving averages
+EWMA_ALPHA = 0.2
+MAX_FAILURES = 3
+COOLDOWN = 30.0
+
+
+class ModelStats:
+    def __init__(self, model):
+        self.model = model
+        self.latencies = deque(maxlen=WINDOW)
+        self.latency = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record(self, duration, ok):
+        self.requests += 1
+        self.error_rate += EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.latencies.append(duration)
+            self.latency = duration if self.latency is None else self.latency + EWMA_ALPHA * (duration - self.latency)
+            self.failures = 0
+        else:
+            self.failures += 1
+            if self.failures >= MAX_FAILURES:
+                self.open_until = time.monotonic() + COOLDOWN
+
+    def percentile(self, q):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def healthy(self, now):
+        return now >= self.open_until
+
+    # Expected latency, inflated by the recent error rate since a failure costs a retry elsewhere.
+    # A model that was never tried goes first so it gets measured; one that has only failed goes last.
+    def score(self):
+        if self.latency is None:
+            return 0.0 if self.requests == 0 else float("inf")
+        return self.latency * (1 + 4 * self.error_rate)
+
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "latency": self.latency,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "error_rate": round(self.error_rate, 3),
+            "healthy": self.healthy(time.monotonic()),
+        }
+
+
+class ModelRouter:
+    def __init__(self, models, hedge_ratio=HEDGE_RATIO, explore=EXPLORE):
+        self.models = list(models)
+        self.stats = {model: ModelStats(model) for model in self.models}
+        self.hedge_ratio = hedge_ratio
+        self.explore = explore
+        self.requests = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    # Models in the order they should be tried: healthy ones by score (class order among equals),
+    # then the ones in cooldown, soonest back first
+    def ranked(self):
+        now = time.monotonic()
+        with self._lock:
+            stats = [self.stats[model] for model in self.models]
+            healthy = sorted((s for s in stats if s.healthy(now)), key=ModelStats.score)
+            cooling = sorted((s for s in stats if not s.healthy(now)), key=lambda s: s.open_until)
+            order = [s.model for s in healthy + cooling]
+        if len(healthy) > 1 and random.random() < self.explore:
+            other = random.choice(order[1:len(healthy)])
+            order.remove(other)
+            order.insert(0, other)
+        return order
+
+    def record(self, model, duration, ok):
+        with self._lock:
+            self.stats[model].record(duration, ok)
+
+    # How long to wait for model before hedging, or None while it has too few samples
+    def hedge_delay(self, model):
+        with self._lock:
+            stats = self.stats[model]
+            if len(stats.latencies) < MIN_SAMPLES:
+                return None
+            return stats.percentile(0.95)
+
+    def _may_hedge(self):
+        with self._lock:
+            if self.hedges + 1 > self.hedge_ratio * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def _run(self, model, attempt):
+        stamp = {}
+        token = api_call_started.set(stamp)
+        try:
+            result = attempt(model)
+        except Exception:
+            self.record(model, 0.0, False)
+            raise
+        finally:
+            api_call_started.reset(token)
+        # No API call was made (a response cache hit): nothing to learn about the model's speed
+        if "started" in stamp:
+            self.record(model, time.perf_counter() - stamp["started"], True)
+        return result
+
+    # Send request(model) to the best model, failing over to the next one once.
+    # With hedge=True a duplicate goes out when the first model runs past its p95.
+    # models limits the choice to some of the class, e.g. to keep a multi-request exchange on one model.
+    def call(self, request, hedge=False, models=None):
+        return self.call_model(request, hedge, models)[1]
+
+    # Same as call, but returns (model that answered, result)
+    def call_model(self, request, hedge=False, models=None):
+        return self._route(request, hedge, lambda result: None, models)
+
+    # Streaming variant: request(model) returns an iterable of chunks, and the latency measured is the
+    # time to the first chunk. Returns (model, iterator); a losing hedged stream is closed.
+    def stream(self, request, hedge=False):
+        def open_stream(model):
+            chunks = request(model)
+            iterator = iter(chunks)
+            try:
+                first = next(iterator)
+            except StopIteration:
+                return model, chunks, iter(())
+            return model, chunks, itertools.chain([first], iterator)
+
+        _, (model, _, iterator) = self._route(open_stream, hedge, lambda result: _close(result[1]))
+        return model, iterator
+
+    def _route(self, attempt, hedge, discard, models=None):
+        with self._lock:
+            self.requests += 1
+        order = [model for model in self.ranked() if models is None or model in models]
+        with span("model.route", models=",".join(order)) as current:
+            last_error = None
+            for index, model in enumerate(order[:2]):
+                backup = order[index + 1] if index + 1 < len(order) else model
+                delay = self.hedge_delay(model) if hedge and HEDGE_ENABLED else None
+                try:
+                    if delay is None:
+                        result = self._run(model, attempt)
+                        winner = model
+                    else:
+                        winner, result = self._hedged(model, backup, delay, attempt, discard, current)
+                except Exception as e:
+                    last_error = e
+                    if len(order) == 1:
+                        break
+                    continue
+                current.set(model=winner, failover=index > 0)
+                return winner, result
+            raise last_error
+
+    def _hedged(self, primary, backup, delay, attempt, discard, current):
+        futures = {_submit(self._run, primary, attempt): primary}
+        done, _ = wait(futures, timeout=delay)
+        if not done and self._may_hedge():
+            current.set(hedged=backup)
+            futures[_submit(self._run, backup, attempt)] = backup
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                for loser in pending:
+                    _cancel(loser, discard)
+                return futures[future], future.result()
+        raise error
+
+
+# Each hedged attempt gets a thread of its own rather than a slot in a shared pool: a pool would cap the
+# requests in flight across the whole server and make new primaries queue while their p95 timer runs, and
+# the caller's own thread can't be used because it must be free to return as soon as either attempt wins.
+# The attempt keeps the caller's tracing context.
+def _submit(fn, *args):
+    future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(context.run(fn, *args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="hedge", daemon=True).start()
+    return future
+
+
+def _close(chunks):
+    close = getattr(chunks, "close", None)
+    if close is not None:
+        try:
+            close()
+        except Exception:
+            pass
+
+
+# A loser that hasn't started is cancelled; one that is running is discarded when it finishes
+def _cancel(future, discard):
+    if future.cancel():
+        return
+
+    def on_done(finished):
+        if not finished.cancelled() and finished.exception() is None:
+            discard(finished.result())
+    future.add_done_callback(on_done)
+
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+# Router for the class containing model, with model preferred until there are measurements.
+# kind separates statistics that aren't comparable, e.g. full completions and time to first token.
+# group names the class to use when model belongs to several (e.g. "github-tools" for tool-using requests).
+def get_router(model, kind="complete", group=None):
+    if group is not None:
+        members = MODEL_CLASSES.get(group) or []
+        models = list(members) if model in members else [model]
+    else:
+        models = next((list(members) for members in MODEL_CLASSES.values() if model in members), [model])
+    models.remove(model)
+    models.insert(0, model)
+    key = (tuple(models), kind)
+    with _routers_lock:
+        router = _routers.get(key)
+        if router is None:
+            router = ModelRouter(models)
+            _routers[key] = router
+        return router
+
+
+# Live statistics of every router, for logging or a status page
+def snapshot():
+    with _routers_lock:
+        routers = list(_routers.items())
+    return {
+        f"{kind}:{models[0]}": {model: stats.to_dict() for model, stats in router.stats.items()}
+        for (models, kind), router in routers
+    }
@@ -1,21 +1,17 @@
 import os
-from azure.ai.inference import ChatCompletionsClient
 from azure.ai.inference.models import AssistantMessage, SystemMessage, UserMessage
-from azure.core.credentials import AzureKeyCredential
+from clients import GITHUB_MODELS_ENDPOINT, get_chat_client
 
 from dotenv import load_dotenv
+from response_cache import cached_complete
 
 load_dotenv()
 
 token = os.getenv("GITHUB_TOKEN")
-endpoint = "https://models.inference.ai.azure.com"
+endpoint = GITHUB_MODELS_ENDPOINT
 model_name = "o1"
 
-client = ChatCompletionsClient(
-    endpoint=endpoint,
-    credential=AzureKeyCredential(token),
-    api_version="2024-12-01-preview",
-)
+client = get_chat_client(endpoint, api_version="2024-12-01-preview", model=model_name, token=token)
 
 messages = [
     {
@@ -27,6 +23,6 @@ messages = [
     UserMessage(content="What about Spain?"),
 ]
 
-response = client.complete(messages=messages, model=model_name)
+response = cached_complete(client, messages=messages, model=model_name)
 
 print(response.choices[0].message.content)
\ No newline at end of file
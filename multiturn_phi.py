@@ -1,21 +1,18 @@
 import os
-from azure.ai.inference import ChatCompletionsClient
 from azure.ai.inference.models import AssistantMessage, SystemMessage, UserMessage
-from azure.core.credentials import AzureKeyCredential
+from clients import GITHUB_MODELS_ENDPOINT, get_chat_client
 
 from dotenv import load_dotenv
+from response_cache import cached_complete
 
 load_dotenv()
 
 token = os.getenv("GITHUB_TOKEN")
 
-endpoint = "https://models.inference.ai.azure.com"
+endpoint = GITHUB_MODELS_ENDPOINT
 model_name = "Phi-3.5-MoE-instruct"
 
-client = ChatCompletionsClient(
-    endpoint=endpoint,
-    credential=AzureKeyCredential(token),
-)
+client = get_chat_client(endpoint, model=model_name, token=token)
 
 messages = [
     SystemMessage(content="You are a helpful assistant."),
@@ -24,6 +21,6 @@ messages = [
     UserMessage(content="What about Spain?"),
 ]
 
-response = client.complete(messages=messages, model=model_name)
+response = cached_complete(client, messages=messages, model=model_name)
 
 print(response.choices[0].message.content)
\ No newline at end of file
@@ -0,0 +1,90 @@
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from file_hash import file_sha256
+
+# Page-parallel PDF text extraction.
+# Pages are fanned out to a process pool and yielded back in page order, with at most
+# max_in_flight pages extracted but not yet consumed. The extracted text is cached on disk
+# under the SHA-256 of the PDF, so running again on the same file skips extraction entirely.
+PDF_CACHE_DIR = os.environ.get("PDF_TEXT_CACHE_DIR", os.path.join(".cache", "pdf_text"))
+
+# Documents this short are extracted in-process, where starting a pool would cost more than it saves
+MIN_PAGES_FOR_POOL = 8
+
+# Each worker process opens the document once and keeps the reader for all of its pages
+_reader = None
+
+
+def _open_reader(file_path):
+    global _reader
+    import PyPDF2
+
+    _reader = PyPDF2.PdfReader(file_path)
+
+
+def _extract_page(index):
+    return _reader.pages[index].extract_text() or ""
+
+
+def _extract_pages(file_path, max_workers, max_in_flight):
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(file_path)
+    page_count = len(reader.pages)
+    if max_workers == 1 or page_count < MIN_PAGES_FOR_POOL:
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+    del reader
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_open_reader, initargs=(file_path,)) as pool:
+        pending = deque()
+        next_page = 0
+        try:
+            while next_page < page_count or pending:
+                while next_page < page_count and len(pending) < max_in_flight:
+                    pending.append(pool.submit(_extract_page, next_page))
+                    next_page += 1
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+# Generator yielding the text of each page in order
+def iter_pdf_text(file_path, max_workers=None, max_in_flight=None, use_cache=True):
+    max_workers = max_workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or max_workers * 2
+
+    if not use_cache:
+        yield from _extract_pages(file_path, max_workers, max_in_flight)
+        return
+
+    cache_path = os.path.join(PDF_CACHE_DIR, file_sha256(file_path) + ".jsonl")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as cache_file:
+            for line in cache_file:
+                yield json.loads(line)
+        return
+
+    # Pages are written to a temporary file that only becomes the cache entry once every page is done
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    completed = False
+    try:
+        with open(temp_path, "w", encoding="utf-8") as cache_file:
+            for text in _extract_pages(file_path, max_workers, max_in_flight):
+                cache_file.write(json.dumps(text) + "\n")
+                yield text
+        os.replace(temp_path, cache_path)
+        completed = True
+    finally:
+        if not completed and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def read_pdf_text(file_path, **kwargs):
+    return "".join(iter_pdf_text(file_path, **kwargs))
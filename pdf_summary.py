@@ -1,12 +1,15 @@
 from dotenv import load_dotenv
 import os
+import sys
 import google.generativeai as genai
+from clients import configure_gemini
+from gemini_uploads import ask_about_file, upload_file_cached
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Configure API key for Google Generative AI
-genai.configure(api_key=os.environ["API_KEY"])
+configure_gemini()
 
 # Define the path to the PDF file
 media_dir = "media"  # Directory where the file is located
@@ -15,13 +18,16 @@ pdf_path = os.path.join(media_dir, pdf_file)
 
 # Check if the file exists
 if os.path.exists(pdf_path):
-    # Upload the file
-    sample_pdf = genai.upload_file(pdf_path)
+    # Upload the file (reuses the earlier upload when the same content is still on the server)
+    sample_pdf = upload_file_cached(pdf_path)
     
-    # Generate content based on the PDF (e.g., a summary)
-    response = genai.GenerativeModel("gemini-1.5-flash").generate_content([f"Give me a summary of this document:", sample_pdf])
+    # Generate content based on the PDF (e.g., a summary), plus any extra questions given on the command line
+    prompts = ["Give me a summary of this document:"] + sys.argv[1:]
+    answers = ask_about_file(genai.GenerativeModel("gemini-1.5-flash"), sample_pdf, prompts)
     
     # Output the summary
-    print(f"Summary: {response.text}")
+    print(f"Summary: {answers[0]}")
+    for prompt, answer in zip(prompts[1:], answers[1:]):
+        print(f"\n{prompt}\n{answer}")
 else:
     print(f"File not found at {pdf_path}")
@@ -0,0 +1,348 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import quote
+
+# Journaled persistence for user profiles.
+# Every change to a profile is appended to <user>.journal.jsonl as one small record, and records are
+# fsynced in groups (every FSYNC_EVERY records or FSYNC_INTERVAL seconds). Once the journal holds
+# COMPACT_EVERY records it is folded into <user>.snapshot.json. Loading reads the snapshot and replays
+# the journal tail, so writing an update costs O(size of the change) instead of O(size of the profile).
+# At most OPEN_JOURNALS journal files are open at once across all profiles: the least recently written
+# one is fsynced and closed, and reopened by its next append.
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+FSYNC_EVERY = int(os.environ.get("PROFILE_FSYNC_EVERY", "16"))
+FSYNC_INTERVAL = float(os.environ.get("PROFILE_FSYNC_INTERVAL", "1.0"))
+COMPACT_EVERY = int(os.environ.get("PROFILE_COMPACT_EVERY", "1000"))
+# Number of profiles ProfileManager keeps in memory
+RESIDENT_PROFILES = int(os.environ.get("PROFILE_RESIDENT", "1000"))
+OPEN_JOURNALS = int(os.environ.get("PROFILE_OPEN_JOURNALS", "64"))
+
+
+class UserProfile:
+    FIELDS = (
+        "user_id",
+        "name",
+        "medical_history",
+        "dietary_preferences",
+        "activity_levels",
+        "goals",
+        "progress",
+        "calendar",
+        "biometrics",
+        "soundscape",
+    )
+    __slots__ = FIELDS + ("_journal",)
+
+    def __init__(self, user_id, name = None):
+        self.user_id = user_id
+        self.name = name
+        self.medical_history = {}
+        self.dietary_preferences = {}
+        self.activity_levels = {}
+        self.goals = {}
+        self.progress = {}
+        self.calendar = {}
+        self.biometrics = {}
+        self.soundscape = None
+        self._journal = None
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def update(self, data):
+        for field in self.FIELDS:
+            if field in data:
+                setattr(self, field, data[field])
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    # Accepts a JSON object, or the JSON string inside JSON written by older versions
+    def from_json(self, data):
+        data = json.loads(data)
+        if isinstance(data, str):
+            data = json.loads(data)
+        self.update(data)
+
+    # Mutations are recorded in the journal when the profile is attached to one
+    def set_field(self, field, value):
+        setattr(self, field, value)
+        self._record({"op": "set", "field": field, "value": value})
+
+    def set_entry(self, field, key, value):
+        getattr(self, field)[key] = value
+        self._record({"op": "set", "field": field, "key": key, "value": value})
+
+    def remove_entry(self, field, key):
+        getattr(self, field).pop(key, None)
+        self._record({"op": "del", "field": field, "key": key})
+
+    def set_biometric(self, biometric_type, value):
+        self.set_entry("biometrics", biometric_type, value)
+
+    def set_soundscape(self, soundscape_name):
+        self.set_field("soundscape", soundscape_name)
+
+    def _record(self, record):
+        if self._journal is not None:
+            self._journal.append(record, self)
+
+    # Compact the journal into a snapshot and flush everything to disk
+    def close(self):
+        if self._journal is not None:
+            self._journal.close(self)
+
+
+def apply_record(state, record):
+    field = record["field"]
+    if record["op"] == "set" and "key" not in record:
+        state[field] = record["value"]
+    elif record["op"] == "set":
+        state.setdefault(field, {})[record["key"]] = record["value"]
+    elif record["op"] == "del":
+        state.get(field, {}).pop(record["key"], None)
+
+
+# Journals with an open file, least recently written first
+_open_journals = OrderedDict()
+_open_journals_lock = threading.Lock()
+
+
+# Function to note that journal has its file open; closes the least recently written ones over the limit.
+# Called without holding any journal's lock, so closing another journal can't deadlock.
+def _track_open(journal):
+    victims = []
+    with _open_journals_lock:
+        _open_journals[journal] = None
+        _open_journals.move_to_end(journal)
+        while len(_open_journals) > OPEN_JOURNALS:
+            victim = next(iter(_open_journals))
+            if victim is journal:
+                break
+            del _open_journals[victim]
+            victims.append(victim)
+    for victim in victims:
+        victim.release_file()
+
+
+def _untrack_open(journal):
+    with _open_journals_lock:
+        _open_journals.pop(journal, None)
+
+
+class ProfileJournal:
+    def __init__(self, user_id, directory=PROFILE_DIR, fsync_every=FSYNC_EVERY, fsync_interval=FSYNC_INTERVAL,
+                 compact_every=COMPACT_EVERY):
+        self.user_id = user_id
+        self.directory = directory
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        file_name = quote(str(user_id), safe="")
+        self.snapshot_path = os.path.join(directory, f"{file_name}.snapshot.json")
+        self.journal_path = os.path.join(directory, f"{file_name}.journal.jsonl")
+        self._file = None
+        self._records = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def exists(self):
+        return os.path.exists(self.snapshot_path) or os.path.exists(self.journal_path)
+
+    # Rebuild the profile from the snapshot plus the journal tail and attach it to this journal
+    def load(self, name=None):
+        state = {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        self._records = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-write; everything before it is intact
+                        break
+                    apply_record(state, record)
+                    self._records += 1
+
+        profile = UserProfile(self.user_id, name)
+        profile.update(state)
+        profile._journal = self
+        return profile
+
+    def append(self, record, profile):
+        with self._lock:
+            opened = self._file is None
+            if opened:
+                self._file = open(self.journal_path, "a", encoding="utf-8")
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            self._records += 1
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+            compact = self._records >= self.compact_every
+        if opened:
+            _track_open(self)
+        if compact:
+            self.compact(profile)
+
+    def _sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    # Sync and close the journal file to give back its descriptor; the next append reopens it
+    def release_file(self):
+        with self._lock:
+            self._sync()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # Write the whole profile as the new snapshot and start an empty journal
+    def compact(self, profile):
+        with self._lock:
+            temp_path = f"{self.snapshot_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(profile.to_dict(), f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.snapshot_path)
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            # Start an empty journal; the next append opens it
+            open(self.journal_path, "w", encoding="utf-8").close()
+            self._records = 0
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+
+    def close(self, profile=None):
+        if profile is not None and self._records:
+            self.compact(profile)
+        self.release_file()
+        _untrack_open(self)
+
+
+# Load a user's profile, attached to its journal. Profiles saved as <user>_profile.json by older
+# versions are imported into a snapshot the first time.
+def open_profile(user_id, name=None, directory=PROFILE_DIR, legacy_path=None):
+    journal = ProfileJournal(user_id, directory)
+    if not journal.exists():
+        legacy_path = legacy_path or f"{user_id}_profile.json"
+        if os.path.exists(legacy_path):
+            with open(legacy_path, "r") as f:
+                profile = UserProfile(user_id)
+                profile.from_json(f.read())
+            journal.compact(profile)
+    return journal.load(name)
+
+
+# Serves many users from one process.
+# Profiles are loaded lazily by user id and the most recently used ones stay in memory; when more than
+# max_resident are loaded, the least recently used idle profile is written back (its journal compacted)
+# and dropped. Files are spread over 256 shard directories so no directory grows with the user count.
+# Each user has their own lock, so sessions for different users never wait on each other.
+class ProfileManager:
+    def __init__(self, directory=PROFILE_DIR, max_resident=RESIDENT_PROFILES):
+        self.directory = directory
+        self.max_resident = max_resident
+        self._profiles = OrderedDict()
+        # user id -> [lock, number of threads holding or waiting for it]; entries exist only while in use
+        self._user_locks = {}
+        self._lock = threading.Lock()
+
+    def shard_directory(self, user_id):
+        shard = hashlib.sha1(str(user_id).encode("utf-8")).hexdigest()[:2]
+        return os.path.join(self.directory, shard)
+
+    def _acquire(self, user_id):
+        with self._lock:
+            entry = self._user_locks.setdefault(user_id, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+
+    def _release(self, user_id):
+        with self._lock:
+            entry = self._user_locks[user_id]
+            entry[0].release()
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._user_locks[user_id]
+
+    def _load(self, user_id, name):
+        shard_directory = self.shard_directory(user_id)
+        # Profiles written before sharding sit directly in the profile directory
+        unsharded = ProfileJournal(user_id, self.directory)
+        sharded = ProfileJournal(user_id, shard_directory)
+        if not sharded.exists() and unsharded.exists():
+            for old_path, new_path in ((unsharded.snapshot_path, sharded.snapshot_path),
+                                       (unsharded.journal_path, sharded.journal_path)):
+                if os.path.exists(old_path):
+                    os.replace(old_path, new_path)
+        return open_profile(user_id, name, directory=shard_directory)
+
+    # Use a profile exclusively for the duration of the with block
+    @contextmanager
+    def session(self, user_id, name=None):
+        self._acquire(user_id)
+        try:
+            with self._lock:
+                profile = self._profiles.get(user_id)
+                if profile is not None:
+                    self._profiles.move_to_end(user_id)
+            if profile is None:
+                profile = self._load(user_id, name)
+                with self._lock:
+                    self._profiles[user_id] = profile
+            yield profile
+        finally:
+            self._release(user_id)
+            self._evict()
+
+    # Write back and drop least recently used profiles that nobody is using
+    def _evict(self):
+        while True:
+            with self._lock:
+                if len(self._profiles) <= self.max_resident:
+                    return
+                victim = next((user_id for user_id in self._profiles if user_id not in self._user_locks), None)
+                if victim is None:
+                    return
+                profile = self._profiles.pop(victim)
+                # Hold the user's lock while writing back so a new session waits for the files to be complete
+                lock = threading.Lock()
+                lock.acquire()
+                self._user_locks[victim] = [lock, 1]
+            try:
+                profile.close()
+            finally:
+                self._release(victim)
+
+    def close(self):
+        with self._lock:
+            user_ids = list(self._profiles)
+        for user_id in user_ids:
+            self._acquire(user_id)
+            try:
+                with self._lock:
+                    profile = self._profiles.pop(user_id, None)
+                if profile is not None:
+                    profile.close()
+            finally:
+                self._release(user_id)
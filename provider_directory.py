@@ -0,0 +1,269 @@
+import difflib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+# Indexed directory of healthcare professionals.
+# Records live in a SQLite file with an index on the normalized specialty, a token index for prefix and
+# fuzzy name search and an R*Tree over geocoded locations for nearest-provider queries. Every change goes
+# through upsert/remove, which update the record and all of its index entries in one transaction.
+DIRECTORY_PATH = os.environ.get("PROVIDER_DIRECTORY_PATH", os.path.join(".cache", "providers.sqlite3"))
+
+EARTH_RADIUS_KM = 6371.0
+# Nearest-provider search starts with this radius and doubles it until enough candidates are found
+INITIAL_SEARCH_RADIUS_KM = 2.0
+MAX_SEARCH_RADIUS_KM = 20000.0
+
+# Fields stored for every provider, in addition to its id
+FIELDS = ("name", "specialty", "location", "phone", "latitude", "longitude")
+
+
+# Lowercase, strip accents and collapse whitespace so "  Cardiologist" and "cardiologist" match
+def normalize(text):
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.casefold().split())
+
+
+def name_tokens(name):
+    return sorted(set(re.findall(r"\w+", normalize(name))))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+# (west, east) longitude ranges covering longitude +- delta; a box crossing the antimeridian is split in two
+def _longitude_ranges(longitude, delta):
+    if delta >= 180.0:
+        return [(-180.0, 180.0)]
+    longitude = (longitude + 180.0) % 360.0 - 180.0
+    west, east = longitude - delta, longitude + delta
+    if west < -180.0:
+        return [(west + 360.0, 180.0), (-180.0, east)]
+    if east > 180.0:
+        return [(west, 180.0), (-180.0, east - 360.0)]
+    return [(west, east)]
+
+
+class ProviderDirectory:
+    # geocode(address) may be given to look up (latitude, longitude) for records that don't carry coordinates
+    def __init__(self, path=DIRECTORY_PATH, geocode=None):
+        self.path = path
+        self.geocode = geocode
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS providers (
+                    rowid INTEGER PRIMARY KEY,
+                    id TEXT UNIQUE NOT NULL,
+                    name TEXT, specialty TEXT, location TEXT, phone TEXT,
+                    latitude REAL, longitude REAL,
+                    specialty_key TEXT
+                );
+                CREATE INDEX IF NOT EXISTS providers_specialty ON providers (specialty_key);
+                CREATE TABLE IF NOT EXISTS name_tokens (
+                    token TEXT NOT NULL,
+                    provider_rowid INTEGER NOT NULL,
+                    PRIMARY KEY (token, provider_rowid)
+                ) WITHOUT ROWID;
+                CREATE VIRTUAL TABLE IF NOT EXISTS provider_locations USING rtree (
+                    provider_rowid, min_lat, max_lat, min_lon, max_lon
+                );
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                """
+            )
+
+    # SQLite connections cannot be shared between threads, so each thread gets its own
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _upsert(self, conn, provider_id, record):
+        record = dict(record)
+        if record.get("latitude") is None and self.geocode and record.get("location"):
+            coordinates = self.geocode(record["location"])
+            if coordinates:
+                record["latitude"], record["longitude"] = coordinates
+
+        row = conn.execute("SELECT rowid FROM providers WHERE id = ?", (provider_id,)).fetchone()
+        values = [record.get(field) for field in FIELDS] + [normalize(record.get("specialty"))]
+        if row is None:
+            rowid = conn.execute(
+                "INSERT INTO providers (id, name, specialty, location, phone, latitude, longitude, specialty_key)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [provider_id] + values,
+            ).lastrowid
+        else:
+            rowid = row["rowid"]
+            conn.execute(
+                "UPDATE providers SET name = ?, specialty = ?, location = ?, phone = ?, latitude = ?, longitude = ?,"
+                " specialty_key = ? WHERE rowid = ?",
+                values + [rowid],
+            )
+            conn.execute("DELETE FROM name_tokens WHERE provider_rowid = ?", (rowid,))
+            conn.execute("DELETE FROM provider_locations WHERE provider_rowid = ?", (rowid,))
+
+        conn.executemany(
+            "INSERT INTO name_tokens (token, provider_rowid) VALUES (?, ?)",
+            [(token, rowid) for token in name_tokens(record.get("name"))],
+        )
+        if record.get("latitude") is not None and record.get("longitude") is not None:
+            lat, lon = float(record["latitude"]), float(record["longitude"])
+            conn.execute("INSERT INTO provider_locations VALUES (?, ?, ?, ?, ?)", (rowid, lat, lat, lon, lon))
+
+    def upsert(self, provider_id, record):
+        with self._connection() as conn:
+            self._upsert(conn, str(provider_id), record)
+
+    def remove(self, provider_id):
+        with self._connection() as conn:
+            row = conn.execute("SELECT rowid FROM providers WHERE id = ?", (str(provider_id),)).fetchone()
+            if row is None:
+                return False
+            conn.execute("DELETE FROM name_tokens WHERE provider_rowid = ?", (row["rowid"],))
+            conn.execute("DELETE FROM provider_locations WHERE provider_rowid = ?", (row["rowid"],))
+            conn.execute("DELETE FROM providers WHERE rowid = ?", (row["rowid"],))
+            return True
+
+    # Replace the directory with the records of a {id: record} mapping in a single transaction
+    def load(self, records):
+        with self._connection() as conn:
+            for table in ("providers", "name_tokens", "provider_locations"):
+                conn.execute(f"DELETE FROM {table}")
+            for provider_id, record in records.items():
+                self._upsert(conn, str(provider_id), record)
+
+    # Rebuild from a JSON source file only when the file changed since the last import
+    def sync_from_json(self, file_path):
+        if not os.path.exists(file_path):
+            return False
+        stat = os.stat(file_path)
+        signature = f"{os.path.abspath(file_path)}:{stat.st_mtime_ns}:{stat.st_size}"
+        with self._connection() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'json_source'").fetchone()
+        if row is not None and row["value"] == signature:
+            return False
+        with open(file_path, "r") as f:
+            self.load(json.load(f))
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_source', ?)", (signature,))
+        return True
+
+    def _records(self, where, params, limit=None):
+        query = f"SELECT id, {', '.join(FIELDS)} FROM providers WHERE {where}"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        rows = self._connection().execute(query, params).fetchall()
+        return [self._to_record(row) for row in rows]
+
+    @staticmethod
+    def _to_record(row):
+        record = {field: row[field] for field in FIELDS if row[field] is not None}
+        record["id"] = row["id"]
+        return record
+
+    def get(self, provider_id):
+        records = self._records("id = ?", (str(provider_id),))
+        return records[0] if records else None
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM providers").fetchone()[0]
+
+    def by_specialty(self, specialty, limit=None):
+        return self._records("specialty_key = ?", (normalize(specialty),), limit)
+
+    # Providers with a name word starting with each word of the query ("jo sm" finds "Dr. John Smith").
+    # When nothing matches and fuzzy is set, close spellings of the query words are tried instead.
+    def search_name(self, query, limit=20, fuzzy=True):
+        words = name_tokens(query)
+        if not words:
+            return []
+        conn = self._connection()
+        prefix_query = "SELECT provider_rowid FROM name_tokens WHERE token >= ? AND token < ?"
+        params = []
+        for word in words:
+            params += [word, word + "\U0010ffff"]
+        rowids = [
+            row[0]
+            for row in conn.execute(
+                " INTERSECT ".join([prefix_query] * len(words)) + f" ORDER BY 1 LIMIT {int(limit)}",
+                params,
+            )
+        ]
+
+        if not rowids and fuzzy:
+            rowids = set()
+            for word in words:
+                # Candidates share the first letter, which keeps the comparison set small on large directories
+                candidates = [
+                    row[0]
+                    for row in conn.execute(
+                        "SELECT DISTINCT token FROM name_tokens WHERE token >= ? AND token < ?",
+                        (word[0], word[0] + "\U0010ffff"),
+                    )
+                ]
+                for token in difflib.get_close_matches(word, candidates, n=5, cutoff=0.75):
+                    rowids.update(
+                        row[0] for row in conn.execute("SELECT provider_rowid FROM name_tokens WHERE token = ?", (token,))
+                    )
+
+        if not rowids:
+            return []
+        rowids = sorted(rowids)[:limit]
+        return self._records(f"rowid IN ({', '.join('?' * len(rowids))})", rowids)
+
+    # The k providers closest to (latitude, longitude), optionally of one specialty, with distances in km
+    def nearest(self, latitude, longitude, k=5, specialty=None, max_distance_km=None):
+        conn = self._connection()
+        specialty_key = normalize(specialty) if specialty else None
+        radius = INITIAL_SEARCH_RADIUS_KM
+        limit = min(max_distance_km or MAX_SEARCH_RADIUS_KM, MAX_SEARCH_RADIUS_KM)
+        while True:
+            radius = min(radius, limit)
+            lat_delta = math.degrees(radius / EARTH_RADIUS_KM)
+            cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+            lon_delta = min(180.0, lat_delta / cos_lat)
+            lon_ranges = _longitude_ranges(longitude, lon_delta)
+            query = (
+                f"SELECT p.id, {', '.join('p.' + field for field in FIELDS)} FROM provider_locations l"
+                " JOIN providers p ON p.rowid = l.provider_rowid"
+                " WHERE l.min_lat <= ? AND l.max_lat >= ? AND ("
+                + " OR ".join(["(l.min_lon <= ? AND l.max_lon >= ?)"] * len(lon_ranges))
+                + ")"
+            )
+            params = [latitude + lat_delta, latitude - lat_delta]
+            for west, east in lon_ranges:
+                params += [east, west]
+            if specialty_key:
+                # The unary + keeps SQLite on the R*Tree instead of scanning the whole specialty index
+                query += " AND +p.specialty_key = ?"
+                params.append(specialty_key)
+
+            found = []
+            for row in conn.execute(query, params):
+                distance = haversine_km(latitude, longitude, row["latitude"], row["longitude"])
+                if distance <= radius:
+                    found.append((distance, self._to_record(row)))
+            # Anything outside the circle could still be beaten by an unseen provider, so only
+            # results within the searched radius are final
+            if len(found) >= k or radius >= limit:
+                found.sort(key=lambda item: item[0])
+                return [dict(record, distance_km=round(distance, 3)) for distance, record in found[:k]]
+            radius *= 2
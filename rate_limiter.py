@@ -0,0 +1,352 @@
+import asyncio
+import contextvars
+import email.utils
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Client-side rate limiting shared by every process on the machine.
+# Each (provider, model) has two token buckets, one for requests per minute and one for tokens per minute.
+# Their state lives in a small JSON file guarded by an OS file lock, so all scripts using the same API key
+# draw from the same quota. Waiting requests queue in the shared state and are served in priority order
+# (lower value first, then arrival), and a 429 stops every process until its Retry-After has passed; without a
+# Retry-After, retries back off exponentially with full jitter. The buckets hold at most BURST_SECONDS worth of
+# quota, so requests go out at a steady rate near the limit rather than in bursts that trip it.
+#
+# Environment variables:
+#   AI_RATE_LIMITS            JSON overriding the quotas, e.g. {"gemini:gemini-1.5-flash": {"rpm": 15, "tpm": 1000000}};
+#                             keys are "provider:model" or "provider", 0 means unlimited
+#   AI_RATE_LIMIT_DIR         directory for the shared state (default .cache/rate_limits)
+#   AI_RATE_LIMIT_DISABLE=1   send requests immediately (429s are still retried)
+#   AI_RATE_LIMIT_RETRIES     retries after a 429 before giving up
+STATE_DIR = os.environ.get("AI_RATE_LIMIT_DIR", os.path.join(".cache", "rate_limits"))
+RATE_LIMIT_DISABLED = os.environ.get("AI_RATE_LIMIT_DISABLE") == "1"
+MAX_RETRIES = int(os.environ.get("AI_RATE_LIMIT_RETRIES", "6"))
+
+# Free-tier quotas; GitHub Models (azure-inference) counts requests, not tokens
+DEFAULT_LIMITS = {
+    "azure-inference": {"rpm": 15, "tpm": 0},
+    "gemini": {"rpm": 15, "tpm": 1000000},
+    "openai": {"rpm": 60, "tpm": 0},
+}
+LIMITS = dict(DEFAULT_LIMITS, **json.loads(os.environ.get("AI_RATE_LIMITS") or "{}"))
+
+BURST_SECONDS = 10.0
+# Priorities: people waiting on an answer go before batch jobs
+INTERACTIVE_PRIORITY = 0
+DEFAULT_PRIORITY = 5
+BATCH_PRIORITY = 10
+# Backoff after a 429 that carries no Retry-After
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+# A waiting request re-checks the shared state at least this often and is dropped from the queue
+# if it hasn't done so for STALE_AFTER seconds (its process died)
+MAX_POLL = 1.0
+STALE_AFTER = 30.0
+
+
+# Callers that measure upstream latency (model_router) put a dict here; run_rate_limited stores in "started"
+# the perf_counter time at which its last API call began, so queueing and backoff are left out of the timing
+api_call_started = contextvars.ContextVar("api_call_started", default=None)
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+# Exclusive lock on an open file, held across processes
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a+b")
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+        return False
+
+
+class RateLimiter:
+    def __init__(self, key, rpm=0, tpm=0, state_dir=STATE_DIR, burst_seconds=BURST_SECONDS):
+        self.key = key
+        self.rpm = rpm
+        self.tpm = tpm
+        # Bucket sizes: BURST_SECONDS of quota, but always room for one request
+        self.request_capacity = max(1.0, rpm * burst_seconds / 60) if rpm else 0
+        self.token_capacity = tpm * burst_seconds / 60 if tpm else 0
+        os.makedirs(state_dir, exist_ok=True)
+        file_name = re.sub(r"[^\w.-]", "_", key)
+        self.state_path = os.path.join(state_dir, f"{file_name}.json")
+        self.lock_path = os.path.join(state_dir, f"{file_name}.lock")
+        self._local_lock = threading.Lock()
+
+    # Run update(state, now) on the shared state under the file lock and save the result
+    def _update(self, update):
+        with self._local_lock, FileLock(self.lock_path):
+            now = time.time()
+            try:
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = {
+                    "requests": self.request_capacity,
+                    "tokens": self.token_capacity,
+                    "updated": now,
+                    "blocked_until": 0,
+                    "next_seq": 0,
+                    "queue": [],
+                }
+            # Refill both buckets for the time since the last update
+            elapsed = max(0.0, now - state["updated"])
+            if self.rpm:
+                state["requests"] = min(self.request_capacity, state["requests"] + elapsed * self.rpm / 60)
+            if self.tpm:
+                state["tokens"] = min(self.token_capacity, state["tokens"] + elapsed * self.tpm / 60)
+            state["updated"] = now
+            result = update(state, now)
+            temp_path = f"{self.state_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(temp_path, self.state_path)
+            return result
+
+    def _enqueue(self, ticket, priority):
+        def update(state, now):
+            state["queue"].append({"ticket": ticket, "priority": priority, "seq": state["next_seq"], "seen": now})
+            state["next_seq"] += 1
+        self._update(update)
+
+    def _dequeue(self, ticket):
+        def update(state, now):
+            state["queue"] = [entry for entry in state["queue"] if entry["ticket"] != ticket]
+        self._update(update)
+
+    # Take the quota for one request if this ticket is first in line; returns 0 on success, otherwise
+    # the number of seconds to wait before trying again. A ticket missing from the state (the file was
+    # deleted or reset while it waited) is queued again at the back.
+    def _try_take(self, ticket, tokens, priority=DEFAULT_PRIORITY):
+        def update(state, now):
+            queue = [entry for entry in state["queue"] if now - entry["seen"] < STALE_AFTER or entry["ticket"] == ticket]
+            own = next((entry for entry in queue if entry["ticket"] == ticket), None)
+            if own is None:
+                own = {"ticket": ticket, "priority": priority, "seq": state["next_seq"]}
+                state["next_seq"] += 1
+                queue.append(own)
+            own["seen"] = now
+            state["queue"] = queue
+            if now < state["blocked_until"]:
+                return state["blocked_until"] - now
+            head = min(queue, key=lambda entry: (entry["priority"], entry["seq"]))
+            if head["ticket"] != ticket:
+                return None
+            # A request larger than the whole bucket waits for a full bucket and takes it
+            needed_tokens = min(tokens, self.token_capacity) if self.tpm else 0
+            waits = []
+            if self.rpm and state["requests"] < 1:
+                waits.append((1 - state["requests"]) * 60 / self.rpm)
+            if self.tpm and state["tokens"] < needed_tokens:
+                waits.append((needed_tokens - state["tokens"]) * 60 / self.tpm)
+            if waits:
+                return max(waits)
+            if self.rpm:
+                state["requests"] -= 1
+            if self.tpm:
+                state["tokens"] -= tokens
+            state["queue"] = [entry for entry in queue if entry["ticket"] != ticket]
+            return 0
+        return self._update(update)
+
+    @staticmethod
+    def _sleep_time(wait):
+        # Someone else is first in line: look again soon
+        if wait is None:
+            return random.uniform(0.02, 0.1)
+        # Jitter spreads the processes that were all waiting for the same moment
+        return min(wait, MAX_POLL) + random.uniform(0, min(0.25, wait * 0.1 + 0.01))
+
+    # Block until the request may be sent. tokens is the expected prompt plus completion size.
+    def acquire(self, tokens=0, priority=DEFAULT_PRIORITY, timeout=None):
+        ticket = uuid.uuid4().hex
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._enqueue(ticket, priority)
+        try:
+            while True:
+                wait = self._try_take(ticket, tokens, priority)
+                if wait == 0:
+                    ticket = None
+                    return
+                sleep = self._sleep_time(wait)
+                if deadline is not None and time.monotonic() + sleep > deadline:
+                    raise RateLimitTimeout(f"No {self.key} quota within {timeout}s")
+                time.sleep(sleep)
+        finally:
+            if ticket is not None:
+                self._dequeue(ticket)
+
+    async def acquire_async(self, tokens=0, priority=DEFAULT_PRIORITY, timeout=None):
+        ticket = uuid.uuid4().hex
+        deadline = None if timeout is None else time.monotonic() + timeout
+        await asyncio.to_thread(self._enqueue, ticket, priority)
+        try:
+            while True:
+                wait = await asyncio.to_thread(self._try_take, ticket, tokens, priority)
+                if wait == 0:
+                    ticket = None
+                    return
+                sleep = self._sleep_time(wait)
+                if deadline is not None and time.monotonic() + sleep > deadline:
+                    raise RateLimitTimeout(f"No {self.key} quota within {timeout}s")
+                await asyncio.sleep(sleep)
+        finally:
+            if ticket is not None:
+                await asyncio.to_thread(self._dequeue, ticket)
+
+    # Correct the token bucket once the real usage is known
+    def settle(self, estimated_tokens, actual_tokens):
+        if not self.tpm or actual_tokens is None:
+            return
+
+        def update(state, now):
+            state["tokens"] = min(self.token_capacity, state["tokens"] + estimated_tokens - actual_tokens)
+        self._update(update)
+
+    # After a 429, hold every process back for delay seconds
+    def block(self, delay):
+        def update(state, now):
+            state["blocked_until"] = max(state["blocked_until"], now + delay)
+            # The server's window is full, so start again from empty buckets
+            state["requests"] = min(state["requests"], 0)
+        self._update(update)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider, model=None):
+    key = f"{provider}:{model}" if model else provider
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limits = LIMITS.get(key) or LIMITS.get(provider) or {}
+            limiter = RateLimiter(key, limits.get("rpm", 0), limits.get("tpm", 0))
+            _limiters[key] = limiter
+        return limiter
+
+
+def _parse_retry_after(value):
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# For a rate-limit error from any of the SDKs, the Retry-After in seconds (0 when absent); None for other errors
+def rate_limit_retry_after(error):
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    status = getattr(status, "value", status)
+    if status != 429 and type(error).__name__ not in ("RateLimitError", "TooManyRequests", "ResourceExhausted"):
+        return None
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    retry_after = _parse_retry_after(headers.get("retry-after") or headers.get("Retry-After"))
+    if retry_after is None and headers.get("retry-after-ms"):
+        retry_after = float(headers["retry-after-ms"]) / 1000
+    return retry_after or 0.0
+
+
+def backoff_delay(attempt):
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+# Call call() within the quota of (provider, model), retrying rate-limit errors.
+# tokens is the expected request size; usage(response) returns the real size to settle the bucket.
+def run_rate_limited(provider, model, call, tokens=0, priority=DEFAULT_PRIORITY, usage=None, max_retries=MAX_RETRIES):
+    limiter = None if RATE_LIMIT_DISABLED else get_limiter(provider, model)
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire(tokens, priority)
+        stamp = api_call_started.get()
+        if stamp is not None:
+            stamp["started"] = time.perf_counter()
+        try:
+            response = call()
+        except Exception as e:
+            retry_after = rate_limit_retry_after(e)
+            if retry_after is None or attempt >= max_retries:
+                raise
+            delay = retry_after or backoff_delay(attempt)
+            attempt += 1
+            if limiter is not None:
+                limiter.block(delay)
+            else:
+                time.sleep(delay)
+            continue
+        if limiter is not None and usage is not None:
+            limiter.settle(tokens, usage(response))
+        return response
+
+
+async def run_rate_limited_async(provider, model, call, tokens=0, priority=DEFAULT_PRIORITY, usage=None,
+                                 max_retries=MAX_RETRIES):
+    limiter = None if RATE_LIMIT_DISABLED else get_limiter(provider, model)
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.acquire_async(tokens, priority)
+        stamp = api_call_started.get()
+        if stamp is not None:
+            stamp["started"] = time.perf_counter()
+        try:
+            response = await call()
+        except Exception as e:
+            retry_after = rate_limit_retry_after(e)
+            if retry_after is None or attempt >= max_retries:
+                raise
+            delay = retry_after or backoff_delay(attempt)
+            attempt += 1
+            if limiter is not None:
+                await asyncio.to_thread(limiter.block, delay)
+            else:
+                await asyncio.sleep(delay)
+            continue
+        if limiter is not None and usage is not None:
+            await asyncio.to_thread(limiter.settle, tokens, usage(response))
+        return response
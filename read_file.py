@@ -1,22 +1,36 @@
 from dotenv import load_dotenv
 import os
 import google.generativeai as genai
+from clients import configure_gemini
+from rate_limiter import run_rate_limited
+from response_cache import request_tokens, stream_key
+from token_stream import FileSink, gemini_deltas, stream_to
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Configure the Generative AI API
-genai.configure(api_key=os.environ["API_KEY"])
+configure_gemini()
 
 # Function to read content from a file
 def read_file(file_path):
     with open(file_path, 'r') as file:
         return file.read()
 
-# Function to write content to a file
-def write_to_file(file_name, content):
-    with open(file_name, 'w') as file:
-        file.write(content)
+# Function to stream generated content into a file as it arrives
+def write_to_file(file_name, model, prompt):
+    request = lambda: run_rate_limited(
+        "gemini",
+        model.model_name,
+        lambda: model.generate_content(prompt, stream=True),
+        tokens=request_tokens(prompt),
+    )
+    return stream_to(
+        [FileSink(file_name)],
+        request,
+        deltas=gemini_deltas,
+        cache_key=stream_key("gemini", model.model_name, prompt),
+    )
 
 # Read the file content (assume the file contains SQL schema)
 file_content = read_file('EMPLOYEE_REGISTRY.SQL')  # Replace with your file name
@@ -24,13 +38,10 @@ file_content = read_file('EMPLOYEE_REGISTRY.SQL')  # Replace with your file name
 # Dynamically create a prompt based on the file content
 prompt = f"Based on the DATABASE schema provided, create 100 data entries for each of the tables and save them in separate text files: {file_content}"
 
-# Generate a response using the model
+# Generate the data with the model, written to a text file while it streams in
 model = genai.GenerativeModel("gemini-1.5-flash")
-response = model.generate_content(prompt)
-
-# Save the response to a text file
 output_file = 'generated_data.txt'  # You can name the file as needed
-write_to_file(output_file, response.text)
+metrics = write_to_file(output_file, model, prompt)
 
 # Print confirmation and location of the saved file
-print(f"Response saved to {output_file}")
+print(f"Response saved to {output_file} ({metrics.summary()})")
@@ -3,12 +3,14 @@ import requests
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 import google.generativeai as genai
+from clients import configure_gemini
+from response_cache import cached_generate_content
 
 # Step 1: Load environment variables from .env file (for API keys, etc.)
 load_dotenv()
 
 # Step 2: Configure Google Gemini API
-genai.configure(api_key=os.environ["API_KEY"])
+configure_gemini()
 
 # Step 3: Function to scrape news headlines from a website
 def scrape_news():
@@ -29,7 +31,7 @@ def scrape_news():
 def generate_summary(news_data):
     # Using Gemini-1.5-flash model to generate content
     model = genai.GenerativeModel("gemini-1.5-flash")
-    response = model.generate_content(f"Summarize the following tech news from India:\n{news_data}")
+    response = cached_generate_content(model, f"Summarize the following tech news from India:\n{news_data}")
     
     # Display the generated response
     print("AI-Generated Summary:")
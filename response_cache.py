@@ -0,0 +1,359 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from rate_limiter import DEFAULT_PRIORITY, run_rate_limited, run_rate_limited_async
+from tracing import span, token_usage
+
+# Shared on-disk cache for model responses.
+# Entries are keyed by a hash of provider, model, normalized messages and sampling parameters,
+# expire after a per-entry TTL and are evicted least-recently-used once the cache grows past max_bytes.
+#
+# Environment variables:
+#   AI_CACHE_PATH             location of the SQLite file (default .cache/responses.sqlite3)
+#   AI_CACHE_MAX_BYTES        total size of stored responses before LRU eviction kicks in
+#   AI_CACHE_TTL              default lifetime of an entry in seconds (0 keeps entries forever)
+#   AI_CACHE_DISABLE=1        never read or write the cache, whatever the caller asks for
+#   AI_CACHE_MAX_TEMPERATURE  bypass the cache for requests sampled above this temperature (default 0)
+# Requests that leave the temperature unset are cached, which suits the one-shot scripts re-sending the same
+# prompt. Providers sample those at a nonzero default temperature, so callers whose answers must vary (the
+# chat handlers in xai.py, xai_async.py and llama.py) pass bypass=True.
+# Requests that miss the cache go through the shared rate limiter (rate_limiter.py), which also retries 429s.
+CACHE_PATH = os.environ.get("AI_CACHE_PATH", os.path.join(".cache", "responses.sqlite3"))
+MAX_BYTES = int(os.environ.get("AI_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+DEFAULT_TTL = float(os.environ.get("AI_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_DISABLED = os.environ.get("AI_CACHE_DISABLE") == "1"
+MAX_TEMPERATURE = float(os.environ.get("AI_CACHE_MAX_TEMPERATURE") or "0")
+# Completion size assumed for rate limiting when the request sets no max_tokens
+DEFAULT_OUTPUT_TOKENS = 1024
+
+
+class ResponseCache:
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_BYTES, ttl=DEFAULT_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+        # Running estimate of the stored bytes; see _evict
+        self._total = None
+        self._total_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " payload TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " expires_at REAL,"
+                " last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    # SQLite connections cannot be shared between threads, so each thread gets its own
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute("SELECT payload, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            payload, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return json.loads(payload)
+
+    def put(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        payload = json.dumps(value)
+        expires_at = now + ttl if ttl else None
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, payload, size, expires_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), expires_at, now),
+            )
+            self._evict(conn, now, len(payload))
+
+    # Drop expired entries, then the least recently used ones until the cache fits in max_bytes.
+    # The table is only scanned once the running total passes max_bytes. The total only ever overestimates
+    # (a replaced entry is counted twice) and is corrected by every scan; writes by other processes are
+    # picked up at the next one.
+    def _evict(self, conn, now, added):
+        with self._total_lock:
+            if self._total is None:
+                self._total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            else:
+                self._total += added
+            if self._total <= self.max_bytes:
+                return
+            conn.execute("DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    total -= size
+            self._total = total
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM responses")
+        with self._total_lock:
+            self._total = 0
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
+
+
+# Turn SDK message objects, uploaded files and enums into plain JSON-compatible values
+def normalize(value):
+    if hasattr(value, "as_dict"):
+        return normalize(value.as_dict())
+    if isinstance(value, dict):
+        return {str(k): normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, bytes):
+        return {"sha256": hashlib.sha256(value).hexdigest()}
+    if hasattr(value, "uri") and hasattr(value, "name"):
+        return {"file": value.name}
+    if hasattr(value, "value"):
+        return normalize(value.value)
+    return str(value)
+
+
+def make_key(provider, model, messages, params):
+    material = json.dumps(
+        {
+            "provider": provider,
+            "model": model,
+            "messages": normalize(messages),
+            "params": normalize(params),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+# Expected prompt plus completion tokens of a request, charged to the tokens-per-minute bucket up front
+def request_tokens(messages, max_tokens=None):
+    prompt = len(json.dumps(normalize(messages), ensure_ascii=False)) // 4
+    return prompt + (max_tokens or DEFAULT_OUTPUT_TOKENS)
+
+
+def used_tokens(response):
+    usage = token_usage(response)
+    if not usage or usage["prompt_tokens"] is None:
+        return None
+    return usage["prompt_tokens"] + (usage["completion_tokens"] or 0)
+
+
+# A disabled cache and streamed calls always bypass; otherwise an explicit bypass wins over the temperature rule
+def _should_bypass(bypass, temperature, stream):
+    if CACHE_DISABLED or stream:
+        return True
+    if bypass is not None:
+        return bypass
+    return temperature is not None and temperature > MAX_TEMPERATURE
+
+
+# Cache key for a streamed request (see token_stream.stream_to), or None when the cache is bypassed for it.
+# Streamed entries hold only the assembled text, so they are keyed apart from whole responses.
+def stream_key(provider, model, messages, params=None, bypass=None, temperature=None):
+    if _should_bypass(bypass, temperature, False):
+        return None
+    return make_key(provider, model, messages, dict(params or {}, stream=True))
+
+
+def _lookup(key, load, fetch, dump, ttl, current=None):
+    cache = get_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        if current is not None:
+            current.set(cache="hit")
+        return load(cached)
+    response = fetch()
+    cache.put(key, dump(response), ttl=ttl)
+    if current is not None:
+        current.set(cache="miss")
+    return response
+
+
+# Cached replacement for ChatCompletionsClient.complete (GitHub Models / Azure AI Inference)
+def cached_complete(client, bypass=None, ttl=None, priority=DEFAULT_PRIORITY, **kwargs):
+    with span("model.call", provider="azure-inference", model=kwargs.get("model")) as current:
+        def fetch():
+            return run_rate_limited(
+                "azure-inference",
+                kwargs.get("model"),
+                lambda: client.complete(**kwargs),
+                tokens=request_tokens(kwargs.get("messages"), kwargs.get("max_tokens")),
+                priority=priority,
+                usage=used_tokens,
+            )
+
+        if _should_bypass(bypass, kwargs.get("temperature"), kwargs.get("stream")):
+            current.set(cache="bypass")
+            response = fetch()
+            current.set_usage(response)
+            return response
+
+        from azure.ai.inference.models import ChatCompletions
+
+        params = {k: v for k, v in kwargs.items() if k not in ("messages", "model")}
+        key = make_key("azure-inference", kwargs.get("model"), kwargs.get("messages"), params)
+        response = _lookup(
+            key,
+            load=ChatCompletions,
+            fetch=fetch,
+            dump=lambda response: response.as_dict(),
+            ttl=ttl,
+            current=current,
+        )
+        current.set_usage(response)
+        return response
+
+
+# Cached replacement for GenerativeModel.generate_content (Gemini)
+def cached_generate_content(model, contents, bypass=None, ttl=None, priority=DEFAULT_PRIORITY, **kwargs):
+    with span("model.call", provider="gemini", model=model.model_name) as current:
+        generation_config = normalize(kwargs.get("generation_config") or getattr(model, "_generation_config", None) or {})
+        if not isinstance(generation_config, dict):
+            generation_config = {}
+        temperature = generation_config.get("temperature")
+
+        def fetch():
+            return run_rate_limited(
+                "gemini",
+                model.model_name,
+                lambda: model.generate_content(contents, **kwargs),
+                tokens=request_tokens(contents, generation_config.get("max_output_tokens")),
+                priority=priority,
+                usage=used_tokens,
+            )
+
+        if _should_bypass(bypass, temperature, kwargs.get("stream")):
+            current.set(cache="bypass")
+            response = fetch()
+            current.set_usage(response)
+            return response
+
+        import google.generativeai as genai
+
+        params = dict(kwargs)
+        params["generation_config"] = generation_config
+        params["system_instruction"] = getattr(model, "_system_instruction", None)
+        key = make_key("gemini", model.model_name, contents, params)
+        response = _lookup(
+            key,
+            load=lambda data: genai.types.GenerateContentResponse.from_response(genai.protos.GenerateContentResponse(data)),
+            fetch=fetch,
+            dump=lambda response: response.to_dict(),
+            ttl=ttl,
+            current=current,
+        )
+        current.set_usage(response)
+        return response
+
+
+# Cached replacement for OpenAI-compatible client.chat.completions.create (xAI)
+def cached_chat_create(client, bypass=None, ttl=None, priority=DEFAULT_PRIORITY, **kwargs):
+    with span("model.call", provider="openai", model=kwargs.get("model")) as current:
+        def fetch():
+            return run_rate_limited(
+                "openai",
+                kwargs.get("model"),
+                lambda: client.chat.completions.create(**kwargs),
+                tokens=request_tokens(kwargs.get("messages"), kwargs.get("max_tokens")),
+                priority=priority,
+                usage=used_tokens,
+            )
+
+        if _should_bypass(bypass, kwargs.get("temperature"), kwargs.get("stream")):
+            current.set(cache="bypass")
+            completion = fetch()
+            current.set_usage(completion)
+            return completion
+
+        from openai.types.chat import ChatCompletion
+
+        params = {k: v for k, v in kwargs.items() if k not in ("messages", "model")}
+        params["base_url"] = str(client.base_url)
+        key = make_key("openai", kwargs.get("model"), kwargs.get("messages"), params)
+        completion = _lookup(
+            key,
+            load=ChatCompletion.model_validate,
+            fetch=fetch,
+            dump=lambda completion: completion.model_dump(mode="json"),
+            ttl=ttl,
+            current=current,
+        )
+        current.set_usage(completion)
+        return completion
+
+
+# Async counterpart of cached_chat_create for AsyncOpenAI clients.
+# SQLite access runs in a worker thread so the event loop is never blocked on disk.
+async def cached_chat_create_async(client, bypass=None, ttl=None, priority=DEFAULT_PRIORITY, **kwargs):
+    with span("model.call", provider="openai", model=kwargs.get("model")) as current:
+        def fetch():
+            return run_rate_limited_async(
+                "openai",
+                kwargs.get("model"),
+                lambda: client.chat.completions.create(**kwargs),
+                tokens=request_tokens(kwargs.get("messages"), kwargs.get("max_tokens")),
+                priority=priority,
+                usage=used_tokens,
+            )
+
+        if _should_bypass(bypass, kwargs.get("temperature"), kwargs.get("stream")):
+            current.set(cache="bypass")
+            completion = await fetch()
+            current.set_usage(completion)
+            return completion
+
+        from openai.types.chat import ChatCompletion
+
+        params = {k: v for k, v in kwargs.items() if k not in ("messages", "model")}
+        params["base_url"] = str(client.base_url)
+        key = make_key("openai", kwargs.get("model"), kwargs.get("messages"), params)
+        cache = get_cache()
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            current.set(cache="hit")
+            completion = ChatCompletion.model_validate(cached)
+        else:
+            current.set(cache="miss")
+            completion = await fetch()
+            await asyncio.to_thread(cache.put, key, completion.model_dump(mode="json"), ttl)
+        current.set_usage(completion)
+        return completion
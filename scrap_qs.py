@@ -1,39 +1,84 @@
+import argparse
+import asyncio
+import fnmatch
 import os
-import requests
-from bs4 import BeautifulSoup
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup, SoupStrainer
 from dotenv import load_dotenv
 import google.generativeai as genai
+from clients import configure_gemini
+from http_cache import CRAWL_CONCURRENCY, fetch_pages
+from rate_limiter import run_rate_limited
+from response_cache import request_tokens, stream_key
+from token_stream import FileSink, StdoutSink, gemini_deltas, stream_to
 
 # Step 1: Load environment variables from .env file (for API keys, etc.)
 load_dotenv()
 
 # Step 2: Configure Google Gemini API
-genai.configure(api_key=os.environ["API_KEY"])
+configure_gemini()
 
-# Step 3: Function to scrape questions from the specified webpage
-def scrape_questions():
-    url = "https://questions.examside.com/past-years/jee/jee-main/physics/vector-algebra"
-    response = requests.get(url)
-    
-    if response.status_code == 200:
-        soup = BeautifulSoup(response.content, "html.parser")
-        
-        # Find the div with the specified class containing the questions
-        question_div = soup.find("div", class_="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-2 lg:gap-4")
-        
-        if question_div:
-            # Extract text content from the div
-            questions = question_div.get_text(separator="\n", strip=True)
-            return questions
-        else:
-            print("No questions found in the specified div.")
-            return None
-    else:
-        print(f"Failed to retrieve the webpage. Status code: {response.status_code}")
+DEFAULT_URL = "https://questions.examside.com/past-years/jee/jee-main/physics/vector-algebra"
+# The div holding the questions on an examside topic page
+QUESTION_DIV_CLASS = "grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-2 lg:gap-4"
+# Topics turned into LaTeX at the same time in crawler mode (requests share the Gemini rate limiter)
+LATEX_WORKERS = 4
+
+# lxml is much faster than the pure-Python parser; fall back to it when lxml isn't installed
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# Step 3: Function to pull the question text out of a topic page.
+# Only the question div is parsed into a tree; the rest of the page is skipped by the SoupStrainer.
+def extract_questions(html):
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=SoupStrainer("div", class_=QUESTION_DIV_CLASS))
+    question_div = soup.find("div")
+    if question_div is None:
         return None
+    return question_div.get_text(separator="\n", strip=True)
+
+# Function to scrape several topic pages concurrently; returns {url: questions or None} in the order given.
+# Pages come from the on-disk HTTP cache when they haven't changed (see http_cache).
+async def scrape_topics(urls, concurrency=CRAWL_CONCURRENCY, verbose=False):
+    results = {url: None for url in urls}
+    async for url, page in fetch_pages(urls, concurrency):
+        if isinstance(page, Exception):
+            print(f"Failed to retrieve {url}: {page}")
+        elif not page.ok:
+            print(f"Failed to retrieve {url}. Status code: {page.status}")
+        else:
+            results[url] = await asyncio.to_thread(extract_questions, page.body)
+            if results[url] is None:
+                print(f"No questions found in the specified div on {url}.")
+            elif verbose:
+                print(f"{url}: {page.source}, {len(results[url])} characters of questions")
+    return results
+
+# Function to expand a topic URL pattern such as ".../jee-main/physics/*" into the matching links
+# found on the page the pattern's directory points to
+async def find_topic_urls(pattern, concurrency=CRAWL_CONCURRENCY):
+    index_url = re.split(r"[*?\[]", pattern, maxsplit=1)[0].rsplit("/", 1)[0]
+    async for _, page in fetch_pages([index_url], concurrency):
+        if isinstance(page, Exception) or not page.ok:
+            print(f"Could not read the topic index {index_url}")
+            return []
+        soup = BeautifulSoup(page.body, HTML_PARSER, parse_only=SoupStrainer("a", href=True))
+        links = (urljoin(index_url + "/", anchor["href"]).split("#")[0] for anchor in soup.find_all("a"))
+        return list(dict.fromkeys(link for link in links if fnmatch.fnmatchcase(link, pattern)))
+    return []
+
+# Function to scrape the questions from a single topic page
+def scrape_questions(url=DEFAULT_URL):
+    return asyncio.run(scrape_topics([url]))[url]
 
 # Step 4: Function to generate structured questions in LaTeX format using Gemini API
-def generate_latex_structure(scraped_data):
+# The LaTeX is streamed to the console and written to the .tex file as it is generated
+def generate_latex_structure(scraped_data, filename="structured_questions.tex", echo=True):
     # Define the LaTeX structure prompt for Gemini API
     prompt = (
         f"Organize the following questions into a professional LaTeX format for a question paper to use in overleaf. Keep Questions content as it is. Don't change the content. "
@@ -42,32 +87,79 @@ def generate_latex_structure(scraped_data):
     
     # Using Gemini-1.5-flash model to generate LaTeX content
     model = genai.GenerativeModel("gemini-1.5-flash")
-    response = model.generate_content(prompt)
-    
-    # Extracting and returning the LaTeX content generated by the Gemini API
-    return response.text
+    if echo:
+        print("Generated LaTeX Content:")
+    metrics = stream_to(
+        [StdoutSink(), FileSink(filename)] if echo else [FileSink(filename)],
+        lambda: run_rate_limited(
+            "gemini",
+            model.model_name,
+            lambda: model.generate_content(prompt, stream=True),
+            tokens=request_tokens(prompt),
+        ),
+        deltas=gemini_deltas,
+        cache_key=stream_key("gemini", model.model_name, prompt),
+    )
+    print(f"LaTeX content saved to '{filename}' ({metrics.summary()}).")
+    return metrics
+
+# Function to crawl many topic pages and write one .tex file per topic into output_dir
+def crawl(urls, output_dir=".", concurrency=CRAWL_CONCURRENCY, scrape_only=False):
+    scraped = asyncio.run(scrape_topics(urls, concurrency, verbose=True))
+    topics = {url: questions for url, questions in scraped.items() if questions}
+    print(f"Scraped {len(topics)} of {len(urls)} topic pages.")
+    if scrape_only or not topics:
+        return topics
 
-# Step 5: Function to save the LaTeX content to a .tex file
-def save_to_latex(latex_content, filename="structured_questions.tex"):
-    with open(filename, "w", encoding="utf-8") as file:
-        file.write(latex_content)
-    print(f"LaTeX content saved to '{filename}'.")
+    os.makedirs(output_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=LATEX_WORKERS) as executor:
+        futures = {}
+        for url, questions in topics.items():
+            slug = url.rstrip("/").rsplit("/", 1)[-1] or "index"
+            filename = os.path.join(output_dir, f"{slug}.tex")
+            futures[url] = executor.submit(generate_latex_structure, questions, filename, False)
+        for url, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Could not generate LaTeX for {url}: {e}")
+    return topics
 
 # Main execution
+# With no arguments the default topic page is scraped and turned into structured_questions.tex as before.
+# Crawler mode takes topic URLs, a file of URLs (one per line) or a pattern, e.g.
+#   python scrap_qs.py --pattern "https://questions.examside.com/past-years/jee/jee-main/physics/*" --output-dir physics
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape exam questions and structure them as LaTeX.")
+    parser.add_argument("urls", nargs="*", help="topic page URLs")
+    parser.add_argument("--urls-file", help="file with one topic URL per line")
+    parser.add_argument("--pattern", help="glob over the links of the pattern's directory page")
+    parser.add_argument("--concurrency", type=int, default=CRAWL_CONCURRENCY)
+    parser.add_argument("--output-dir", default=".", help="where the per-topic .tex files go")
+    parser.add_argument("--scrape-only", action="store_true", help="fetch and parse the pages but skip Gemini")
+    args = parser.parse_args()
+
     try:
-        # Scrape the questions from the webpage
-        scraped_questions = scrape_questions()
-        
-        if scraped_questions:
-            print("Scraped Questions:\n", scraped_questions)
-            
-            # Generate structured LaTeX format using Gemini API
-            latex_content = generate_latex_structure(scraped_questions)
-            print("Generated LaTeX Content:\n", latex_content)
-            
-            # Save the generated LaTeX content to a .tex file
-            save_to_latex(latex_content)
-    
+        urls = list(args.urls)
+        if args.urls_file:
+            with open(args.urls_file, "r", encoding="utf-8") as f:
+                urls += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        if args.pattern:
+            urls += asyncio.run(find_topic_urls(args.pattern, args.concurrency))
+
+        if urls:
+            crawl(list(dict.fromkeys(urls)), args.output_dir, args.concurrency, args.scrape_only)
+        elif args.pattern:
+            print(f"No links match {args.pattern}")
+        else:
+            # Scrape the questions from the webpage
+            scraped_questions = scrape_questions()
+
+            if scraped_questions:
+                print("Scraped Questions:\n", scraped_questions)
+
+                # Generate structured LaTeX format using Gemini API, saved to a .tex file as it streams
+                generate_latex_structure(scraped_questions)
+
     except Exception as e:
         print(f"An error occurred: {e}")
@@ -1,22 +1,20 @@
 import os
-from azure.ai.inference import ChatCompletionsClient
 from azure.ai.inference.models import SystemMessage, UserMessage
-from azure.core.credentials import AzureKeyCredential
+from clients import GITHUB_MODELS_ENDPOINT, get_chat_client
 from dotenv import load_dotenv
+from response_cache import cached_complete
 
 load_dotenv()
 
 
-endpoint = "https://models.inference.ai.azure.com"
+endpoint = GITHUB_MODELS_ENDPOINT
 model_name = "AI21-Jamba-1.5-Large"
 token = os.getenv("GITHUB_TOKEN")
 
-client = ChatCompletionsClient(
-    endpoint=endpoint,
-    credential=AzureKeyCredential(token),
-)
+client = get_chat_client(endpoint, model=model_name, token=token)
 
-response = client.complete(
+response = cached_complete(
+    client,
     messages=[
         SystemMessage(content="You are a helpful assistant."),
         UserMessage(content="What is the capital of France?"),
@@ -1,31 +1,31 @@
 import os
-from azure.ai.inference import ChatCompletionsClient
 from azure.ai.inference.models import SystemMessage, UserMessage
-from azure.core.credentials import AzureKeyCredential
+from clients import GITHUB_MODELS_ENDPOINT, get_chat_client
 from dotenv import load_dotenv
+from rate_limiter import run_rate_limited
+from token_stream import StdoutSink, stream_to
 
 load_dotenv()
 
 token = os.getenv("GITHUB_TOKEN")
-endpoint = "https://models.inference.ai.azure.com"
+endpoint = GITHUB_MODELS_ENDPOINT
 model_name = "Phi-3.5-MoE-instruct"
 
-client = ChatCompletionsClient(
-    endpoint=endpoint,
-    credential=AzureKeyCredential(token),
-)
+client = get_chat_client(endpoint, model=model_name, token=token)
 
-response = client.complete(
-    stream=True,
-    messages=[
-        SystemMessage(content="You are a helpful assistant."),
-        UserMessage(content="Give me 5 good reasons why I should exercise every day."),
-    ],
-    model=model_name,
+# Deltas are printed as they arrive; the pipeline also measures time to first token and throughput
+messages = [
+    SystemMessage(content="You are a helpful assistant."),
+    UserMessage(content="Give me 5 good reasons why I should exercise every day."),
+]
+metrics = stream_to(
+    [StdoutSink()],
+    lambda: run_rate_limited(
+        "azure-inference",
+        model_name,
+        lambda: client.complete(stream=True, messages=messages, model=model_name),
+    ),
 )
-
-for update in response:
-    if update.choices:
-        print(update.choices[0].delta.content or "", end="")
+print(metrics.summary())
 
 client.close()
\ No newline at end of file
@@ -0,0 +1,268 @@
+import contextvars
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+from response_cache import get_cache
+from tracing import span
+
+# Streaming pipeline for model output.
+# Text deltas from a streamed response are handed to one or more sinks (stdout, a file written as the text
+# arrives, a web socket) as they come in, so long outputs are never held in memory in full. Each sink runs in
+# its own thread behind a bounded queue: when a sink falls behind, reading from the model pauses until it
+# catches up instead of buffering without limit. Every run records time to first token, tokens per second
+# and total latency. Given a cache_key (response_cache.stream_key), a finished stream's text is stored in the
+# response cache and replayed through the sinks in REPLAY_CHUNK pieces the next time instead of calling the
+# model. Only outputs up to STREAM_CACHE_MAX_CHARS are cached: the text is collected for the cache until it
+# passes that size and then dropped, so caching never holds more than that in memory.
+#
+# Environment variables:
+#   STREAM_BUFFER           deltas queued per sink before the stream waits for that sink
+#   STREAM_FLUSH_BYTES      bytes a FileSink buffers before flushing them to disk
+#   STREAM_CACHE_MAX_CHARS  longest streamed output stored in the response cache
+STREAM_BUFFER = int(os.environ.get("STREAM_BUFFER", "256"))
+FLUSH_BYTES = int(os.environ.get("STREAM_FLUSH_BYTES", "65536"))
+CACHE_MAX_CHARS = int(os.environ.get("STREAM_CACHE_MAX_CHARS", str(1024 * 1024)))
+
+# Characters per delta when a cached output is replayed
+REPLAY_CHUNK = 4096
+
+_END = object()
+
+
+class StreamMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token = None
+        self.finished = None
+        self.chars = 0
+        self.chunks = 0
+        # Output token count reported by the API, when the stream carries usage
+        self.output_tokens = None
+
+    def record(self, text):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.chars += len(text)
+        self.chunks += 1
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def tokens(self):
+        if self.output_tokens is not None:
+            return self.output_tokens
+        # Same four-characters-per-token estimate as chat_sessions.estimate_tokens
+        return -(-self.chars // 4)
+
+    @property
+    def time_to_first_token(self):
+        return None if self.first_token is None else self.first_token - self.started
+
+    @property
+    def total_latency(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    # Generation rate after the first token, which leaves out queueing and prompt processing
+    @property
+    def tokens_per_second(self):
+        if self.first_token is None:
+            return 0.0
+        elapsed = (self.finished or time.perf_counter()) - self.first_token
+        return self.tokens / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self):
+        return {
+            "time_to_first_token": self.time_to_first_token,
+            "tokens_per_second": self.tokens_per_second,
+            "total_latency": self.total_latency,
+            "tokens": self.tokens,
+            "chars": self.chars,
+            "chunks": self.chunks,
+        }
+
+    def summary(self):
+        ttft = "n/a" if self.first_token is None else f"{self.time_to_first_token:.2f}s"
+        return (
+            f"time to first token {ttft}, {self.tokens_per_second:.1f} tokens/s, "
+            f"{self.tokens} tokens in {self.total_latency:.2f}s"
+        )
+
+
+# Delta extractors: turn a streamed response into text deltas, noting token usage when the API reports it
+
+# ChatCompletionsClient.complete(stream=True) (GitHub Models / Azure AI Inference)
+def azure_deltas(response, metrics):
+    for update in response:
+        usage = getattr(update, "usage", None)
+        if usage is not None and getattr(usage, "completion_tokens", None):
+            metrics.output_tokens = usage.completion_tokens
+        if update.choices:
+            yield update.choices[0].delta.content or ""
+
+
+# OpenAI-compatible client.chat.completions.create(stream=True) (xAI)
+def openai_deltas(response, metrics):
+    for chunk in response:
+        usage = getattr(chunk, "usage", None)
+        if usage is not None and getattr(usage, "completion_tokens", None):
+            metrics.output_tokens = usage.completion_tokens
+        if chunk.choices:
+            yield chunk.choices[0].delta.content or ""
+
+
+# GenerativeModel.generate_content(..., stream=True) (Gemini)
+def gemini_deltas(response, metrics):
+    for chunk in response:
+        usage = getattr(chunk, "usage_metadata", None)
+        if usage is not None and getattr(usage, "candidates_token_count", None):
+            metrics.output_tokens = usage.candidates_token_count
+        # Chunks without text (safety or finish information only) raise on .text
+        try:
+            yield chunk.text
+        except ValueError:
+            continue
+
+
+# Sinks receive write(text) for every delta and close(metrics, error) once at the end
+
+class StdoutSink:
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def write(self, text):
+        self.stream.write(text)
+        self.stream.flush()
+
+    def close(self, metrics, error=None):
+        self.stream.write("\n")
+        self.stream.flush()
+
+
+# Writes the text to <path>.part as it arrives and renames it to path once the stream completed, so path
+# only ever holds complete output. header and footer are written before and after the streamed text.
+class FileSink:
+    def __init__(self, path, header="", footer="", encoding="utf-8", flush_bytes=FLUSH_BYTES):
+        self.path = path
+        self.part_path = f"{path}.part"
+        self.footer = footer
+        self.flush_bytes = flush_bytes
+        self._pending = 0
+        self._file = open(self.part_path, "w", encoding=encoding)
+        if header:
+            self.write(header)
+
+    def write(self, text):
+        self._file.write(text)
+        self._pending += len(text)
+        if self._pending >= self.flush_bytes:
+            with span("file.write", path=self.part_path, chars=self._pending):
+                self._file.flush()
+            self._pending = 0
+
+    def close(self, metrics, error=None):
+        with span("file.write", path=self.path, chars=self._pending, final=True):
+            if error is None and self.footer:
+                self._file.write(self.footer)
+            self._file.close()
+            if error is None:
+                os.replace(self.part_path, self.path)
+
+
+# Forwards deltas over a web socket (any object with send(str)) as JSON messages:
+# {"delta": text} for each delta, then {"done": true, "metrics": {...}} or {"error": message}
+class WebSocketSink:
+    def __init__(self, socket):
+        self.socket = socket
+
+    def write(self, text):
+        self.socket.send(json.dumps({"delta": text}))
+
+    def close(self, metrics, error=None):
+        if error is None:
+            self.socket.send(json.dumps({"done": True, "metrics": metrics.to_dict()}))
+        else:
+            self.socket.send(json.dumps({"error": str(error)}))
+
+
+class _SinkWorker:
+    def __init__(self, sink, max_buffer):
+        self.sink = sink
+        self.error = None
+        self._queue = queue.Queue(maxsize=max_buffer)
+        # Run in a copy of the caller's context so the sink's spans belong to the stream's trace
+        context = contextvars.copy_context()
+        self._thread = threading.Thread(target=context.run, args=(self._run,), daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            text = self._queue.get()
+            if text is _END:
+                return
+            if self.error is None:
+                try:
+                    self.sink.write(text)
+                except Exception as e:
+                    # Keep draining so a broken sink never blocks the stream for the others
+                    self.error = e
+
+    # Blocks while the queue is full, which is what slows the stream down to the pace of this sink
+    def put(self, text):
+        self._queue.put(text)
+
+    def finish(self, metrics, error):
+        self._queue.put(_END)
+        self._thread.join()
+        self.sink.close(metrics, error or self.error)
+
+
+def _replay(text, size=REPLAY_CHUNK):
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+# Start the request, pipe its deltas into the sinks and return the StreamMetrics.
+# request is called with no arguments and must return the streamed response, so the metrics include the
+# time to set up the request. Raises the stream's error, or the first sink error, after all sinks are closed.
+def stream_to(sinks, request, deltas=azure_deltas, max_buffer=STREAM_BUFFER, cache_key=None, ttl=None):
+    cache = get_cache() if cache_key else None
+    cached = cache.get(cache_key) if cache is not None else None
+    with span("model.stream", sinks=len(sinks)) as current:
+        metrics = StreamMetrics()
+        workers = [_SinkWorker(sink, max_buffer) for sink in sinks]
+        # Pieces of the text, kept only while it is going to be cached
+        pieces = [] if cache is not None and cached is None else None
+        if cache is not None:
+            current.set(cache="hit" if cached is not None else "miss")
+        error = None
+        try:
+            for text in _replay(cached["text"]) if cached is not None else deltas(request(), metrics):
+                if not text:
+                    continue
+                current.mark_first_token()
+                metrics.record(text)
+                if pieces is not None:
+                    pieces.append(text)
+                    if metrics.chars > CACHE_MAX_CHARS:
+                        pieces = None
+                for worker in workers:
+                    worker.put(text)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            metrics.finish()
+            for worker in workers:
+                worker.finish(metrics, error)
+            current.set(completion_tokens=metrics.tokens, chars=metrics.chars)
+    sink_error = next((worker.error for worker in workers if worker.error is not None), None)
+    if sink_error is not None:
+        raise sink_error
+    if pieces:
+        cache.put(cache_key, {"text": "".join(pieces)}, ttl=ttl)
+    return metrics
@@ -0,0 +1,251 @@
+import ast
+import contextvars
+import inspect
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from azure.ai.inference.models import (
+    AssistantMessage,
+    ChatCompletionsToolDefinition,
+    CompletionsFinishReason,
+    FunctionDefinition,
+    ToolMessage,
+)
+
+from tracing import span
+
+# Tools the model can call, declared once.
+# A tool is a plain function; its JSON schema (and so the ChatCompletionsToolDefinition sent to the model)
+# and the validator for the arguments the model sends back are both generated from its signature.
+# All tool calls of one model turn run concurrently, so a turn takes as long as its slowest tool, and results
+# are memoized per (tool, arguments), keeping the TOOL_MEMO_SIZE most recently used. Only tools whose
+# result depends on nothing but their arguments should be memoized.
+#
+# Environment variables:
+#   TOOL_MAX_WORKERS  threads used to run tool calls
+#   TOOL_MAX_ROUNDS   model turns allowed per request before giving up on tool calls
+#   TOOL_MEMO_SIZE    memoized results kept
+MAX_WORKERS = int(os.environ.get("TOOL_MAX_WORKERS", "8"))
+MAX_ROUNDS = int(os.environ.get("TOOL_MAX_ROUNDS", "8"))
+MEMO_SIZE = int(os.environ.get("TOOL_MEMO_SIZE", "256"))
+
+JSON_TYPES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    list: "array",
+    dict: "object",
+}
+
+
+class ToolError(Exception):
+    pass
+
+
+class Tool:
+    # param_descriptions maps parameter names to the descriptions shown to the model.
+    # memoize should be False for tools with side effects and for ones that read state that changes.
+    def __init__(self, func, name=None, description=None, param_descriptions=None, memoize=True):
+        self.func = func
+        self.name = name or func.__name__
+        self.description = description or inspect.getdoc(func) or self.name
+        self.memoize = memoize
+        self.parameters = {}
+        self.required = []
+        param_descriptions = param_descriptions or {}
+        for parameter in inspect.signature(func).parameters.values():
+            if parameter.kind in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD):
+                continue
+            annotation = parameter.annotation
+            python_type = annotation if annotation in JSON_TYPES else str
+            schema = {"type": JSON_TYPES[python_type]}
+            if parameter.name in param_descriptions:
+                schema["description"] = param_descriptions[parameter.name]
+            self.parameters[parameter.name] = (python_type, schema)
+            if parameter.default is parameter.empty:
+                self.required.append(parameter.name)
+
+    def schema(self):
+        return {
+            "type": "object",
+            "properties": {name: schema for name, (_, schema) in self.parameters.items()},
+            "required": list(self.required),
+        }
+
+    def definition(self):
+        return ChatCompletionsToolDefinition(
+            function=FunctionDefinition(name=self.name, description=self.description, parameters=self.schema())
+        )
+
+    # Parse and check the arguments of a tool call; returns keyword arguments for the function
+    def validate(self, arguments):
+        arguments = parse_arguments(arguments)
+        unknown = set(arguments) - set(self.parameters)
+        if unknown:
+            raise ToolError(f"{self.name}: unknown argument(s) {', '.join(sorted(unknown))}")
+        missing = [name for name in self.required if arguments.get(name) is None]
+        if missing:
+            raise ToolError(f"{self.name}: missing argument(s) {', '.join(missing)}")
+        return {
+            name: coerce(self.name, name, value, self.parameters[name][0])
+            for name, value in arguments.items()
+            if value is not None
+        }
+
+    def __call__(self, **arguments):
+        return self.func(**arguments)
+
+
+# Arguments arrive as a JSON object string. Some models write Python dict literals instead, which are
+# read safely with literal_eval rather than by swapping quote characters.
+def parse_arguments(arguments):
+    if arguments is None or arguments == "":
+        return {}
+    if isinstance(arguments, dict):
+        return arguments
+    try:
+        parsed = json.loads(arguments)
+    except ValueError:
+        try:
+            parsed = ast.literal_eval(arguments)
+        except (ValueError, SyntaxError):
+            raise ToolError(f"Could not parse tool arguments: {arguments!r}")
+    if not isinstance(parsed, dict):
+        raise ToolError(f"Tool arguments must be an object, got {arguments!r}")
+    return parsed
+
+
+def coerce(tool_name, name, value, python_type):
+    if python_type is bool:
+        if isinstance(value, bool):
+            return value
+        if str(value).lower() in ("true", "1", "yes"):
+            return True
+        if str(value).lower() in ("false", "0", "no"):
+            return False
+    elif python_type in (int, float):
+        if not isinstance(value, (bool, dict, list)):
+            try:
+                return python_type(value)
+            except (TypeError, ValueError):
+                pass
+    elif python_type is str:
+        if isinstance(value, (dict, list)):
+            return json.dumps(value)
+        return str(value)
+    elif isinstance(value, python_type):
+        return value
+    raise ToolError(f"{tool_name}: argument {name} should be of type {JSON_TYPES[python_type]}, got {value!r}")
+
+
+def _memo_key(name, arguments):
+    return name, json.dumps(arguments, sort_keys=True, default=str)
+
+
+class ToolRegistry:
+    def __init__(self, max_workers=MAX_WORKERS, memo_size=MEMO_SIZE):
+        self.tools = {}
+        self.memo_size = memo_size
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def register(self, func, name=None, description=None, param_descriptions=None, memoize=True):
+        tool = Tool(func, name, description, param_descriptions, memoize)
+        self.tools[tool.name] = tool
+        return tool
+
+    # Decorator form of register
+    def tool(self, name=None, description=None, param_descriptions=None, memoize=True):
+        def decorator(func):
+            self.register(func, name, description, param_descriptions, memoize)
+            return func
+        return decorator
+
+    def definitions(self):
+        return [tool.definition() for tool in self.tools.values()]
+
+    # Validate and run one tool. Identical memoized calls share one result, even while it is still running.
+    def call(self, name, arguments=None):
+        tool = self.tools.get(name)
+        if tool is None:
+            raise ToolError(f"Function '{name}' is not supported.")
+        arguments = tool.validate(arguments)
+        if not tool.memoize:
+            return tool(**arguments)
+
+        key = _memo_key(name, arguments)
+        with self._lock:
+            entry = self._memo.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._memo[key] = [threading.Event(), None, None]
+                # Least recently used first; a dropped entry still running stays with the calls waiting on it
+                while len(self._memo) > self.memo_size:
+                    self._memo.popitem(last=False)
+            else:
+                self._memo.move_to_end(key)
+        if owner:
+            try:
+                entry[1] = tool(**arguments)
+            except Exception as e:
+                entry[2] = e
+                with self._lock:
+                    # Failures are not remembered, so the next call tries again
+                    self._memo.pop(key, None)
+            finally:
+                entry[0].set()
+        else:
+            entry[0].wait()
+        if entry[2] is not None:
+            raise entry[2]
+        return entry[1]
+
+    def clear_memo(self):
+        with self._lock:
+            self._memo.clear()
+
+    def _run_tool_call(self, tool_call):
+        with span("tool", tool=tool_call.function.name):
+            try:
+                result = self.call(tool_call.function.name, tool_call.function.arguments)
+            except Exception as e:
+                result = {"error": str(e)}
+        if not isinstance(result, str):
+            result = json.dumps(result, default=str)
+        return ToolMessage(tool_call_id=tool_call.id, content=result)
+
+    # Run all tool calls of one model turn concurrently; returns ToolMessages in the order of the calls
+    def run_tool_calls(self, tool_calls):
+        if len(tool_calls) == 1:
+            return [self._run_tool_call(tool_calls[0])]
+        # Each call runs in a copy of the caller's context so its span belongs to the caller's trace
+        futures = [
+            self._executor.submit(contextvars.copy_context().run, self._run_tool_call, tool_call)
+            for tool_call in tool_calls
+        ]
+        return [future.result() for future in futures]
+
+    # Call the model, run the tools it asks for and call it again with the results, until it answers
+    # without tool calls. Tool call rounds are appended to messages. complete(messages=..., tools=..., **kwargs)
+    # defaults to client.complete.
+    def complete(self, client, messages, complete=None, max_rounds=MAX_ROUNDS, **kwargs):
+        complete = complete or client.complete
+        tools = self.definitions()
+        for round_number in range(max_rounds):
+            with span("tool.round", model=kwargs.get("model"), round=round_number) as current:
+                response = complete(messages=messages, tools=tools, **kwargs)
+                current.set_usage(response)
+            choice = response.choices[0]
+            if choice.finish_reason != CompletionsFinishReason.TOOL_CALLS or not choice.message.tool_calls:
+                return response
+            messages.append(AssistantMessage(tool_calls=choice.message.tool_calls))
+            messages.extend(self.run_tool_calls(choice.message.tool_calls))
+        raise ToolError(f"Model still requested tools after {max_rounds} rounds")
+
+    def close(self):
+        self._executor.shutdown(wait=False)
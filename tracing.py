@@ -0,0 +1,288 @@
+import atexit
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+
+# Lightweight tracing for the hot paths: model calls, time to first token, parsing, rendering and file writes.
+# Code marks a stage with
+#     with span("model.call", provider="gemini", model=name) as current:
+#         response = ...
+#         current.set_usage(response)
+# Finished spans are appended to a JSONL file, and per-stage latency histograms plus token counters are
+# written in Prometheus text format at exit (and whenever export_prometheus() is called).
+# Tracing is off unless AI_TRACE=1; span() then returns one shared no-op object, so instrumented code
+# pays a function call and nothing else.
+#
+# Environment variables:
+#   AI_TRACE=1             record spans
+#   AI_TRACE_PATH          JSONL file of finished spans (default .cache/traces.jsonl)
+#   AI_TRACE_METRICS_PATH  Prometheus text file with the histograms (default .cache/metrics.prom)
+TRACE_ENABLED = os.environ.get("AI_TRACE") == "1"
+TRACE_PATH = os.environ.get("AI_TRACE_PATH", os.path.join(".cache", "traces.jsonl"))
+METRICS_PATH = os.environ.get("AI_TRACE_METRICS_PATH", os.path.join(".cache", "metrics.prom"))
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Spans buffered in memory before they are appended to the JSONL file
+FLUSH_EVERY = 64
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+# Token usage from an Azure AI Inference, OpenAI or Gemini response (or a dict of one), or None
+def token_usage(response):
+    usage = getattr(response, "usage", None)
+    if usage is None and isinstance(response, dict):
+        usage = response.get("usage")
+    if usage is not None:
+        get = usage.get if isinstance(usage, dict) else lambda key: getattr(usage, key, None)
+        prompt, completion = get("prompt_tokens"), get("completion_tokens")
+        if prompt is not None or completion is not None:
+            return {"prompt_tokens": prompt, "completion_tokens": completion}
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is not None:
+        return {
+            "prompt_tokens": getattr(metadata, "prompt_token_count", None),
+            "completion_tokens": getattr(metadata, "candidates_token_count", None),
+        }
+    return None
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+    def set_usage(self, response):
+        pass
+
+    def mark_first_token(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "attributes", "trace_id", "span_id", "parent_id", "start_time",
+                 "first_token", "_start", "_token")
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.first_token = None
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent is not None else None
+        self.span_id = uuid.uuid4().hex[:16]
+        self.start_time = time.time()
+        self._token = _current_span.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        _current_span.reset(self._token)
+        self.tracer.record(self, duration, exc)
+        return False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def set_usage(self, response):
+        usage = token_usage(response)
+        if usage:
+            self.attributes.update({key: value for key, value in usage.items() if value is not None})
+
+    # Time to first token, for streamed responses; only the first call counts
+    def mark_first_token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self._start
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Tracer:
+    def __init__(self, path=TRACE_PATH, metrics_path=METRICS_PATH):
+        self.path = path
+        self.metrics_path = metrics_path
+        self._buffer = []
+        self._durations = {}
+        self._first_tokens = {}
+        self._tokens = {}
+        self._lock = threading.Lock()
+        for file_path in (path, metrics_path):
+            directory = os.path.dirname(file_path or "")
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def record(self, span, duration, error=None):
+        record = {
+            "name": span.name,
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "start": span.start_time,
+            "duration": duration,
+            "attributes": span.attributes,
+        }
+        if span.first_token is not None:
+            record["first_token"] = span.first_token
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {error}"
+        line = json.dumps(record, default=str)
+
+        with self._lock:
+            self._buffer.append(line)
+            self._durations.setdefault(span.name, _Histogram()).observe(duration)
+            if span.first_token is not None:
+                self._first_tokens.setdefault(span.name, _Histogram()).observe(span.first_token)
+            for kind in ("prompt_tokens", "completion_tokens"):
+                value = span.attributes.get(kind)
+                if isinstance(value, (int, float)):
+                    key = (span.name, kind)
+                    self._tokens[key] = self._tokens.get(key, 0) + value
+            flush = len(self._buffer) >= FLUSH_EVERY
+        if flush:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        if lines and self.path:
+            # A single O_APPEND write, so lines from several processes don't interleave
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, ("\n".join(lines) + "\n").encode("utf-8"))
+            finally:
+                os.close(fd)
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            for metric, help_text, histograms in (
+                ("ai_span_duration_seconds", "Duration of traced stages", self._durations),
+                ("ai_time_to_first_token_seconds", "Time to first streamed token", self._first_tokens),
+            ):
+                if not histograms:
+                    continue
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                for name, histogram in sorted(histograms.items()):
+                    label = f'span="{_label(name)}"'
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{{label},le="{bound:g}"}} {cumulative}')
+                    lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {histogram.count}')
+                    lines.append(f"{metric}_sum{{{label}}} {histogram.total}")
+                    lines.append(f"{metric}_count{{{label}}} {histogram.count}")
+            if self._tokens:
+                lines.append("# HELP ai_tokens_total Tokens reported by the APIs")
+                lines.append("# TYPE ai_tokens_total counter")
+                for (name, kind), value in sorted(self._tokens.items()):
+                    lines.append(f'ai_tokens_total{{span="{_label(name)}",kind="{kind.split("_")[0]}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    # Written atomically, so a scraper never reads a half-written file
+    def export_prometheus(self, path=None):
+        path = path or self.metrics_path
+        if not path:
+            return
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(temp_path, path)
+
+    def close(self):
+        self.flush()
+        self.export_prometheus()
+
+
+_tracer = None
+
+
+def get_tracer():
+    return _tracer
+
+
+# Turn tracing on at runtime (AI_TRACE=1 does this at import)
+def enable(path=TRACE_PATH, metrics_path=METRICS_PATH):
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(path, metrics_path)
+        atexit.register(_tracer.close)
+    return _tracer
+
+
+def span(name, **attributes):
+    if _tracer is None:
+        return NOOP_SPAN
+    return Span(_tracer, name, attributes)
+
+
+# Record a stage that was timed by hand, for code that can't hold a with block open around it
+# (a generator that yields in between, for example). duration and first_token are in seconds.
+def record(name, duration, first_token=None, **attributes):
+    if _tracer is None:
+        return
+    parent = _current_span.get()
+    finished = Span(_tracer, name, attributes)
+    finished.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+    finished.parent_id = parent.span_id if parent is not None else None
+    finished.span_id = uuid.uuid4().hex[:16]
+    finished.start_time = time.time() - duration
+    finished.first_token = first_token
+    _tracer.record(finished, duration)
+
+
+# Decorator form of span; the function is returned unchanged when tracing is off at decoration time
+def traced(name=None):
+    def decorator(func):
+        if _tracer is None:
+            return func
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+if TRACE_ENABLED:
+    enable()
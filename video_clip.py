@@ -0,0 +1,86 @@
+import os
+import shutil
+import subprocess
+
+from file_hash import file_sha256
+
+# Local trimming and transcoding of videos before they are uploaded.
+# Only the requested time window is kept and, unless the "original" profile is used, the clip is
+# re-encoded at a lower resolution, frame rate and bitrate. Outputs are cached by source hash,
+# window and profile, so the same clip is never cut twice.
+CLIP_CACHE_DIR = os.environ.get("VIDEO_CLIP_CACHE_DIR", os.path.join(".cache", "clips"))
+
+# Target encodings. "original" only cuts the window out without re-encoding.
+PROFILES = {
+    "original": None,
+    "low": {"height": 360, "fps": 10, "video_bitrate": "300k", "audio_bitrate": "48k"},
+    "medium": {"height": 720, "fps": 24, "video_bitrate": "1500k", "audio_bitrate": "96k"},
+}
+
+
+# Convert "SS", "MM:SS" or "HH:MM:SS" into seconds
+def parse_timestamp(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    seconds = 0.0
+    for part in str(value).split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def format_timestamp(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+def _ffmpeg_command(source_path, output_path, start, end, settings):
+    command = ["ffmpeg", "-y", "-loglevel", "error"]
+    if start:
+        command += ["-ss", str(start)]
+    command += ["-i", source_path]
+    if end is not None:
+        command += ["-t", str(end - (start or 0))]
+
+    if settings is None:
+        command += ["-c", "copy"]
+    else:
+        command += [
+            "-vf", f"scale=-2:'min({settings['height']},ih)',fps={settings['fps']}",
+            "-c:v", "libx264", "-preset", "veryfast",
+            "-b:v", settings["video_bitrate"], "-maxrate", settings["video_bitrate"],
+            "-bufsize", settings["video_bitrate"],
+            "-c:a", "aac", "-b:a", settings["audio_bitrate"],
+            "-movflags", "+faststart",
+        ]
+    return command + [output_path]
+
+
+# Cut source_path down to [start, end] and transcode it to the given profile.
+# Returns the path of the clip, or the source itself when ffmpeg is not installed.
+def prepare_clip(source_path, start=None, end=None, profile="low"):
+    if shutil.which("ffmpeg") is None:
+        print("ffmpeg not found, uploading the full video")
+        return source_path
+
+    start = parse_timestamp(start)
+    end = parse_timestamp(end)
+    settings = PROFILES[profile]
+    extension = os.path.splitext(source_path)[1] if settings is None else ".mp4"
+    window = f"{start or 0:g}-{end if end is not None else 'end'}"
+    output_path = os.path.join(CLIP_CACHE_DIR, f"{file_sha256(source_path)}_{window}_{profile}{extension}")
+    if os.path.exists(output_path):
+        return output_path
+
+    os.makedirs(CLIP_CACHE_DIR, exist_ok=True)
+    root, extension = os.path.splitext(output_path)
+    temp_path = f"{root}.{os.getpid()}.tmp{extension}"
+    try:
+        subprocess.run(_ffmpeg_command(source_path, temp_path, start, end, settings), check=True)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return output_path
@@ -1,42 +1,149 @@
+import glob
+import random
+import re
+import sys
 import time
 import os
+from urllib.parse import parse_qs, urlparse
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import google.generativeai as genai
 import yt_dlp
+from clients import configure_gemini, get_gemini_model
+from gemini_uploads import upload_file_cached
+from video_clip import format_timestamp, parse_timestamp, prepare_clip
 
 # Load environment variables from the .env file
 load_dotenv()
 
 # Configure the GenAI API with the API key from the .env file
-genai.configure(api_key=os.environ["API_KEY"])
-
-# Download the video from video using yt-dlp
-video_url = "https://youtu.be/r773-Cv8mK4?si=179a5EY-UpM1IxcX"
-output_path = "media/Downloaded_Video.mp4"
-
-# Specify yt-dlp options
-ydl_opts = {
-    'format': 'best',  # Get the highest quality available
-    'outtmpl': output_path,  # Save the file to the specified path
-}
-
-# Download the video
-with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-    ydl.download([video_url])
-
-print(f"Video downloaded at: {output_path}")
-
-# Upload the file using GenAI
-myfile = genai.upload_file(output_path)
-print(f"{myfile=}")
-
-# Videos need to be processed before you can use them.
-while myfile.state.name == "PROCESSING":
-    print("processing video...")
-    time.sleep(15)
-    myfile = genai.get_file(myfile.name)
-
-# Generate content using GenAI to describe the video clip
-model = genai.GenerativeModel("gemini-1.5-pro")
-result = model.generate_content([myfile, "Describe this video clip shown between 0:00 and 0:10."])
-print(f"{result.text=}")
\ No newline at end of file
+configure_gemini()
+
+# Videos are downloaded into this directory, named after their video id
+media_dir = "media"
+
+# Video used when no URLs are given on the command line
+default_video_url = "https://youtu.be/r773-Cv8mK4?si=179a5EY-UpM1IxcX"
+prompt = "Describe this video clip shown between {start} and {end}."
+
+# Only this part of each video is uploaded, transcoded to the given profile (see video_clip.PROFILES)
+clip_start = "0:00"
+clip_end = "0:10"
+clip_profile = os.environ.get("VIDEO_CLIP_PROFILE", "low")
+
+# Number of videos handled at the same time in each stage of the pipeline
+download_workers = int(os.environ.get("VIDEO_DOWNLOAD_WORKERS", "2"))
+upload_workers = int(os.environ.get("VIDEO_UPLOAD_WORKERS", "2"))
+process_workers = int(os.environ.get("VIDEO_PROCESS_WORKERS", "4"))
+
+# Polling schedule while the service processes an upload: start short, double up to the cap
+poll_initial_delay = 1.0
+poll_max_delay = 30.0
+
+# Function to read the video id from a YouTube URL without a network call; None for other URLs
+def video_id(video_url):
+    parsed = urlparse(video_url)
+    host = (parsed.hostname or "").lower()
+    if host == "youtu.be" or host.endswith(".youtu.be"):
+        candidate = parsed.path.lstrip("/").split("/")[0]
+    elif host == "youtube.com" or host.endswith(".youtube.com"):
+        candidate = parse_qs(parsed.query).get("v", [""])[0]
+        if not candidate:
+            match = re.match(r"^/(?:shorts|embed|live|v)/([^/?#]+)", parsed.path)
+            candidate = match.group(1) if match else ""
+    else:
+        return None
+    return candidate if re.fullmatch(r"[\w-]{11}", candidate) else None
+
+# Function to find an earlier download of a video in media/, ignoring unfinished ones
+def find_download(video_id):
+    for path in sorted(glob.glob(os.path.join(glob.escape(media_dir), glob.escape(video_id) + ".*"))):
+        if not path.endswith((".part", ".ytdl")):
+            return path
+    return None
+
+# Function to download a video with yt-dlp, skipping it when the file is already in media/.
+# For YouTube URLs the id is read from the URL, so an existing download is found without asking YouTube.
+def download_video(video_url):
+    known_id = video_id(video_url)
+    existing = find_download(known_id) if known_id else None
+    if existing:
+        print(f"Video already downloaded at: {existing}")
+        return existing
+
+    # Specify yt-dlp options
+    ydl_opts = {
+        'format': 'best',  # Get the highest quality available
+        'outtmpl': os.path.join(media_dir, '%(id)s.%(ext)s'),  # Save the file under its video id
+    }
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(video_url, download=False)
+        output_path = ydl.prepare_filename(info)
+        if os.path.exists(output_path):
+            print(f"Video already downloaded at: {output_path}")
+            return output_path
+        ydl.process_ie_result(info, download=True)
+
+    print(f"Video downloaded at: {output_path}")
+    return output_path
+
+# Function to wait until an uploaded video has been processed.
+# Uses exponential backoff with jitter so short clips are picked up quickly and long ones aren't polled constantly.
+def wait_for_processing(myfile):
+    delay = poll_initial_delay
+    while myfile.state.name == "PROCESSING":
+        print(f"processing video {myfile.name}...")
+        time.sleep(random.uniform(delay / 2, delay))
+        delay = min(delay * 2, poll_max_delay)
+        myfile = genai.get_file(myfile.name)
+    return myfile
+
+# Pipeline stages. Each one waits for the previous stage of the same video, which runs in its own pool,
+# so video B downloads while A uploads and C is being processed.
+def upload_stage(download_future):
+    # Cut the requested window out locally and shrink it so far fewer bytes are uploaded and processed
+    video_path = download_future.result()
+    clip_path = prepare_clip(video_path, clip_start, clip_end, clip_profile)
+
+    # Upload the file using GenAI (skipped when the same video was uploaded recently)
+    myfile = upload_file_cached(clip_path)
+    print(f"{myfile=}")
+    return myfile, clip_path != video_path
+
+def describe_stage(upload_future):
+    # Videos need to be processed before you can use them.
+    myfile, trimmed = upload_future.result()
+    myfile = wait_for_processing(myfile)
+    if myfile.state.name == "FAILED":
+        raise RuntimeError(f"Processing failed for {myfile.name}")
+
+    # Generate content using GenAI to describe the video clip
+    model = get_gemini_model("gemini-1.5-pro")
+    if trimmed:
+        # The clip starts at the beginning of the requested window
+        window = (format_timestamp(0), format_timestamp(parse_timestamp(clip_end) - parse_timestamp(clip_start)))
+    else:
+        window = (clip_start, clip_end)
+    result = model.generate_content([myfile, prompt.format(start=window[0], end=window[1])])
+    return result.text
+
+# Function to summarize several videos with the download, upload and processing stages overlapped
+def summarize_videos(video_urls):
+    with ThreadPoolExecutor(max_workers=download_workers) as download_pool, \
+            ThreadPoolExecutor(max_workers=upload_workers) as upload_pool, \
+            ThreadPoolExecutor(max_workers=process_workers) as process_pool:
+        downloads = [download_pool.submit(download_video, url) for url in video_urls]
+        uploads = [upload_pool.submit(upload_stage, future) for future in downloads]
+        results = [process_pool.submit(describe_stage, future) for future in uploads]
+
+        # Report results in the order the URLs were given
+        for video_url, future in zip(video_urls, results):
+            try:
+                print(f"{video_url}\n{future.result()}\n")
+            except Exception as e:
+                print(f"{video_url}\nAn error occurred: {e}\n")
+
+# Main execution: video URLs can be passed on the command line
+if __name__ == "__main__":
+    summarize_videos(sys.argv[1:] or [default_video_url])
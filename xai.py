@@ -1,26 +1,59 @@
 import os
-from flask import Flask, render_template, request, jsonify
-from openai import OpenAI
-import dotenv
-import markdown2
+import threading
+import time
+from flask import Flask, Response, redirect, render_template, request, jsonify, session, stream_with_context
 import flask_cors
 from flask_cors import CORS
+from chat_sessions import SessionStore, summary_prompt
+from clients import XAI_BASE_URL, get_openai_client
+from grok_chat import MODEL_NAME, STREAM_RENDER_INTERVAL, SYSTEM_PROMPT, XAI_API_KEY, sse_event
+from markdown_render import IncrementalMarkdownRenderer, render_markdown
+from model_router import get_router
+from rate_limiter import BATCH_PRIORITY, INTERACTIVE_PRIORITY, run_rate_limited
+from response_cache import cached_chat_create
+from tracing import record, span
 
-# Load environment variables
-dotenv.load_dotenv()
-
-XAI_API_KEY = os.getenv("XAI_API_KEY")
-
-# Initialize OpenAI client
-client = OpenAI(
-    api_key=XAI_API_KEY,
-    base_url="https://api.x.ai/v1",
-)
+# Shared OpenAI client with a keep-alive connection pool, reused by every request
+client = get_openai_client(XAI_BASE_URL, api_key=XAI_API_KEY)
 
 # Flask app
 app = Flask(__name__)
+app.secret_key = os.getenv("FLASK_SECRET_KEY") or os.urandom(24)
 CORS(app)
 
+# Conversation history lives on the server; the browser only keeps the session id in its cookie
+chat_sessions = SessionStore()
+
+def current_chat():
+    if "chat_id" not in session:
+        session["chat_id"] = SessionStore.new_session_id()
+    return chat_sessions.get(session["chat_id"])
+
+# Fold the oldest turns of a conversation into its summary once they outgrow the context budget.
+# Runs in the background so the user never waits for it.
+def compact_history(chat, turns):
+    try:
+        with span("chat.summary", model=MODEL_NAME):
+            completion = cached_chat_create(
+                client,
+                bypass=True,
+                priority=BATCH_PRIORITY,
+                model=MODEL_NAME,
+                messages=summary_prompt(chat.summary, turns),
+            )
+        chat.apply_summary(completion.choices[0].message.content, turns)
+    except Exception as e:
+        print(f"Could not summarize conversation {chat.session_id}: {e}")
+    finally:
+        chat.end_compaction()
+
+def record_turn(chat, user_message, response_message):
+    chat.add_turn(user_message, response_message)
+    # At most one compaction per session runs at a time (turns_to_compact returns [] while one is running)
+    turns = chat.turns_to_compact()
+    if turns:
+        threading.Thread(target=compact_history, args=(chat, turns), daemon=True).start()
+
 @app.route("/", methods=["GET", "POST"])
 def index():
     response_message = ""
@@ -29,23 +62,93 @@ def index():
     if request.method == "POST":
         user_message = request.form.get("message")
         if user_message:
-            # Call the OpenAI API
-            completion = client.chat.completions.create(
-                model="grok-beta",
-                messages=[
-                    {"role": "system", "content": "You are Grok, One of the best AI assistants in the world."},
-                    {"role": "user", "content": user_message},
-                ],
+            chat = current_chat()
+            messages = chat.build_messages(SYSTEM_PROMPT, user_message)
+            # Call the OpenAI API on the fastest model of MODEL_NAME's class, hedged past its p95 latency.
+            # Chat answers are sampled at Grok's default temperature, so they are never served from the cache.
+            completion = get_router(MODEL_NAME).call(
+                lambda model: cached_chat_create(client, bypass=True, priority=INTERACTIVE_PRIORITY, model=model, messages=messages),
+                hedge=True,
             )
             response_message = completion.choices[0].message.content
+            record_turn(chat, user_message, response_message)
 
 
     return render_template(
         "index.html",
         user_message=user_message,
-        response_message=markdown2.markdown(response_message, extras=["fenced-code-blocks", "tables"]),
+        response_message=render_markdown(response_message),
     )
 
+# Streaming variant of the form POST: tokens are pushed to the browser as Server-Sent Events.
+# "token" events carry the new text, the html of any blocks that just became final ("append") and,
+# at most every STREAM_RENDER_INTERVAL, the html of the unfinished last block ("tail").
+# A final "done" event carries the fully rendered answer.
+@app.route("/stream", methods=["POST"])
+def stream():
+    user_message = request.form.get("message") or (request.get_json(silent=True) or {}).get("message")
+    if not user_message:
+        return jsonify({"error": "message is required"}), 400
+    chat = current_chat()
+
+    def generate():
+        renderer = IncrementalMarkdownRenderer()
+        last_render = 0.0
+        # Timed by hand: a span can't stay open across the yields of this generator
+        started = time.perf_counter()
+        first_token = None
+        model = MODEL_NAME
+        try:
+            messages = chat.build_messages(SYSTEM_PROMPT, user_message)
+            # Routed and hedged on time to first chunk; a losing stream is closed
+            model, chunks = get_router(MODEL_NAME, "stream").stream(
+                lambda model: run_rate_limited(
+                    "openai",
+                    model,
+                    lambda: client.chat.completions.create(model=model, messages=messages, stream=True),
+                    priority=INTERACTIVE_PRIORITY,
+                ),
+                hedge=True,
+            )
+            for chunk in chunks:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                data = {"delta": delta}
+                finished = renderer.feed(delta)
+                if finished:
+                    data["append"] = finished
+                now = time.monotonic()
+                if finished or now - last_render >= STREAM_RENDER_INTERVAL:
+                    data["tail"] = renderer.tail_html()
+                    last_render = now
+                yield sse_event("token", data)
+        except Exception as e:
+            record("model.stream", time.perf_counter() - started, first_token, provider="openai", model=model,
+                   error=str(e))
+            yield sse_event("error", {"error": str(e)})
+            return
+        record("model.stream", time.perf_counter() - started, first_token, provider="openai", model=model,
+               chars=len(renderer.text))
+        record_turn(chat, user_message, renderer.text)
+        yield sse_event("done", {"html": renderer.html()})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Start a new conversation
+@app.route("/reset", methods=["POST"])
+def reset():
+    chat_id = session.pop("chat_id", None)
+    if chat_id:
+        chat_sessions.reset(chat_id)
+    return redirect("/")
+
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,171 @@
+import os
+import asyncio
+import httpx
+from openai import AsyncOpenAI
+from quart import Quart, Response, redirect, render_template, request, jsonify, session
+from quart_cors import cors
+from rate_limiter import BATCH_PRIORITY, INTERACTIVE_PRIORITY, run_rate_limited_async
+from response_cache import cached_chat_create_async
+from markdown_render import IncrementalMarkdownRenderer, render_markdown
+from chat_sessions import SessionStore, summary_prompt
+from clients import XAI_BASE_URL
+from grok_chat import MODEL_NAME, STREAM_RENDER_INTERVAL, SYSTEM_PROMPT, XAI_API_KEY, sse_event
+
+# Async (ASGI) serving mode for the Grok chatbot.
+# Same routes, form handling and template as xai.py, but built on Quart and AsyncOpenAI so a single
+# process can keep hundreds of Grok requests in flight. Run it with an ASGI server, e.g.
+#   hypercorn xai_async:app
+# or simply `python xai_async.py`.
+
+# Maximum number of requests sent to the xAI API at the same time; further requests wait their turn
+MAX_UPSTREAM_CONCURRENCY = int(os.environ.get("XAI_MAX_CONCURRENCY", "64"))
+
+app = cors(Quart(__name__))
+app.secret_key = os.getenv("FLASK_SECRET_KEY") or os.urandom(24)
+
+# Conversation history lives on the server; the browser only keeps the session id in its cookie
+chat_sessions = SessionStore()
+# Background summarization tasks, referenced here so they are not garbage collected while running
+compaction_tasks = set()
+
+# The client and semaphore belong to the serving event loop, so they are created when serving starts
+client = None
+upstream_slots = None
+
+@app.before_serving
+async def start_client():
+    global client, upstream_slots
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=MAX_UPSTREAM_CONCURRENCY,
+            max_keepalive_connections=MAX_UPSTREAM_CONCURRENCY,
+        ),
+    )
+    client = AsyncOpenAI(api_key=XAI_API_KEY, base_url=XAI_BASE_URL, http_client=http_client)
+    upstream_slots = asyncio.Semaphore(MAX_UPSTREAM_CONCURRENCY)
+
+@app.after_serving
+async def close_client():
+    await client.close()
+
+def current_chat():
+    if "chat_id" not in session:
+        session["chat_id"] = SessionStore.new_session_id()
+    return chat_sessions.get(session["chat_id"])
+
+# Fold the oldest turns of a conversation into its summary once they outgrow the context budget
+async def compact_history(chat, turns):
+    try:
+        async with upstream_slots:
+            completion = await cached_chat_create_async(
+                client,
+                bypass=True,
+                priority=BATCH_PRIORITY,
+                model=MODEL_NAME,
+                messages=summary_prompt(chat.summary, turns),
+            )
+        chat.apply_summary(completion.choices[0].message.content, turns)
+    except Exception as e:
+        print(f"Could not summarize conversation {chat.session_id}: {e}")
+    finally:
+        chat.end_compaction()
+
+def record_turn(chat, user_message, response_message):
+    chat.add_turn(user_message, response_message)
+    # At most one compaction per session runs at a time (turns_to_compact returns [] while one is running)
+    turns = chat.turns_to_compact()
+    if not turns:
+        return
+    task = asyncio.create_task(compact_history(chat, turns))
+    compaction_tasks.add(task)
+    task.add_done_callback(compaction_tasks.discard)
+
+@app.route("/", methods=["GET", "POST"])
+async def index():
+    response_message = ""
+    user_message = ""
+
+    if request.method == "POST":
+        user_message = (await request.form).get("message")
+        if user_message:
+            chat = current_chat()
+            # Call the OpenAI API. Chat answers are sampled at Grok's default temperature, so they are never
+            # served from the cache.
+            async with upstream_slots:
+                completion = await cached_chat_create_async(
+                    client,
+                    bypass=True,
+                    priority=INTERACTIVE_PRIORITY,
+                    model=MODEL_NAME,
+                    messages=chat.build_messages(SYSTEM_PROMPT, user_message),
+                )
+            response_message = completion.choices[0].message.content
+            record_turn(chat, user_message, response_message)
+
+    return await render_template(
+        "index.html",
+        user_message=user_message,
+        response_message=await asyncio.to_thread(render_markdown, response_message),
+    )
+
+@app.route("/stream", methods=["POST"])
+async def stream():
+    user_message = (await request.form).get("message") or ((await request.get_json(silent=True)) or {}).get("message")
+    if not user_message:
+        return jsonify({"error": "message is required"}), 400
+    chat = current_chat()
+
+    async def generate():
+        renderer = IncrementalMarkdownRenderer()
+        last_render = 0.0
+        loop = asyncio.get_running_loop()
+        try:
+            async with upstream_slots:
+                messages = chat.build_messages(SYSTEM_PROMPT, user_message)
+                chunks = await run_rate_limited_async(
+                    "openai",
+                    MODEL_NAME,
+                    lambda: client.chat.completions.create(model=MODEL_NAME, messages=messages, stream=True),
+                    priority=INTERACTIVE_PRIORITY,
+                )
+                async for chunk in chunks:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if not delta:
+                        continue
+                    data = {"delta": delta}
+                    finished = renderer.feed(delta)
+                    if finished:
+                        data["append"] = finished
+                    now = loop.time()
+                    if finished or now - last_render >= STREAM_RENDER_INTERVAL:
+                        data["tail"] = renderer.tail_html()
+                        last_render = now
+                    yield sse_event("token", data)
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+            return
+        record_turn(chat, user_message, renderer.text)
+        yield sse_event("done", {"html": await asyncio.to_thread(renderer.html)})
+
+    response = Response(generate(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.timeout = None
+    return response
+
+# Start a new conversation
+@app.route("/reset", methods=["POST"])
+async def reset():
+    chat_id = session.pop("chat_id", None)
+    if chat_id:
+        chat_sessions.reset(chat_id)
+    return redirect("/")
+
+
+if __name__ == "__main__":
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [os.environ.get("XAI_BIND", "127.0.0.1:5000")]
+    asyncio.run(serve(app, config))